@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Move analysis for the hint panel: a value for every choice the player has.
+
+With a piece in hand every empty cell is scored by the best move that places the
+piece there. With a piece to give every remaining piece is scored by what handing
+it over leaves the opponent. Values are from the point of view of the player
+choosing, and once the search has proven them they read as a win, draw or loss.
+
+All the choices are deepened one depth at a time, like AIPlayer.ponder, so each
+gets a rough value at once and better ones the longer the position stays on the
+board. Results are kept per position, so coming back to a position, or the display
+asking again, never searches anything twice.
+
+Usage:
+    python analysis.py --position "SCB0 A1 LCRX" --time 5
+"""
+import argparse
+import collections
+import threading
+
+import bitboard
+import engine
+import perft
+import search
+
+ANALYSIS_TABLE_SIZE = 1 << 18  # Transposition table slots of the analyzer's own searcher
+ANALYSIS_CACHE_SIZE = 256  # Positions whose values are kept
+
+
+def outcome(value):
+    """"win", "draw" or "loss" once a (depth, score, proven) value is proven, otherwise None."""
+    _, score, proven = value
+    if score > search.MATE_BOUND:
+        return "win"
+    if score < -search.MATE_BOUND:
+        return "loss"
+    return "draw" if proven else None
+
+
+def describe(value):
+    """Short label for a value: W3 for a win 3 placements from now, L2 for a loss, D for a draw, else the search depth."""
+    depth, score, _ = value
+    result = outcome(value)
+    if result == "draw":
+        return "D"
+    if result is not None:
+        return f"{result[0].upper()}{search.WIN_SCORE - abs(score) + 1}"
+    return f"{score:+d}" if score else f"d{depth}"
+
+
+class PositionAnalysis:
+    """
+    Values of every choice in one position.
+
+    Attributes:
+    giving : bool
+        True if the choice is which piece to give, False if it is where to place the piece in hand.
+    values : dict
+        Cell (placing) or piece code (giving) -> (depth, score, proven). The score is for the
+        player choosing, see outcome() and describe(). Replaced with a new dict on every change,
+        never modified in place, so other threads can iterate it while the analysis runs.
+    depth : int
+        Depth every choice has been searched to.
+    complete : bool
+        True once every value is proven and there is nothing left to search.
+    version : int
+        Goes up whenever a value changes, so a display can tell when to redraw.
+    nodes : int
+        Nodes searched for it so far.
+    """
+
+    def __init__(self, giving):
+        self.giving = giving
+        self.values = {}
+        self.depth = 0
+        self.complete = False
+        self.version = 0
+        self.nodes = 0
+        self._known = {}  # Choice -> (depth, move) of its last search, to deepen from
+
+    def best(self):
+        """The (choice, value) with the highest score, None before anything was searched."""
+        if not self.values:
+            return None
+        return max(self.values.items(), key=lambda item: item[1][1])
+
+
+class Analyzer:
+    """
+    Scores every choice in the positions it is given and keeps the results.
+
+    Parameters
+    ----------
+    table_size : int
+        Slots in the analyzer's transposition table. It has its own so it never disturbs the AI's search.
+    cache_size : int
+        Positions kept. The one analyzed longest ago is dropped first.
+    """
+
+    def __init__(self, table_size=ANALYSIS_TABLE_SIZE, cache_size=ANALYSIS_CACHE_SIZE):
+        self.searcher = search.Searcher(search.TranspositionTable(table_size), symmetry_plies=engine.AI_SYMMETRY_PLIES)
+        self.cache_size = cache_size
+        self.positions = collections.OrderedDict()  # Zobrist key -> PositionAnalysis
+        self._lock = threading.Lock()
+
+    def lookup(self, state):
+        """
+        The PositionAnalysis of the choice in front of the player, made empty the first time. None
+        once the game is over. Only reads the cache, so a display may call it as often as it likes.
+        """
+        if state.is_over:
+            return None
+        key = search.zobrist_key(state.board, state.hand)
+        with self._lock:
+            entry = self.positions.get(key)
+            if entry is None:
+                entry = self.positions[key] = PositionAnalysis(state.hand == state.variant.no_piece)
+                if len(self.positions) > self.cache_size:
+                    self.positions.popitem(last=False)
+            else:
+                self.positions.move_to_end(key)
+        return entry
+
+    def analyze(self, state, stop):
+        """
+        Deepens the values of every choice in the position until `stop` is set or all are proven.
+
+        Parameters
+        ----------
+        state : engine.GameState
+            Position to analyze. Not modified.
+        stop : threading.Event
+            Set from another thread to end the analysis. What was found so far is kept.
+
+        Returns
+        -------
+        PositionAnalysis
+            The cached analysis, None if the game is over.
+        """
+        entry = self.lookup(state)
+        if entry is None or entry.complete:
+            return entry
+        board = state.board
+        empties = len(board.empty_cells())
+        if entry.giving:
+            # Handing over a piece leaves the opponent to place it, so its value is minus theirs
+            choices = [(code, state.remaining & ~(1 << code), code, None) for code in state.legal_gives()]
+        else:
+            choices = [(cell, state.remaining, state.hand, [cell]) for cell in board.empty_cells()]
+
+        searcher = self.searcher
+        for depth in range(entry.depth + 1, empties + 1):
+            searcher.max_depth = depth
+            for choice, remaining, hand, cells in choices:
+                value = entry.values.get(choice)
+                if value is not None and (value[2] or value[0] >= depth):
+                    continue
+                move = searcher.search(board, remaining, hand, stop, entry._known.get(choice), cells)
+                if stop.is_set() or move is None:
+                    return entry
+                score = -move[0] if entry.giving else move[0]
+                proven = abs(score) > search.MATE_BOUND or searcher.depth_reached >= empties
+                entry._known[choice] = (searcher.depth_reached, move)
+                values = dict(entry.values)
+                values[choice] = (searcher.depth_reached, score, proven)
+                with self._lock:
+                    entry.nodes += searcher.nodes
+                    entry.values = values
+                    entry.version += 1
+            entry.depth = depth
+            if all(value[2] for value in entry.values.values()):
+                break
+        entry.complete = True
+        entry.version += 1
+        return entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every choice in a Quarto position.")
+    parser.add_argument("--position", default="", help='moves so far as piece ids and cell labels, ie. "SCB0 A1 LCRX"')
+    parser.add_argument("--time", type=float, default=5.0, help="seconds to analyze for")
+    args = parser.parse_args()
+
+    state = perft.parse_position(args.position)
+    if state.is_over:
+        parser.error("the game is already over")
+    analyzer = Analyzer()
+    stop = threading.Event()
+    timer = threading.Timer(args.time, stop.set)
+    timer.start()
+    entry = analyzer.analyze(state, stop)
+    timer.cancel()
+
+    label = bitboard.id_from_code if entry.giving else bitboard.label_from_cell
+    print(f"{'give' if entry.giving else 'place'}: depth {entry.depth}{' (complete)' if entry.complete else ''}, "
+          f"{entry.nodes} nodes")
+    for choice, value in sorted(entry.values.items(), key=lambda item: -item[1][1]):
+        print(f"{label(choice)}: {describe(value)} (score {value[1]}, depth {value[0]})")
+
+
+if __name__ == "__main__":
+    main()
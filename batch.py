@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy batch versions of the rule checks for evaluating many boards at once.
+
+Boards are an (N, 16) integer array of piece codes in cell order, with EMPTY (-1)
+for free cells, the same layout as bitboard.Board.cells. All 10 lines of every
+board are gathered with one fancy index and reduced with bitwise AND, so there is
+no Python loop per board. Requires numpy.
+"""
+import numpy as np
+
+import bitboard
+
+EMPTY = bitboard.EMPTY
+ATTRIBUTE_MASK = bitboard.PIECES - 1
+
+# LINE_CELLS[line] lists the 4 cells of each line in bitboard.LINES order
+LINE_CELLS = np.array(
+    [[cell for cell in range(bitboard.CELLS) if line >> cell & 1] for line in bitboard.LINES], dtype=np.intp
+)
+PIECE_CODES = np.arange(bitboard.PIECES, dtype=np.int16)
+
+
+def boards_to_array(boards):
+    """Stacks bitboard.Board objects into an (N, 16) int8 array."""
+    return np.array([board.cells for board in boards], dtype=np.int8).reshape(-1, bitboard.CELLS)
+
+
+def _gather_lines(boards):
+    """Returns the (N, 10, 4) piece codes of every line and a mask of which of them are filled."""
+    boards = np.asarray(boards)
+    if boards.ndim != 2 or boards.shape[1] != bitboard.CELLS:
+        raise ValueError(f"Boards must be an (N, {bitboard.CELLS}) array. Got shape {boards.shape}")
+    lines = boards[:, LINE_CELLS].astype(np.int16)
+    return lines, lines != EMPTY
+
+
+def _shared_attributes(lines, filled):
+    """
+    Bitmask per line of the attributes every filled piece has set (ones) and every filled piece has clear (zeros).
+    Empty cells don't constrain either mask.
+    """
+    ones = np.bitwise_and.reduce(np.where(filled, lines, ATTRIBUTE_MASK), axis=2)
+    zeros = np.bitwise_and.reduce(np.where(filled, ~lines & ATTRIBUTE_MASK, ATTRIBUTE_MASK), axis=2)
+    return ones, zeros
+
+
+def win_flags(boards, return_details=False):
+    """
+    Checks a batch of boards for a winning line.
+
+    Parameters
+    ----------
+    boards : array
+        (N, 16) piece codes, EMPTY for free cells.
+    return_details : bool
+        Also return which line and attribute won.
+
+    Returns
+    -------
+    array or tuple
+        (N,) bool win flags. With return_details, also (N,) line indices into bitboard.LINES
+        and (N,) attribute indices, both -1 where there is no win. When a board has several
+        wins the first line and lowest attribute are reported, the same one bitboard.find_win returns.
+    """
+    lines, filled = _gather_lines(boards)
+    ones, zeros = _shared_attributes(lines, filled)
+    shared = np.where(filled.all(axis=2), ones | zeros, 0)  # (N, 10)
+    won = (shared != 0).any(axis=1)
+    if not return_details:
+        return won
+
+    line = np.where(won, np.argmax(shared != 0, axis=1), -1)
+    winning_shared = shared[np.arange(len(shared)), np.maximum(line, 0)]
+    lowest_bit = winning_shared & -winning_shared
+    attribute = np.where(won, np.log2(np.maximum(lowest_bit, 1)).astype(np.intp), -1)
+    return won, line, attribute
+
+
+def unsafe_pieces(boards, remaining=None):
+    """
+    Finds, for every board, the pieces that would let the next player win immediately.
+
+    This is the batch version of the check in engine.ai_select_token: a piece is unsafe if it
+    completes a line somewhere on the board.
+
+    Parameters
+    ----------
+    boards : array
+        (N, 16) piece codes, EMPTY for free cells.
+    remaining : array
+        Optional (N, 16) bool array of the pieces that can still be given. Defaults to every
+        piece that is not on the board.
+
+    Returns
+    -------
+    array
+        (N, 16) bool array, True for the remaining pieces that are unsafe to give.
+    """
+    lines, filled = _gather_lines(boards)
+    ones, zeros = _shared_attributes(lines, filled)
+    three_filled = filled.sum(axis=2) == 3  # (N, 10), only these lines can be completed
+    # A piece completes a line if it matches one of the shared attributes
+    completes = ((PIECE_CODES & ones[..., None]) | (~PIECE_CODES & zeros[..., None])) & ATTRIBUTE_MASK
+    unsafe = ((completes != 0) & three_filled[..., None]).any(axis=1)  # (N, 16)
+
+    if remaining is None:
+        boards = np.asarray(boards)
+        remaining = ~(boards[:, :, None] == PIECE_CODES).any(axis=1)
+    return unsafe & remaining
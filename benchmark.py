@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the rules, AI, self-play and UI event handlers.
+
+Every workload is built from a fixed seed, so two runs on the same code do the
+same work. Each one is timed several times and the fastest run is kept. Results
+are written as JSON and can be compared against an earlier file to catch
+regressions.
+
+The *_4x4x4 to *_6x6x6 benchmarks run the rules and search on bigger variants
+(bitboard.Variant), to show how the costs grow with the board.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --compare bench.json --tolerance 0.15
+    python benchmark.py search_4x4x4 search_5x5x5 search_6x6x6
+"""
+import argparse
+import contextlib
+import functools
+import gc
+import io
+import json
+import platform
+import random
+import sys
+import time
+
+import bitboard
+import engine
+import search
+import tokens
+import tournament
+
+
+def random_states(count, rng, min_plies=2, max_plies=12, variant=bitboard.STANDARD):
+    """Game states part way through a game of random play, each with a piece in hand."""
+    states = []
+    while len(states) < count:
+        state = engine.GameState(variant=variant)
+        players = (engine.RandomPlayer(rng), engine.RandomPlayer(rng))
+        plies = rng.randint(min_plies, max_plies)
+        while len(state.history) < plies and not state.is_over:
+            state.give(rng.choice(state.legal_gives()))
+            state.place(players[state.turn].choose_move(state)[1])
+        if not state.is_over and state.remaining:
+            state.give(rng.choice(state.legal_gives()))
+            states.append(state)
+    return states
+
+
+def random_boards(count, rng, variant=bitboard.STANDARD):
+    """Boards with anything from no pieces to a full board of random pieces, some of them won."""
+    boards = []
+    for _ in range(count):
+        board = bitboard.Board(variant)
+        filled = rng.randint(0, variant.cells)
+        for cell, code in zip(rng.sample(range(variant.cells), filled), rng.sample(range(variant.pieces), filled)):
+            board.place(cell, code)
+        boards.append(board)
+    return boards
+
+
+def bench_check_win(rng, scale):
+    boards = random_boards(20000 * scale, rng)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):  # It prints every win it finds
+            for board in boards:
+                engine.check_win_in_any_position(board)
+        return len(boards)
+    return run, "boards"
+
+
+def bench_ai_select_token(rng, scale):
+    states = random_states(5000 * scale, rng)
+    for state in states:  # ai_select_token picks for the next player, so nothing may be in hand
+        state.remaining |= 1 << state.hand
+        state.hand = search.NO_PIECE
+    choice_rng = random.Random(0)
+
+    def run():
+        for state in states:
+            engine.ai_select_token(state, choice_rng)
+        return len(states)
+    return run, "selections"
+
+
+def bench_self_play(rng, scale):
+    seed = rng.getrandbits(32)
+    games = 20 * scale
+
+    def run():
+        # No book or tablebase files, so the result doesn't depend on what is in the working directory
+        players = [engine.AIPlayer(time_limit=None, max_nodes=500), engine.SafePlayer()]
+        for index in range(games):
+            order = players if index % 2 == 0 else players[::-1]
+            tournament.play_game(order, random.Random(seed + index))
+        return games
+    return run, "games"
+
+
+def bench_search(rng, scale):
+    positions = [(state.board, state.remaining, state.hand) for state in random_states(20 * scale, rng, 4, 8)]
+    nodes = 0
+
+    def run():
+        nonlocal nodes
+        nodes = 0
+        for board, remaining, hand in positions:
+            searcher = search.Searcher(search.TranspositionTable(1 << 16), max_depth=3)
+            searcher.search(board.copy(), remaining, hand)
+            nodes += searcher.nodes
+        return nodes
+    return run, "nodes"
+
+
+def bench_variant_tables(rng, scale, variant):
+    """Building the line, weight and threat tables of a variant, which happens once at startup."""
+    count = 5 * scale
+
+    def run():
+        for _ in range(count):
+            bitboard.Variant(variant.size, variant.attributes, variant.diagonals, variant.squares)
+        return count
+    return run, "variants"
+
+
+def bench_variant_win_check(rng, scale, variant):
+    """A full win check and the winning pieces of random boards of the variant."""
+    boards = random_boards(5000 * scale, rng, variant)
+
+    def run():
+        for board in boards:
+            bitboard.find_win(board)
+            bitboard.winning_pieces(board)
+        return len(boards)
+    return run, "boards"
+
+
+def bench_variant_search(rng, scale, variant):
+    """Depth 2 searches from early positions of the variant. The node count shows how the tree grows with the board."""
+    positions = [(state.board, state.remaining, state.hand)
+                 for state in random_states(5 * scale, rng, variant.cells // 4, variant.cells // 3, variant)]
+    nodes = 0
+
+    def run():
+        nonlocal nodes
+        nodes = 0
+        for board, remaining, hand in positions:
+            searcher = search.Searcher(search.TranspositionTable(1 << 16), max_depth=2)
+            searcher.search(board.copy(), remaining, hand)
+            nodes += searcher.nodes
+        return nodes
+    return run, "nodes"
+
+
+# Variants the scaling benchmarks run on, from the standard game up
+SCALING_VARIANTS = (bitboard.STANDARD, bitboard.get_variant(4, 4, squares=True), bitboard.get_variant(5, 5),
+                    bitboard.get_variant(6, 6))
+
+
+class HeadlessCanvas:
+    """Stands in for tk.Canvas. Keeps item coordinates and options and counts the calls made."""
+
+    def __init__(self):
+        self.items = {}
+        self.tags = {}
+        self.calls = 0
+        self._next_id = 1
+
+    def _create(self, *coords, tags=None, **options):
+        self.calls += 1
+        item = self._next_id
+        self._next_id += 1
+        self.items[item] = [list(coords), options]
+        if tags:
+            self.tags.setdefault(tags, []).append(item)
+        return item
+
+    create_oval = create_rectangle = create_line = create_text = _create
+
+    def _find(self, tag_or_id):
+        return self.tags.get(tag_or_id, ()) if isinstance(tag_or_id, str) else (tag_or_id,)
+
+    def itemconfigure(self, tag_or_id, **options):
+        self.calls += 1
+        for item in self._find(tag_or_id):
+            self.items[item][1].update(options)
+
+    def coords(self, tag_or_id, *coords):
+        self.calls += 1
+        for item in self._find(tag_or_id)[:1]:
+            self.items[item][0] = list(coords)
+
+    def move(self, tag_or_id, dx, dy):
+        self.calls += 1
+        for item in self._find(tag_or_id):
+            coords = self.items[item][0]
+            self.items[item][0] = [value + (dy if index % 2 else dx) for index, value in enumerate(coords)]
+
+    def delete(self, tag_or_id):
+        self.calls += 1
+        for item in list(self._find(tag_or_id)):
+            self.items.pop(item, None)
+
+    def config(self, **options):
+        self.calls += 1
+
+    configure = config
+
+
+class MouseEvent:
+    __slots__ = ("x", "y")
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def mouse_path(rng, count, width=1000, height=600):
+    """Synthetic mouse movement: a random walk with the occasional jump, like a user sweeping between board and tray."""
+    events = []
+    x, y = rng.randrange(width), rng.randrange(height)
+    for _ in range(count):
+        if rng.random() < 0.02:
+            x, y = rng.randrange(width), rng.randrange(height)
+        else:
+            x = min(max(x + rng.randint(-6, 6), 0), width - 1)
+            y = min(max(y + rng.randint(-6, 6), 0), height - 1)
+        events.append(MouseEvent(x, y))
+    return events
+
+
+def setup_headless_ui():
+    """Builds the game screen of tokens.py on a HeadlessCanvas, without tkinter."""
+    canvas = HeadlessCanvas()
+    tokens.canvas = canvas
+    tokens.dict_coords = tokens.drawBoard(canvas)
+    tokens.unplacedTokenList = [
+        tokens.Token(550 + 100 * (index % 4), 100 + 100 * (index // 4), piece.color, piece.has_hole, piece.size, piece.shape)
+        for index, piece in enumerate(bitboard.PIECE_OBJECTS)
+    ]
+    for token in tokens.unplacedTokenList:
+        tokens.drawToken(canvas, token)
+    canvas.create_rectangle(0, 0, 0, 0, state="hidden", tags="grid-highlight")
+    tokens.token_index = tokens.TokenIndex(tokens.unplacedTokenList)
+    tokens.resetHover()
+    return canvas
+
+
+def bench_highlight(rng, scale):
+    canvas = setup_headless_ui()
+    events = mouse_path(rng, 200000 * scale)
+    start_items = len(canvas.items)
+
+    def run():
+        tokens.resetHover()
+        canvas.calls = 0
+        for event in events:
+            tokens.highlightBoth(event)
+        if len(canvas.items) != start_items:
+            raise RuntimeError("highlightBoth changed the number of canvas items")
+        return len(events)
+    return run, "events"
+
+
+BENCHMARKS = {
+    "check_win_in_any_position": bench_check_win,
+    "ai_select_token": bench_ai_select_token,
+    "self_play": bench_self_play,
+    "search": bench_search,
+    "highlight_both": bench_highlight,
+}
+for _variant in SCALING_VARIANTS:
+    BENCHMARKS[f"tables_{_variant.name}"] = functools.partial(bench_variant_tables, variant=_variant)
+    BENCHMARKS[f"win_check_{_variant.name}"] = functools.partial(bench_variant_win_check, variant=_variant)
+    BENCHMARKS[f"search_{_variant.name}"] = functools.partial(bench_variant_search, variant=_variant)
+
+
+def run_benchmarks(names, seed=0, repeat=5, scale=1):
+    """
+    Runs the named benchmarks.
+
+    Returns
+    -------
+    dict
+        Benchmark name -> {"unit", "count", "seconds", "per_second"} for the fastest of `repeat` runs.
+    """
+    results = {}
+    for name in names:
+        run, unit = BENCHMARKS[name](random.Random(f"{seed}:{name}"), scale)
+        best = None
+        for _ in range(repeat):
+            gc.collect()
+            gc.disable()  # Like timeit, keep collector pauses out of the timings
+            try:
+                start = time.perf_counter()
+                count = run()
+                elapsed = time.perf_counter() - start
+            finally:
+                gc.enable()
+            if best is None or elapsed < best[1]:
+                best = (count, elapsed)
+        count, elapsed = best
+        results[name] = {"unit": unit, "count": count, "seconds": elapsed, "per_second": count / max(elapsed, 1e-9)}
+        if name == "highlight_both":
+            results[name]["canvas_calls"] = tokens.canvas.calls  # Of the last run, the same for every run
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns the names of the benchmarks more than `tolerance` (a fraction) slower than the baseline."""
+    slower = []
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old and result["per_second"] < old["per_second"] * (1 - tolerance):
+            slower.append(name)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Quarto engine, AI and UI handlers.")
+    parser.add_argument("benchmarks", nargs="*", help=f"benchmarks to run, all of them by default. Options: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark, the fastest is kept")
+    parser.add_argument("--scale", type=int, default=1, help="multiplies the size of every workload")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="JSON file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    names = args.benchmarks or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name}. Options: {', '.join(BENCHMARKS)}")
+    results = run_benchmarks(names, args.seed, args.repeat, args.scale)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+    for name, result in results.items():
+        line = f"{name:30} {result['per_second']:>14,.0f} {result['unit']}/s  ({result['count']} in {result['seconds']:.3f}s)"
+        old = baseline and baseline.get("results", {}).get(name)
+        if old:
+            line += f"  {100 * (result['per_second'] / old['per_second'] - 1):+.1f}%"
+        print(line)
+
+    report = {
+        "meta": {"seed": args.seed, "repeat": args.repeat, "scale": args.scale, "python": platform.python_version(),
+                 "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if baseline:
+        slower = compare(results, baseline, args.tolerance)
+        if slower:
+            print(f"Slower than {args.compare} by more than {100 * args.tolerance:.0f}%: {', '.join(slower)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+"""
+Compact bitboard representation of the Quarto board.
+
+Cells are numbered 0-15 row by row, so A1 is 0, D1 is 3 and A2 is 4.
+Every piece is stored as a 4-bit attribute code where bit 0 is size, bit 1 is
+shape, bit 2 is color and bit 3 is hole (same order as the letters of
+Token.get_id()). The board keeps a 16-bit occupancy mask plus one 16-bit plane
+per attribute, so checking a line for a win is a couple of AND/compare operations
+instead of indexing into id strings.
+
+It also keeps a threat index: per line, how many pieces it holds and how many of
+them have each attribute bit set. Placing or removing a piece only updates the
+lines through its cell, and the pieces that would complete a line with one free
+cell are a table lookup on those counts, so "is this piece safe to give" is a
+single mask test.
+
+All of that is generated from a Variant: the board size, number of attributes and
+set of winning lines. The module constants are the tables of the standard 4x4 game,
+and a Board made with another variant (ie. get_variant(5, 5) or the 2x2 square rule)
+carries its own tables, so the same code plays every variant.
+"""
+
+EMPTY = -1
+MAX_SIZE = 7  # Largest board a Variant can have. Threat tables for bigger ones would take too long to build
+MAX_THREAT_ENTRIES = 1 << 22  # Largest threat table a Variant may build, which caps its attributes, see max_attributes()
+
+CHARACTERISTICS = ("size", "shape", "color", "hole")
+
+# Letters used by Token.get_id() for each attribute. The second letter sets the bit.
+# size(L,S), shape(C,S), color(B,R), hole(X,0). Attributes past these four use 0 and 1.
+ID_LETTERS = (("L", "S"), ("C", "S"), ("B", "R"), ("X", "0"))
+EXTRA_ID_LETTERS = ("0", "1")
+
+BOARD_COLUMNS = "ABCDEFG"  # Column letters of the cell labels, enough for MAX_SIZE
+
+
+def max_attributes(size):
+    """Most attributes a board of this size can have before its threat table grows past MAX_THREAT_ENTRIES."""
+    count_bits = size.bit_length()
+    attributes = 1
+    while (size + 1) << count_bits * (attributes + 1) <= MAX_THREAT_ENTRIES:
+        attributes += 1
+    return attributes
+
+
+def _line_mask(cells):
+    mask = 0
+    for cell in cells:
+        mask |= 1 << cell
+    return mask
+
+
+class Variant:
+    """
+    Board size, piece attributes and winning lines of a game of Quarto. Every table the board
+    and the search use is generated from these when the variant is made. Variants are interned,
+    get one with get_variant().
+
+    Parameters
+    ----------
+    size : int
+        Cells per side, 2 to MAX_SIZE.
+    attributes : int
+        Two-valued attributes per piece, so there are 2 ** attributes pieces. There have to be
+        at least as many pieces as cells, and at most max_attributes(size) attributes.
+    diagonals : bool
+        The two long diagonals are winning lines.
+    squares : bool
+        Every 2x2 block is a winning line too. Only on 4x4 boards, where a block has as many
+        cells as a row.
+
+    Attributes:
+    cells, pieces : int
+        Number of cells and of pieces.
+    full_mask, all_pieces : int
+        Masks with a bit set for every cell and for every piece.
+    no_piece : int
+        Code for "no piece in hand", one past the last piece.
+    column_labels : str
+        Column letters of the cell labels.
+    characteristics : tuple
+        Attribute names in bit order.
+    pieces_with_bit : tuple
+        pieces_with_bit[attribute][value] is the mask of the piece codes with that attribute value.
+    row_lines, column_lines, diagonal_lines, square_lines : tuple
+        Cell masks of the winning lines of each kind.
+    lines, line_names : tuple
+        All the winning lines in that order and their names.
+    cell_lines : tuple
+        (index into lines, line mask) of the lines through each cell.
+    cell_line_indices : tuple
+        Just the indices of cell_lines.
+    count_bits, piece_count_shift : int
+        Layout of the packed line counts in Board.lines: count_bits per attribute, then the piece count.
+    line_weights : tuple
+        What placing each piece adds to the packed counts of its lines.
+    line_threats : tuple
+        Packed line count -> mask of the pieces that complete the line. 0 unless one cell is free.
+    """
+
+    def __init__(self, size=4, attributes=4, diagonals=True, squares=False):
+        if not 2 <= size <= MAX_SIZE:
+            raise ValueError(f"Board size must be between 2 and {MAX_SIZE}. You entered: {size}")
+        if 1 << attributes < size * size:
+            raise ValueError(f"{attributes} attributes make {1 << attributes} pieces, too few for {size * size} cells.")
+        if attributes > max_attributes(size):
+            raise ValueError(f"A {size}x{size} board can have at most {max_attributes(size)} attributes. You entered: {attributes}")
+        if squares and size != 4:
+            raise ValueError(f"The square rule needs a 4x4 board. You entered: {size}x{size}")
+        self.size = size
+        self.attributes = attributes
+        self.diagonals = diagonals
+        self.squares = squares
+        self.cells = size * size
+        self.pieces = 1 << attributes
+        self.full_mask = (1 << self.cells) - 1
+        self.all_pieces = (1 << self.pieces) - 1
+        self.no_piece = self.pieces
+        self.column_labels = BOARD_COLUMNS[:size]
+        self.characteristics = (CHARACTERISTICS + tuple(f"attribute {index + 1}" for index in range(4, attributes)))[:attributes]
+        self._id_letters = (ID_LETTERS + (EXTRA_ID_LETTERS,) * attributes)[:attributes]
+        self.pieces_with_bit = tuple(
+            tuple(sum(1 << code for code in range(self.pieces) if code >> attribute & 1 == value) for value in (0, 1))
+            for attribute in range(attributes)
+        )
+
+        cell_index = self.cell_index
+        self.row_lines = tuple(_line_mask(cell_index(row, col) for col in range(size)) for row in range(size))
+        self.column_lines = tuple(_line_mask(cell_index(row, col) for row in range(size)) for col in range(size))
+        self.diagonal_lines = (
+            _line_mask(cell_index(i, i) for i in range(size)),  # top left to bottom right
+            _line_mask(cell_index(i, size - 1 - i) for i in range(size)),  # top right to bottom left
+        ) if diagonals else ()
+        blocks = [(row, col) for row in range(size - 1) for col in range(size - 1)] if squares else []
+        self.square_lines = tuple(
+            _line_mask(cell_index(row + dr, col + dc) for dr in (0, 1) for dc in (0, 1)) for row, col in blocks
+        )
+        self.lines = self.row_lines + self.column_lines + self.diagonal_lines + self.square_lines
+        self.line_names = tuple(
+            [f"row {row}" for row in range(size)]
+            + [f"column {col}" for col in range(size)]
+            + ["first diagonal", "second diagonal"][:len(self.diagonal_lines)]
+            + [f"square {self.cell_label(cell_index(row, col))}" for row, col in blocks]
+        )
+        self.cell_lines = tuple(
+            tuple((index, line) for index, line in enumerate(self.lines) if line >> cell & 1)
+            for cell in range(self.cells)
+        )
+        self.cell_line_indices = tuple(tuple(index for index, _ in lines) for lines in self.cell_lines)
+
+        # Counts go up to size, so each one needs enough bits to hold it
+        self.count_bits = size.bit_length()
+        self.piece_count_shift = self.count_bits * attributes
+        self.line_weights = tuple(
+            sum((code >> attribute & 1) << self.count_bits * attribute for attribute in range(attributes))
+            + (1 << self.piece_count_shift)
+            for code in range(self.pieces)
+        )
+        self.line_threats = self._line_threats()
+
+    def _line_threats(self):
+        """Maps every packed line count to the mask of pieces that complete the line. 0 unless it holds size - 1 pieces."""
+        size = self.size
+        threats = [0] * ((size + 1) << self.piece_count_shift)
+        for counts in range(size ** self.attributes):  # Every attribute count 0 to size - 1 for lines with one free cell
+            packed = (size - 1) << self.piece_count_shift
+            pieces = 0
+            for attribute in range(self.attributes):
+                count = counts // size ** attribute % size
+                packed |= count << self.count_bits * attribute
+                if count == 0:
+                    pieces |= self.pieces_with_bit[attribute][0]
+                elif count == size - 1:
+                    pieces |= self.pieces_with_bit[attribute][1]
+            threats[packed] = pieces
+        return tuple(threats)
+
+    def __reduce__(self):
+        return get_variant, (self.size, self.attributes, self.diagonals, self.squares)  # Unpickle to the interned instance
+
+    def __repr__(self):
+        rules = "" if self.diagonals else ", no diagonals"
+        rules += ", squares" if self.squares else ""
+        return f"Variant({self.size}x{self.size}, {self.attributes} attributes{rules})"
+
+    @property
+    def name(self):
+        """Short name like 5x5x5 (size x size x attributes), with +squares or -diagonals for the line rules."""
+        return f"{self.size}x{self.size}x{self.attributes}" + ("" if self.diagonals else "-diagonals") + ("+squares" if self.squares else "")
+
+    def cell_index(self, row, col):
+        """Returns the cell number for a row and column."""
+        return row * self.size + col
+
+    def cell_label(self, cell):
+        """Converts a cell number into a grid label like "B3"."""
+        row, col = divmod(cell, self.size)
+        return f"{self.column_labels[col]}{row + 1}"
+
+    def cell_from_label(self, label):
+        """Converts a grid label like "B3" into a cell number."""
+        if len(label) != 2 or label[0] not in self.column_labels or not "1" <= label[1] <= str(self.size):
+            raise ValueError(f"Not a cell: {label}")
+        return self.cell_index(int(label[1]) - 1, self.column_labels.index(label[0]))
+
+    def piece_id(self, code):
+        """Converts an attribute code into its token id, one letter per attribute."""
+        return "".join(letters[code >> attribute & 1] for attribute, letters in enumerate(self._id_letters))
+
+    def code_from_id(self, token_id):
+        """Converts a token id back into its attribute code."""
+        if len(token_id) != self.attributes:
+            raise ValueError(f"Invalid token id: {token_id}")
+        code = 0
+        for attribute, letter in enumerate(token_id):
+            if letter == self._id_letters[attribute][1]:
+                code |= 1 << attribute
+            elif letter != self._id_letters[attribute][0]:
+                raise ValueError(f"Invalid token id: {token_id}")
+        return code
+
+
+_variants = {}
+
+
+def get_variant(size=4, attributes=4, diagonals=True, squares=False):
+    """Returns the interned Variant with these rules, building its tables the first time."""
+    key = (size, attributes, bool(diagonals), bool(squares))
+    variant = _variants.get(key)
+    if variant is None:
+        variant = _variants[key] = Variant(*key)
+    return variant
+
+
+STANDARD = get_variant()  # 4x4 board, 4 attributes, rows, columns and diagonals
+
+# Tables of the standard game. Everything that only plays the standard game uses these directly.
+SIZE = STANDARD.size
+CELLS = STANDARD.cells
+FULL_MASK = STANDARD.full_mask
+ATTRIBUTES = STANDARD.attributes
+PIECES = STANDARD.pieces
+COLUMN_LABELS = STANDARD.column_labels
+PIECES_WITH_BIT = STANDARD.pieces_with_bit
+ROW_LINES = STANDARD.row_lines
+COLUMN_LINES = STANDARD.column_lines
+DIAGONAL_LINES = STANDARD.diagonal_lines
+LINES = STANDARD.lines
+LINE_NAMES = STANDARD.line_names
+CELL_LINES = STANDARD.cell_lines  # A cell lies on 2 to 4 lines
+CELL_LINE_INDICES = STANDARD.cell_line_indices
+# Threat index. Board.lines[index] packs the counts for one line: 3 bits per attribute
+# holding how many of its pieces have that bit set, and the number of pieces above them.
+COUNT_BITS = STANDARD.count_bits
+PIECE_COUNT_SHIFT = STANDARD.piece_count_shift
+LINE_WEIGHTS = STANDARD.line_weights
+LINE_THREATS = STANDARD.line_threats
+
+
+def cell_index(row, col):
+    """Returns the cell number for a row and column."""
+    return row * SIZE + col
+
+
+def cell_from_label(label):
+    """Converts a grid label like "B3" into a cell number."""
+    return cell_index(int(label[1]) - 1, COLUMN_LABELS.index(label[0]))
+
+
+def label_from_cell(cell):
+    """Converts a cell number back into a grid label like "B3"."""
+    row, col = divmod(cell, SIZE)
+    return f"{COLUMN_LABELS[col]}{row + 1}"
+
+
+def attribute_index(characteristic):
+    """Maps a characteristic name (size, shape, color, hole) to its bit in a piece code."""
+    try:
+        return CHARACTERISTICS.index(characteristic)
+    except ValueError:
+        raise ValueError(f"Must insert valid characteristic. Options are: size, shape, color, hole. You entered: {characteristic} ") from None
+
+
+def code_from_id(token_id):
+    """Converts a 4 character token id (ie. LCB0) into its 4-bit attribute code."""
+    code = 0
+    for attribute, letter in enumerate(token_id):
+        if letter == ID_LETTERS[attribute][1]:
+            code |= 1 << attribute
+        elif letter != ID_LETTERS[attribute][0]:
+            raise ValueError(f"Invalid token id: {token_id}")
+    return code
+
+
+def id_from_code(code):
+    """Converts a 4-bit attribute code back into the token id string."""
+    return "".join(letters[(code >> attribute) & 1] for attribute, letters in enumerate(ID_LETTERS))
+
+
+# Attribute values of the pieces in bit order. The second value sets the bit.
+ATTRIBUTE_VALUES = (("small", "large"), ("circle", "square"), ("blue", "red"), (False, True))
+
+
+class Piece:
+    """
+    One of the 16 Quarto pieces.
+
+    Pieces are interned and immutable: PIECE_OBJECTS[code] is the only Piece with that code,
+    so they can be compared with `is` and shared freely. Screen position belongs to the
+    Token sprite in tokens.py, not here.
+
+    Attributes:
+    code : int
+        4-bit attribute code used by the bitboard.
+    id : str
+        4 character token id, ie. LCB0.
+    size, shape, color : str
+        Attribute values from ATTRIBUTE_VALUES.
+    has_hole : bool
+        Whether the piece has a hole in the middle.
+    """
+    __slots__ = ("code", "id", "size", "shape", "color", "has_hole")
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Pieces are immutable")
+
+    def __reduce__(self):
+        return piece_from_code, (self.code,)  # Unpickle to the interned instance
+
+    def __repr__(self):
+        return f"Piece({self.id})"
+
+
+def _make_piece(code):
+    piece = object.__new__(Piece)
+    values = [ATTRIBUTE_VALUES[attribute][code >> attribute & 1] for attribute in range(ATTRIBUTES)]
+    for name, value in zip(("code", "id", "size", "shape", "color", "has_hole"), [code, id_from_code(code)] + values):
+        object.__setattr__(piece, name, value)
+    return piece
+
+
+PIECE_OBJECTS = tuple(_make_piece(code) for code in range(PIECES))
+PIECES_BY_ID = {piece.id: piece for piece in PIECE_OBJECTS}
+
+
+def piece_from_code(code):
+    """Returns the interned Piece for an attribute code."""
+    return PIECE_OBJECTS[code]
+
+
+def piece_from_attributes(size, shape, color, has_hole):
+    """Returns the interned Piece with the given attribute values."""
+    code = 0
+    for attribute, value in enumerate((size, shape, color, bool(has_hole))):
+        values = ATTRIBUTE_VALUES[attribute]
+        if value not in values:
+            raise ValueError(f"{CHARACTERISTICS[attribute]} must be one of {values}. You entered: {value}")
+        code |= values.index(value) << attribute
+    return PIECE_OBJECTS[code]
+
+
+class Board:
+    """
+    Quarto board stored as bitmasks.
+
+    Attributes:
+    variant : Variant
+        Size, attributes and winning lines of the game. STANDARD unless given.
+    cells : list
+        Piece code in each of the 16 cells, EMPTY if the cell is free.
+    occupied : int
+        16-bit mask of the cells holding a piece.
+    planes : list
+        One 16-bit mask per attribute with a bit set for every piece that has that attribute bit.
+    lines : list
+        Packed piece and attribute counts per line in variant.lines order, see LINE_WEIGHTS.
+    """
+    __slots__ = ("variant", "cells", "occupied", "planes", "lines")
+
+    def __init__(self, variant=STANDARD):
+        self.variant = variant
+        self.cells = [EMPTY] * variant.cells
+        self.occupied = 0
+        self.planes = [0] * variant.attributes
+        self.lines = [0] * len(variant.lines)
+
+    def copy(self):
+        other = Board.__new__(Board)
+        other.variant = self.variant
+        other.cells = self.cells[:]
+        other.occupied = self.occupied
+        other.planes = self.planes[:]
+        other.lines = self.lines[:]
+        return other
+
+    def place(self, cell, code):
+        """Puts the piece with the given code on an empty cell."""
+        bit = 1 << cell
+        self.cells[cell] = code
+        self.occupied |= bit
+        planes = self.planes
+        for attribute in range(len(planes)):
+            if code >> attribute & 1:
+                planes[attribute] |= bit
+        variant = self.variant
+        weight = variant.line_weights[code]
+        lines = self.lines
+        for index in variant.cell_line_indices[cell]:
+            lines[index] += weight
+
+    def remove(self, cell):
+        """Takes the piece back off a cell. Used by the AI to undo hypothetical placements."""
+        clear = ~(1 << cell)
+        variant = self.variant
+        weight = variant.line_weights[self.cells[cell]]
+        self.cells[cell] = EMPTY
+        self.occupied &= clear
+        planes = self.planes
+        for attribute in range(len(planes)):
+            planes[attribute] &= clear
+        lines = self.lines
+        for index in variant.cell_line_indices[cell]:
+            lines[index] -= weight
+
+    def is_empty(self, cell):
+        return not self.occupied >> cell & 1
+
+    def is_full(self):
+        return self.occupied == self.variant.full_mask
+
+    def empty_cells(self):
+        """Returns the list of free cell numbers."""
+        free = ~self.occupied & self.variant.full_mask
+        return [cell for cell in range(free.bit_length()) if free >> cell & 1]
+
+    def rows(self):
+        """Returns the board as rows of token ids (None for empty), the same layout the game used to keep."""
+        variant = self.variant
+        size = variant.size
+        return [[None if code == EMPTY else variant.piece_id(code) for code in self.cells[row * size:(row + 1) * size]]
+                for row in range(size)]
+
+
+def line_is_win(board, line, attribute):
+    """True if the line is full and every piece in it shares the attribute bit."""
+    if board.occupied & line != line:
+        return False
+    shared = board.planes[attribute] & line
+    return shared == 0 or shared == line
+
+
+def find_win(board):
+    """
+    Looks for a winning line anywhere on the board.
+
+    Returns
+    -------
+    tuple or None
+        (line index into board.variant.lines, attribute index) of the first win found, otherwise None.
+    """
+    occupied = board.occupied
+    planes = board.planes
+    for index, line in enumerate(board.variant.lines):
+        if occupied & line != line:
+            continue
+        for attribute in range(len(planes)):
+            shared = planes[attribute] & line
+            if shared == 0 or shared == line:
+                return index, attribute
+    return None
+
+
+def find_win_at(board, cell):
+    """
+    Incremental win check. Only looks at the lines through the cell that was just filled.
+
+    Parameters
+    ----------
+    board : Board
+        Board with the new piece already placed.
+    cell : int
+        Cell the piece was placed on.
+
+    Returns
+    -------
+    tuple or None
+        (line index into board.variant.lines, attribute index) of the win, otherwise None.
+    """
+    occupied = board.occupied
+    planes = board.planes
+    for index, line in board.variant.cell_lines[cell]:
+        if occupied & line != line:
+            continue
+        for attribute in range(len(planes)):
+            shared = planes[attribute] & line
+            if shared == 0 or shared == line:
+                return index, attribute
+    return None
+
+
+def is_winning_placement(board, cell, code):
+    """True if putting the piece on the empty cell would complete a winning line. The board is left unchanged."""
+    # A line through an empty cell that already holds 3 pieces has that cell as its free one
+    lines = board.lines
+    variant = board.variant
+    threats = variant.line_threats
+    for index in variant.cell_line_indices[cell]:
+        if threats[lines[index]] >> code & 1:
+            return True
+    return False
+
+
+def winning_pieces(board):
+    """
+    Finds every piece that would win if it were placed on the board right now.
+
+    Only lines with exactly one free cell can be completed. For each of them the
+    attributes shared by the three pieces already there decide which pieces finish it,
+    which the threat index has already worked out.
+
+    Returns
+    -------
+    int
+        Mask with bit `code` set for every winning piece code.
+    """
+    pieces = 0
+    threats = board.variant.line_threats
+    for count in board.lines:
+        pieces |= threats[count]
+    return pieces
+
+
+def safe_pieces(board, pieces):
+    """Returns the subset of the `pieces` mask that can be handed over without letting the opponent win at once."""
+    return pieces & ~winning_pieces(board)
+
+
+def has_win(board):
+    """True if any of the lines is won on any attribute."""
+    return find_win(board) is not None
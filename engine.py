@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+"""
+Quarto rules, game state and AI with no GUI dependency.
+
+Everything here works on piece codes and cell numbers from bitboard.py, so batch
+workers can import it without tkinter or a display. tokens.py is the Tk front end
+built on top of it.
+"""
+import os
+import random
+import time
+
+import bitboard
+import opening_book
+import position_cache
+import search
+import tablebase
+
+AI_TIME_LIMIT = 2.0  # Seconds the AI may think about each placement
+AI_TABLE_SIZE = 1 << 18  # Transposition table slots kept between AI moves
+AI_TABLE_REPLACEMENT = "depth"  # "depth" or "always"
+AI_SYMMETRY_PLIES = 2  # Plies from the root where symmetric positions share table entries
+AI_TABLEBASE_PATH = "quarto_tablebase.bin"  # Made by tablebase.py
+AI_BOOK_PATH = "quarto_opening_book.bin"  # Made by opening_book.py. Checked before searching
+AI_EVALUATOR_PATH = "quarto_evaluator.npz"  # Made by evaluator.py
+AI_CACHE_PATH = "quarto_positions.db"  # Searched positions shared with other AI processes and later sessions, made on first use
+# Score the search horizon with the learned evaluator instead of 0. Off by default: it wins at equal depth,
+# but scoring every leaf costs the search a ply or two, and at equal time the deeper search plays better
+AI_USE_EVALUATOR = False
+# Probe the endgame tablebase during the search. Off by default: a sampled table answers about 1% of
+# the probes in games it wasn't made from (see tablebase.py), and every probe costs a canonical key
+AI_USE_TABLEBASE = False
+
+
+class GameState:
+    """
+    State of one game of Quarto.
+
+    A turn is: the selecting player gives a piece, then the current player places it.
+    Player 1 places first, so player 2 gives the first piece.
+
+    Attributes:
+    variant : bitboard.Variant
+        Board size, attributes and winning lines. bitboard.STANDARD unless given.
+    board : bitboard.Board
+        Pieces on the board.
+    remaining : int
+        Mask of the pieces that are neither on the board nor in hand.
+    hand : int
+        Piece the current player has to place, NO_PIECE (variant.no_piece) while it is still being chosen.
+    players : tuple
+        Names of the two players.
+    turn : int
+        Index into players of the player who places next.
+    winner : int
+        Index of the player who won, None while nobody has.
+    win : tuple
+        (line index into variant.lines, attribute index) of the winning line.
+    history : list
+        (piece given, cell placed) for every placement so far.
+    """
+
+    def __init__(self, players=("Player 1", "Player 2"), variant=bitboard.STANDARD):
+        self.variant = variant
+        self.board = bitboard.Board(variant)
+        self.remaining = variant.all_pieces
+        self.hand = variant.no_piece
+        self.players = tuple(players)
+        self.turn = 0
+        self.winner = None
+        self.win = None
+        self.history = []
+
+    def copy(self):
+        other = GameState.__new__(GameState)
+        other.variant = self.variant
+        other.board = self.board.copy()
+        other.remaining = self.remaining
+        other.hand = self.hand
+        other.players = self.players
+        other.turn = self.turn
+        other.winner = self.winner
+        other.win = self.win
+        other.history = self.history[:]
+        return other
+
+    @property
+    def current_player(self):
+        """Name of the player who places the next piece."""
+        return self.players[self.turn]
+
+    @property
+    def selecting_player(self):
+        """Name of the player who chooses the piece for the current player."""
+        return self.players[1 - self.turn]
+
+    @property
+    def is_over(self):
+        return self.winner is not None or self.board.is_full()
+
+    def legal_gives(self):
+        """Codes of the pieces that can still be handed over."""
+        return [code for code in range(self.variant.pieces) if self.remaining >> code & 1]
+
+    @property
+    def threats(self):
+        """Mask of the pieces that would win if placed now, from the board's threat index."""
+        return bitboard.winning_pieces(self.board)
+
+    def safe_gives(self):
+        """Codes of the remaining pieces the next player can't win with straight away."""
+        safe = bitboard.safe_pieces(self.board, self.remaining)
+        return [code for code in range(self.variant.pieces) if safe >> code & 1]
+
+    def give(self, code):
+        """The selecting player hands a piece to the current player."""
+        if self.is_over:
+            raise ValueError("The game is already over.")
+        if self.hand != self.variant.no_piece:
+            raise ValueError("A piece has already been given for this turn.")
+        if not 0 <= code < self.variant.pieces or not self.remaining >> code & 1:
+            raise ValueError(f"Piece {self.variant.piece_id(code)} is not available.")
+        self.remaining &= ~(1 << code)
+        self.hand = code
+
+    def place(self, cell):
+        """
+        The current player places the piece in hand and the turn passes.
+
+        Returns
+        -------
+        tuple or None
+            (line index, attribute) if the placement won the game, otherwise None.
+        """
+        if self.hand == self.variant.no_piece:
+            raise ValueError("No piece has been given to place.")
+        if not self.board.is_empty(cell):
+            raise ValueError(f"{self.variant.cell_label(cell)} is already taken.")
+        self.board.place(cell, self.hand)
+        self.history.append((self.hand, cell))
+        self.hand = self.variant.no_piece
+        # Only the lines through the placed cell can have been completed
+        self.win = bitboard.find_win_at(self.board, cell)
+        if self.win:
+            self.winner = self.turn
+        elif not self.board.is_full():
+            self.turn = 1 - self.turn
+        return self.win
+
+    def undo(self):
+        """
+        Takes back the last action: the piece just given goes back to the pool, or if no piece
+        is in hand, the last placement comes off the board and its piece goes back in hand.
+        Lets tools walk the game tree on one state instead of copying it.
+        """
+        if self.hand != self.variant.no_piece:
+            self.remaining |= 1 << self.hand
+            self.hand = self.variant.no_piece
+            return
+        if not self.history:
+            raise ValueError("There is nothing to undo.")
+        # The turn only passed if the placement neither won nor filled the board
+        passed = self.winner is None and not self.board.is_full()
+        code, cell = self.history.pop()
+        self.board.remove(cell)
+        self.hand = code
+        self.winner = None
+        self.win = None
+        if passed:
+            self.turn = 1 - self.turn
+
+
+def _attribute(variant, characteristic):
+    """Bit of a characteristic name in the variant's piece codes."""
+    if variant is bitboard.STANDARD:
+        return bitboard.attribute_index(characteristic)
+    if characteristic not in variant.characteristics:
+        raise ValueError(f"Must insert valid characteristic. Options are: {', '.join(variant.characteristics)}. "
+                         f"You entered: {characteristic} ")
+    return variant.characteristics.index(characteristic)
+
+
+def _line_number(variant, index, kind):
+    if not 0 <= index < variant.size:
+        raise ValueError(f"{kind} must be between 0 and {variant.size - 1}. You entered: {index}")
+    return index
+
+
+def check_row(board, row, characteristic):
+    """Checks a full row for a shared characteristic using the bitboard planes."""
+    variant = board.variant
+    line = variant.row_lines[_line_number(variant, row, "row")]
+    return bitboard.line_is_win(board, line, _attribute(variant, characteristic))
+
+
+def check_column(board, column, characteristic):
+    """Checks a full column for a shared characteristic using the bitboard planes."""
+    variant = board.variant
+    line = variant.column_lines[_line_number(variant, column, "column")]
+    return bitboard.line_is_win(board, line, _attribute(variant, characteristic))
+
+
+def check_diagonal(board, diagonal, characteristic):
+    """
+    it will check a diagonal win from top left to bottom right
+    or top right to bottom left
+    """
+    if diagonal == "first_diagonal": #top left to bottom right
+        index = 0
+    elif diagonal == "second_diagonal": #top right to bottom left
+        index = 1
+    else:
+        raise ValueError(f"Must insert valid diagonal for check_diagonal. Options are: first_diagonal, second_diagonal. You entered: {diagonal} ")
+    if not board.variant.diagonals:
+        raise ValueError(f"{board.variant.name} has no diagonal lines.")
+    line = board.variant.diagonal_lines[index]
+    return bitboard.line_is_win(board, line, _attribute(board.variant, characteristic))
+
+
+def check_win(board, characteristic):
+    """ Check a win for a specific characteristic in one way """
+    variant = board.variant
+    attribute = _attribute(variant, characteristic)
+    for line, name in zip(variant.lines, variant.line_names):
+        if bitboard.line_is_win(board, line, attribute):
+            print(f"Win found {name}, {characteristic}")
+            return True
+
+    # If no win found, return False
+    return False
+
+
+def check_win_in_any_position(board):
+    """ Checks if a player has won based on any of the four characteristics: size, shape, color, or hole. """
+    win = bitboard.find_win(board)
+    if win:
+        line, attribute = win
+        print(f"Win found {board.variant.line_names[line]}, {board.variant.characteristics[attribute]}")
+        return True
+
+    # Return False if no win is found for any characteristic
+    return False
+
+
+def check_board_state(board):
+    for row in board.rows():
+        print(row)
+
+
+def ai_select_token(state, rng=random):
+    """
+    Picks a piece for the opponent, avoiding pieces that let them win immediately.
+
+    Returns
+    -------
+    int
+        Code of the chosen piece. A random remaining piece if none of them are safe.
+    """
+    #The board's threat index already knows which pieces complete a line
+    safe_pieces = state.safe_gives()
+
+    #If there are safe pieces, pick one. Otherwise, pick a random piece
+    if safe_pieces:
+        return rng.choice(safe_pieces)
+    return rng.choice(state.legal_gives())
+
+
+class AIPlayer:
+    """
+    Search based AI with an optional opening book and endgame tablebase.
+
+    Parameters
+    ----------
+    time_limit : float
+        Seconds the search may spend on a placement. None for no limit.
+    max_nodes : int
+        Node budget for a placement. None for no limit.
+    book : opening_book.OpeningBook
+        Checked before searching. Optional.
+    endgame : tablebase.Tablebase
+        Exact endgame results used inside the search. Optional.
+    evaluator : evaluator.Evaluator
+        Scores positions at the search horizon. Optional.
+    cache : position_cache.PositionCache
+        Checked after the book and pondering, and given every result the search finds. Optional.
+    rng : random.Random
+        Used to choose the first piece of the game.
+    """
+
+    def __init__(self, time_limit=AI_TIME_LIMIT, max_nodes=None, table_size=AI_TABLE_SIZE,
+                 replacement=AI_TABLE_REPLACEMENT, symmetry_plies=AI_SYMMETRY_PLIES, book=None, endgame=None, evaluator=None,
+                 cache=None, rng=None):
+        self.book = book
+        self.cache = cache
+        self.searcher = search.Searcher(search.TranspositionTable(table_size, replacement), max_nodes=max_nodes,
+                                        time_limit=time_limit, symmetry_plies=symmetry_plies, tablebase=endgame,
+                                        evaluator=evaluator)
+        self.rng = rng or random.Random()
+        self.last_source = None  # "book", "ponder", "cache" or "search" for the last move
+        self.last_stats = None  # search.SearchStats for the last move
+        self.search_depth = 0  # Depth the last timed search reached
+        # Zobrist key of a position the opponent may leave us in -> (depth, move, proven, stats), filled by ponder()
+        self.pondered = {}
+        self._ponder_searcher = search.Searcher(self.searcher.table, symmetry_plies=symmetry_plies, tablebase=endgame,
+                                                evaluator=evaluator)
+
+    @classmethod
+    def from_files(cls, book_path=AI_BOOK_PATH, tablebase_path=None, evaluator_path=None,
+                   cache_path=AI_CACHE_PATH, **options):
+        """
+        Makes an AI that uses the opening book, tablebase and evaluator files when they exist, and the
+        position cache at cache_path, made if missing. tablebase_path and evaluator_path default to
+        AI_TABLEBASE_PATH and AI_EVALUATOR_PATH if AI_USE_TABLEBASE and AI_USE_EVALUATOR are set.
+        cache_path None plays without a cache.
+        """
+        if tablebase_path is None and AI_USE_TABLEBASE:
+            tablebase_path = AI_TABLEBASE_PATH
+        if evaluator_path is None and AI_USE_EVALUATOR:
+            evaluator_path = AI_EVALUATOR_PATH
+        book = opening_book.OpeningBook(book_path) if book_path and os.path.exists(book_path) else None
+        endgame = tablebase.Tablebase(tablebase_path) if tablebase_path and os.path.exists(tablebase_path) else None
+        learned = None
+        if evaluator_path and os.path.exists(evaluator_path):
+            import evaluator  # Needs numpy, so only imported when there are weights to load
+            learned = evaluator.Evaluator.load(evaluator_path)
+        cache = position_cache.PositionCache(cache_path) if cache_path else None
+        return cls(book=book, endgame=endgame, evaluator=learned, cache=cache, **options)
+
+    def choose_move(self, state, stop=None):
+        """
+        Chooses where to place the piece in hand and which piece to give next.
+
+        Parameters
+        ----------
+        state : GameState
+            Game with a piece in hand. Not modified.
+        stop : threading.Event
+            Set from another thread to cancel the search. Optional.
+
+        Returns
+        -------
+        tuple
+            (score, cell, give). give is NO_PIECE when the placement ends the game.
+            None if the search was stopped before it had a move.
+        """
+        start = time.perf_counter()
+        move = self.book.lookup(state.board, state.hand) if self._books(state) else None
+        if move:
+            self.last_source = "book"
+            self.last_stats = search.SearchStats("book", seconds=time.perf_counter() - start, score=move[0])
+            return move
+        known = None
+        entry = self.pondered.get(search.zobrist_key(state.board, state.hand))
+        if entry is not None:
+            depth, move, proven, stats = entry
+            # Two plies on from our last search, a timed search would get deeper than it did, so only
+            # a pondered move searched deeper than that is played straight away
+            if proven or 0 < self.search_depth < depth:
+                self.last_source = "ponder"
+                self.last_stats = stats
+                return move
+            known = (depth, move)
+        entry = self.cache.lookup(state.board, state.hand) if self._caches(state) else None
+        if entry is not None:
+            depth, move, proven = entry
+            # Same rule as for pondered moves. A shallower result still saves the search its first iterations
+            if proven or 0 < self.search_depth < depth:
+                self.last_source = "cache"
+                self.last_stats = search.SearchStats("cache", depth=depth, seconds=time.perf_counter() - start,
+                                                     score=move[0])
+                return move
+            if known is None or known[0] < depth:
+                known = (depth, move)
+        self.last_source = "search"
+        move = self.searcher.search(state.board, state.remaining, state.hand, stop, known)
+        self.last_stats = self.searcher.stats
+        self.search_depth = self.searcher.depth_reached
+        if move is not None:  # Only completed iterations count, so this holds even if the search was stopped
+            empties = len(state.board.empty_cells())
+            self._remember(state, self.search_depth, move, abs(move[0]) > search.MATE_BOUND or self.search_depth >= empties)
+        return move
+
+    def _books(self, state):
+        """True if the opening book applies to the game. Like the position cache, it only knows the standard board."""
+        return self.book is not None and state.variant is bitboard.STANDARD
+
+    def _caches(self, state):
+        """True if the position cache applies to the game. Its keys only describe the standard board."""
+        return self.cache is not None and state.variant is bitboard.STANDARD
+
+    def _remember(self, state, depth, move, proven):
+        if self._caches(state) and depth > 0:
+            self.cache.store(state.board, state.hand, depth, move, proven)
+
+    def ponder(self, state, stop, expects=None):
+        """
+        Searches the positions the opponent can leave us in while they think, until `stop` is set
+        or every one of them is solved.
+
+        All the positions are deepened one depth at a time, so each has a shallow answer before any
+        gets a deep one. The answers go in `pondered` for choose_move, and the transposition table,
+        shared with the main search, keeps the rest of what was learned.
+
+        Parameters
+        ----------
+        state : GameState
+            Game with the opponent holding the piece we gave them. Not modified.
+        stop : threading.Event
+            Set from another thread to end pondering.
+        expects : callable
+            expects(cell, give) says whether the opponent may still place on `cell` and give us
+            `give`. Checked before every search, so pondering narrows as the opponent commits. Optional.
+        """
+        self.pondered = {}
+        positions = []
+        empties = len(state.board.empty_cells()) - 1  # Left for us once the opponent has placed
+        for cell in state.board.empty_cells():
+            if not state.remaining or bitboard.is_winning_placement(state.board, cell, state.hand):
+                continue  # The game ends on the opponent's placement
+            board = state.board.copy()
+            board.place(cell, state.hand)
+            for give in state.legal_gives():
+                if self._books(state) and self.book.lookup(board, give):
+                    continue
+                positions.append((cell, give, board, state.remaining & ~(1 << give), search.zobrist_key(board, give)))
+
+        searcher = self._ponder_searcher
+        for depth in range(1, empties + 1):
+            searcher.max_depth = depth
+            searched = False
+            for cell, give, board, remaining, key in positions:
+                if stop.is_set():
+                    return
+                if expects is not None and not expects(cell, give):
+                    continue
+                entry = self.pondered.get(key)
+                if entry is not None and (entry[2] or entry[0] >= depth):
+                    continue
+                move = searcher.search(board, remaining, give, stop, None if entry is None else entry[:2])
+                if stop.is_set() or move is None:
+                    return
+                stats = searcher.stats
+                stats.source = "ponder"
+                if entry is not None:
+                    stats.nodes += entry[3].nodes
+                    stats.seconds += entry[3].seconds
+                proven = abs(move[0]) > search.MATE_BOUND or searcher.depth_reached >= empties
+                self.pondered[key] = (searcher.depth_reached, move, proven, stats)
+                if self._caches(state):
+                    self.cache.store(board, give, searcher.depth_reached, move, proven)
+                searched = True
+            if not searched:
+                return
+
+    def choose_give(self, state):
+        """Chooses a piece to give when there is nothing to place first (the opening move)."""
+        return ai_select_token(state, self.rng)
+
+    def close(self):
+        """Writes what is still buffered for the position cache and closes it."""
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+
+class RandomPlayer:
+    """Places and gives completely at random."""
+
+    def __init__(self, rng=None):
+        self.rng = rng or random.Random()
+
+    def choose_move(self, state, stop=None):
+        return 0, self.rng.choice(state.board.empty_cells()), state.variant.no_piece
+
+    def choose_give(self, state):
+        return self.rng.choice(state.legal_gives())
+
+
+class SafePlayer(RandomPlayer):
+    """The old AI: takes a win when it has one, otherwise places at random and gives a piece with ai_select_token."""
+
+    def choose_move(self, state, stop=None):
+        for cell in state.board.empty_cells():
+            if bitboard.is_winning_placement(state.board, cell, state.hand):
+                return 0, cell, state.variant.no_piece
+        return super().choose_move(state, stop)
+
+    def choose_give(self, state):
+        return ai_select_token(state, self.rng)
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Learned position evaluator for positions the search can't see to the end of.
+
+A small two layer network scores a position for the player holding the piece,
+from -1 (lost) to 1 (won), using board and threat features: how many lines hold
+1, 2 or 3 pieces that still share an attribute, how many remaining pieces are
+unsafe to give, and so on. The features are looked up from the packed line
+counts the board keeps up to date (Board.lines) and computed with NumPy over a
+whole batch of positions at once, so the search scores all the leaves below a
+node with one call. The features don't change under the symmetries in symmetry.py,
+so symmetric positions get the same score.
+
+The network is trained on the outcomes of self-play games, read from record
+files written by records.py. Weights are saved as a small .npz file that loads in
+a few milliseconds. Requires numpy.
+
+Usage:
+    python evaluator.py --games 2000 --nodes 2000 --output quarto_evaluator.npz
+    python tournament.py --games 5000 --player1 search --player2 search --record selfplay.qgr
+    python evaluator.py selfplay.qgr --output quarto_evaluator.npz
+"""
+import argparse
+import time
+
+import numpy as np
+
+import bitboard
+import records
+import search
+from bitboard import CELLS, PIECES
+
+SOLVE_EMPTY = 8  # Self-play positions are solved exactly for labels once this few cells are empty
+EVAL_SCALE = 100  # Search score of a certain win. Well below search.MATE_BOUND so it is never taken for one
+FEATURES = (
+    "live_1", "live_2", "live_3",  # Lines with 1, 2 or 3 pieces that still share an attribute
+    "shared_2", "shared_3",  # Attributes shared along lines with 2 or 3 pieces
+    "dead",  # Lines with 2 or more pieces that share nothing, they can never be won
+    "hand_threats",  # Lines with 2 pieces the piece in hand would turn into a threat
+    "unsafe", "safe",  # Remaining pieces that do and don't complete a line on this board
+    "safe_odd", "no_safe",
+    "remaining", "remaining_odd",
+)
+WEIGHT_NAMES = ("mean", "scale", "w1", "b1", "w2", "b2")
+LINE_COUNT = len(bitboard.LINES)
+POPCOUNT = np.array([bin(value).count("1") for value in range(1 << PIECES)], dtype=np.int8)
+
+
+def _line_tables():
+    """
+    Per line tables indexed by a packed line count from Board.lines: the number of pieces on the
+    line, how many attributes they all share, and the mask of pieces that share one of them.
+    """
+    size = (bitboard.SIZE + 1) << bitboard.PIECE_COUNT_SHIFT
+    pieces = np.zeros(size, dtype=np.int8)
+    shared = np.zeros(size, dtype=np.int8)
+    fits = np.zeros(size, dtype=np.int64)
+    for packed in range(size):
+        count = packed >> bitboard.PIECE_COUNT_SHIFT
+        if not 0 < count <= bitboard.SIZE:
+            continue
+        pieces[packed] = count
+        for attribute in range(bitboard.ATTRIBUTES):
+            with_bit = packed >> bitboard.COUNT_BITS * attribute & (1 << bitboard.COUNT_BITS) - 1
+            if with_bit > count:
+                break  # Not a reachable line
+            if with_bit in (0, count):
+                shared[packed] += 1
+                fits[packed] |= bitboard.PIECES_WITH_BIT[attribute][with_bit == count]
+    return pieces, shared, fits
+
+
+LINE_PIECES, LINE_SHARED, LINE_FITS = _line_tables()
+
+
+def position_inputs(board):
+    """The parts of a board the features are made from: its packed line counts and its winning pieces."""
+    return board.lines[:], bitboard.winning_pieces(board)
+
+
+def features(lines, winning, remaining, hands):
+    """
+    Feature rows for a batch of positions.
+
+    Parameters
+    ----------
+    lines : array
+        (N, 10) Board.lines of each position.
+    winning : array
+        (N,) bitboard.winning_pieces of each board.
+    remaining : array
+        (N,) 16-bit masks of the pieces that are not on the board and not in hand.
+    hands : array
+        (N,) codes of the piece each player holds.
+
+    Returns
+    -------
+    array
+        (N, len(FEATURES)) float32.
+    """
+    lines = np.asarray(lines, dtype=np.intp).reshape(-1, LINE_COUNT)
+    winning = np.asarray(winning, dtype=np.int64)
+    remaining = np.asarray(remaining, dtype=np.int64)
+    hands = np.asarray(hands, dtype=np.int64)
+    counts = LINE_PIECES[lines]
+    shared = LINE_SHARED[lines]
+    live = shared > 0
+    fits = (LINE_FITS[lines] >> hands[:, None] & 1).astype(bool)
+    unsafe = POPCOUNT[winning & remaining]
+    left = POPCOUNT[remaining]
+    safe = left - unsafe
+
+    columns = (
+        (live & (counts == 1)).sum(axis=1) / LINE_COUNT,
+        (live & (counts == 2)).sum(axis=1) / LINE_COUNT,
+        (live & (counts == 3)).sum(axis=1) / LINE_COUNT,
+        np.where(counts == 2, shared, 0).sum(axis=1) / (LINE_COUNT * bitboard.ATTRIBUTES),
+        np.where(counts == 3, shared, 0).sum(axis=1) / (LINE_COUNT * bitboard.ATTRIBUTES),
+        (~live & (counts >= 2)).sum(axis=1) / LINE_COUNT,
+        (fits & (counts == 2)).sum(axis=1) / LINE_COUNT,
+        unsafe / PIECES,
+        safe / PIECES,
+        safe % 2,
+        (left > 0) & (safe == 0),
+        left / PIECES,
+        left % 2,
+    )
+    return np.stack(columns, axis=1).astype(np.float32)
+
+
+class Evaluator:
+    """
+    Scores positions for the player holding the piece.
+
+    Parameters
+    ----------
+    weights : dict
+        Arrays named in WEIGHT_NAMES: the feature mean and scale used to standardize the
+        inputs, then the hidden and output layers.
+    """
+
+    def __init__(self, weights):
+        self.weights = {name: np.asarray(weights[name], dtype=np.float32) for name in WEIGHT_NAMES}
+        self.mean = self.weights["mean"]
+        self.scale = self.weights["scale"]
+        self.w1 = self.weights["w1"]
+        self.b1 = self.weights["b1"]
+        self.w2 = self.weights["w2"]
+        self.b2 = self.weights["b2"]
+        if self.w1.shape[0] != len(FEATURES):
+            raise ValueError(f"Weights are for {self.w1.shape[0]} features, the evaluator has {len(FEATURES)}")
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({name: data[name] for name in WEIGHT_NAMES})
+
+    def save(self, path):
+        with open(path, "wb") as file:  # An open file stops np.savez from adding .npz to the name
+            np.savez(file, **self.weights)
+
+    def predict(self, inputs):
+        """Values from -1 to 1 for (N, len(FEATURES)) feature rows."""
+        hidden = np.tanh((inputs - self.mean) / self.scale @ self.w1 + self.b1)
+        return np.tanh(hidden @ self.w2 + self.b2)[:, 0]
+
+    def evaluate_batch(self, lines, winning, remaining, hands):
+        """Integer search scores, EVAL_SCALE for a sure win, for a batch of positions. See features()."""
+        values = self.predict(features(lines, winning, remaining, hands))
+        return np.rint(values * EVAL_SCALE).astype(np.int64).tolist()
+
+    def evaluate(self, board, remaining, hand):
+        """Search score of one position. Batch with evaluate_batch where possible, the NumPy overhead is per call."""
+        lines, winning = position_inputs(board)
+        return self.evaluate_batch([lines], [winning], [remaining], [hand])[0]
+
+
+def training_positions(games, solve_empty=SOLVE_EMPTY, progress=None):
+    """
+    Positions and labels from recorded games.
+
+    Every placement gives one position: the board before it, the piece in hand and the pieces
+    left. Positions where the piece in hand wins on the spot are left out, the search never
+    evaluates those. Unfinished games are skipped.
+
+    A label is 1 if the player placing wins, -1 if they lose and 0 for a draw. Once a game is
+    down to `solve_empty` empty cells its position is solved exactly, and every earlier position
+    is labelled with that result rather than the final one, which would mostly reflect mistakes
+    made later on in the game. Positions after that point get the result the game ended with.
+
+    Parameters
+    ----------
+    games : iterable
+        (history, result) pairs, like records.iter_games yields.
+    solve_empty : int
+        Empty cells at which a game's position is solved. Each solve takes about 0.2 seconds at 8.
+    progress : callable
+        Called with the number of games done so far.
+
+    Returns
+    -------
+    tuple
+        (N, len(FEATURES)) features and (N,) labels.
+    """
+    solver = search.Searcher(search.TranspositionTable(1 << 20))  # Exact results stay valid from game to game
+    solve_ply = CELLS - solve_empty
+    lines, winning, remaining, hands, labels = [], [], [], [], []
+    for index, (history, result) in enumerate(games):
+        if result == records.UNFINISHED:
+            continue
+        board = bitboard.Board()
+        left = (1 << PIECES) - 1
+        plies = []
+        solved = None
+        for ply, (give, cell) in enumerate(history):
+            left &= ~(1 << give)
+            if ply == solve_ply:
+                score = solver.search(board, left, give)[0]
+                solved = (score > search.MATE_BOUND) - (score < -search.MATE_BOUND)
+                if ply % 2:
+                    solved = -solved  # For player 1, who places on even plies
+            board_lines, board_winning = position_inputs(board)
+            if not board_winning >> give & 1:
+                plies.append(ply)
+                lines.append(board_lines)
+                winning.append(board_winning)
+                remaining.append(left)
+                hands.append(give)
+            board.place(cell, give)
+        final = {records.DRAW: 0, 0: 1, 1: -1}[result]
+        for ply in plies:
+            value = solved if solved is not None and ply <= solve_ply else final
+            labels.append(-value if ply % 2 else value)
+        if progress:
+            progress(index + 1)
+    if not labels:
+        raise ValueError("No finished games to train on")
+    return features(lines, winning, remaining, hands), np.array(labels, dtype=np.float32)
+
+
+def train(inputs, labels, hidden=32, epochs=60, batch_size=256, learning_rate=0.003, seed=0):
+    """
+    Fits an Evaluator to labelled feature rows with mean squared error and Adam.
+
+    Returns
+    -------
+    Evaluator
+    """
+    rng = np.random.default_rng(seed)
+    mean = inputs.mean(axis=0)
+    scale = np.maximum(inputs.std(axis=0), 1e-3)
+    x = (inputs - mean) / scale
+    y = labels[:, None]
+    params = {
+        "w1": rng.normal(0.0, 1.0 / np.sqrt(x.shape[1]), (x.shape[1], hidden)).astype(np.float32),
+        "b1": np.zeros(hidden, dtype=np.float32),
+        "w2": rng.normal(0.0, 1.0 / np.sqrt(hidden), (hidden, 1)).astype(np.float32),
+        "b2": np.zeros(1, dtype=np.float32),
+    }
+    moments = {name: (np.zeros_like(value), np.zeros_like(value)) for name, value in params.items()}
+    beta1, beta2 = 0.9, 0.999
+    step = 0
+    for _ in range(epochs):
+        order = rng.permutation(len(x))
+        for start in range(0, len(x), batch_size):
+            rows = order[start:start + batch_size]
+            xb, yb = x[rows], y[rows]
+            h = np.tanh(xb @ params["w1"] + params["b1"])
+            out = np.tanh(h @ params["w2"] + params["b2"])
+            d_out = 2 * (out - yb) * (1 - out ** 2) / len(rows)
+            d_h = d_out @ params["w2"].T * (1 - h ** 2)
+            grads = {"w1": xb.T @ d_h, "b1": d_h.sum(axis=0), "w2": h.T @ d_out, "b2": d_out.sum(axis=0)}
+            step += 1
+            for name, grad in grads.items():
+                m, v = moments[name]
+                m[:] = beta1 * m + (1 - beta1) * grad
+                v[:] = beta2 * v + (1 - beta2) * grad ** 2
+                m_hat = m / (1 - beta1 ** step)
+                v_hat = v / (1 - beta2 ** step)
+                params[name] -= (learning_rate * m_hat / (np.sqrt(v_hat) + 1e-8)).astype(np.float32)
+    return Evaluator(dict(params, mean=mean, scale=scale))
+
+
+def self_play_games(games, seed=0, workers=None, max_nodes=2000):
+    """Plays search vs search games with tournament.py and returns them as (history, result) pairs."""
+    import tournament  # Only needed to make training data, and it imports the engine
+
+    played = []
+
+    def on_result(result):
+        index, winner, plies, seconds, history = result
+        played.append((history, records.game_result(records.replay(history))))
+
+    tournament.run_tournament(("search", "search"), games, seed, workers, max_nodes=max_nodes, on_result=on_result)
+    return played
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the Quarto position evaluator on self-play games.")
+    parser.add_argument("records", nargs="*", help="game record files to train on, see records.py")
+    parser.add_argument("--games", type=int, default=0, help="also play this many search vs search games to train on")
+    parser.add_argument("--nodes", type=int, default=2000, help="search node budget per move in those games")
+    parser.add_argument("--solve-empty", type=int, default=SOLVE_EMPTY, help="solve positions with this many empty cells for labels")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hidden", type=int, default=32, help="hidden layer size")
+    parser.add_argument("--epochs", type=int, default=60)
+    parser.add_argument("--validation", type=float, default=0.1, help="fraction of the positions held out")
+    parser.add_argument("--output", default="quarto_evaluator.npz")
+    args = parser.parse_args()
+    if not args.records and not args.games:
+        parser.error("give record files to train on, or --games to play some")
+
+    games = []
+    for path in args.records:
+        games.extend(records.iter_games(path))
+    if args.games:
+        start = time.perf_counter()
+        games.extend(self_play_games(args.games, args.seed, args.workers, args.nodes))
+        print(f"Played {args.games} games in {time.perf_counter() - start:.1f}s")
+    # Hold out whole games, positions from the same game are too alike to validate on
+    order = np.random.default_rng(args.seed).permutation(len(games))
+    split = int(len(games) * args.validation)
+    held_out = [games[index] for index in order[:split]]
+    kept = [games[index] for index in order[split:]]
+
+    def progress(done):
+        print(f"\rLabelling {done}/{len(kept)} games", end="", flush=True)
+
+    start = time.perf_counter()
+    inputs, labels = training_positions(kept, args.solve_empty, progress)
+    print(f"\nLabelled {len(labels)} positions in {time.perf_counter() - start:.1f}s")
+    start = time.perf_counter()
+    evaluator = train(inputs, labels, args.hidden, args.epochs, seed=args.seed)
+    print(f"Trained in {time.perf_counter() - start:.1f}s")
+    if held_out:
+        held_inputs, actual = training_positions(held_out, args.solve_empty)
+        predicted = evaluator.predict(held_inputs)
+        decided = actual != 0
+        print(f"validation: mean squared error {np.mean((predicted - actual) ** 2):.4f} "
+              f"(predicting 0: {np.mean(actual ** 2):.4f}), "
+              f"winner called right in {np.mean(np.sign(predicted[decided]) == actual[decided]):.1%} of decided positions")
+    evaluator.save(args.output)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
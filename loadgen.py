@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Client and load generator for server.py.
+
+Opens a number of concurrent connections, each playing games against the server AI
+(or both sides of human vs human games) with random legal moves, and reports request
+latency percentiles and throughput.
+
+Usage:
+    python loadgen.py --clients 200 --games 5 --ai safe
+    python loadgen.py --unix /tmp/quarto.sock --clients 50 --ai search
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import bitboard
+import server
+
+
+class QuartoClient:
+    """Async connection to a game server. One request is in flight at a time."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.latencies = []  # Seconds per request
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=server.DEFAULT_PORT, unix=None):
+        if unix:
+            reader, writer = await asyncio.open_unix_connection(unix, limit=server.MAX_LINE)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=server.MAX_LINE)
+        return cls(reader, writer)
+
+    async def request(self, op, **fields):
+        """Sends one request and returns the response. Raises RuntimeError if the server reports an error."""
+        start = time.perf_counter()
+        self.writer.write(json.dumps(dict(fields, op=op)).encode() + b"\n")
+        await self.writer.drain()
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        self.latencies.append(time.perf_counter() - start)
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error"))
+        return response
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def play_random_game(client, rng, ai=None):
+    """Plays one game with random legal moves. Returns the final state view."""
+    response = await client.request("new", ai=ai)
+    game = response["game"]
+    state = response["state"]
+    while state["action"] != "over":
+        if state["action"] == "give":
+            used = set(state["board"]) | {state["hand"]}
+            piece = rng.choice([piece.id for piece in bitboard.PIECE_OBJECTS if piece.id not in used])
+            state = (await client.request("give", game=game, piece=piece))["state"]
+        else:
+            free = [bitboard.label_from_cell(cell) for cell, piece in enumerate(state["board"]) if piece is None]
+            state = (await client.request("place", game=game, cell=rng.choice(free)))["state"]
+    await client.request("close", game=game)
+    return state
+
+
+async def run_load(clients, games, ai=None, host="127.0.0.1", port=server.DEFAULT_PORT, unix=None, seed=0):
+    """
+    Runs `clients` concurrent connections that each play `games` games.
+
+    Returns
+    -------
+    dict
+        Games, requests, seconds, requests and games per second, and latency percentiles in milliseconds.
+    """
+    connections = [await QuartoClient.connect(host, port, unix) for _ in range(clients)]
+
+    async def worker(index, client):
+        rng = random.Random(seed << 32 | index)
+        for _ in range(games):
+            await play_random_game(client, rng, ai)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(index, client) for index, client in enumerate(connections)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for client in connections for latency in client.latencies)
+    for client in connections:
+        await client.close()
+
+    def percentile(fraction):
+        return 1000 * latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] if latencies else 0.0
+
+    return {"games": clients * games, "requests": len(latencies), "seconds": elapsed,
+            "requests_per_second": len(latencies) / elapsed, "games_per_second": clients * games / elapsed,
+            "p50_ms": percentile(0.50), "p95_ms": percentile(0.95), "p99_ms": percentile(0.99),
+            "max_ms": 1000 * latencies[-1] if latencies else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate load against a Quarto game server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=server.DEFAULT_PORT)
+    parser.add_argument("--unix", default=None, help="connect to this Unix socket path instead of TCP")
+    parser.add_argument("--clients", type=int, default=100, help="concurrent connections")
+    parser.add_argument("--games", type=int, default=5, help="games per connection")
+    parser.add_argument("--ai", choices=server.AI_KINDS, default=None, help="play against this AI, human vs human if not given")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = asyncio.run(run_load(args.clients, args.games, args.ai, args.host, args.port, args.unix, args.seed))
+    print(f"{result['games']} games, {result['requests']} requests in {result['seconds']:.2f}s "
+          f"({result['requests_per_second']:,.0f} requests/s, {result['games_per_second']:,.1f} games/s)")
+    print(f"latency ms: p50 {result['p50_ms']:.2f}, p95 {result['p95_ms']:.2f}, p99 {result['p99_ms']:.2f}, "
+          f"max {result['max_ms']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo tree search (UCT) player.
+
+A move is the same combined (place the piece in hand, piece to give) turn the
+alpha-beta search uses. Winning placements are always taken and pieces that let the
+opponent win immediately are never handed over, both in the tree and in the random
+rollouts. With several workers every process grows its own tree from the root and
+the visit counts of the root moves are added up (root parallelization).
+"""
+import math
+import multiprocessing
+import random
+import time
+
+import bitboard
+import engine
+from search import NO_PIECE, WIN_SCORE, SearchStats, _bits
+
+
+def candidate_moves(board, remaining, hand):
+    """
+    Moves worth considering for the player holding `hand`.
+
+    A winning placement is the only move returned when there is one. Moves that hand over
+    a piece the opponent can win with are dropped unless nothing else is left.
+    """
+    if bitboard.winning_pieces(board) >> hand & 1:
+        for cell in board.empty_cells():
+            if bitboard.is_winning_placement(board, cell, hand):
+                return [(cell, NO_PIECE)]
+    safe_moves = []
+    losing_moves = []
+    for cell in board.empty_cells():
+        board.place(cell, hand)
+        if not remaining:
+            safe_moves.append((cell, NO_PIECE))  # Last piece, the game ends in a draw
+        else:
+            safe = bitboard.safe_pieces(board, remaining)
+            if safe:
+                safe_moves.extend((cell, give) for give in _bits(safe))
+            else:
+                losing_moves.append((cell, _bits(remaining)[0]))
+        board.remove(cell)
+    return safe_moves or losing_moves
+
+
+def rollout(board, remaining, hand, rng):
+    """
+    Plays the game out with the fast policy. The board is modified.
+
+    Returns
+    -------
+    float
+        1 if the player holding `hand` wins, 0.5 for a draw, 0 for a loss.
+    """
+    reward = 1.0
+    while True:
+        if bitboard.winning_pieces(board) >> hand & 1:
+            return reward
+        board.place(rng.choice(board.empty_cells()), hand)
+        if not remaining:
+            return 0.5
+        safe = bitboard.safe_pieces(board, remaining)
+        hand = rng.choice(_bits(safe or remaining))
+        remaining &= ~(1 << hand)
+        reward = 1.0 - reward
+
+
+class Node:
+    """
+    Tree node reached by playing `move`.
+
+    wins is the total reward for the player who made the move, so a parent picks
+    the child with the best wins / visits for itself.
+    """
+    __slots__ = ("move", "children", "untried", "visits", "wins", "terminal")
+
+    def __init__(self, move=None, terminal=None):
+        self.move = move
+        self.children = []
+        self.untried = None  # Filled in the first time the node is expanded
+        self.visits = 0
+        self.wins = 0.0
+        self.terminal = terminal  # Reward for the player who made the move if the game ended here
+
+    def select_child(self, exploration):
+        log_visits = math.log(self.visits)
+        return max(self.children,
+                   key=lambda child: child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits))
+
+
+def _play(board, remaining, hand, move):
+    """Applies a move. Returns (remaining, hand, terminal reward for the mover or None)."""
+    cell, give = move
+    board.place(cell, hand)
+    if bitboard.find_win_at(board, cell):
+        return remaining, NO_PIECE, 1.0
+    if give == NO_PIECE:
+        return remaining, NO_PIECE, 0.5
+    return remaining & ~(1 << give), give, None
+
+
+def search_root(cells, remaining, hand, iterations=None, time_limit=None, exploration=1.4, seed=None, stop=None):
+    """
+    Grows one UCT tree from a position.
+
+    Parameters
+    ----------
+    cells : list
+        Piece code per cell, bitboard.EMPTY for free cells.
+    iterations, time_limit :
+        Stop after this many iterations or seconds, whichever comes first. At least one iteration runs.
+    stop : threading.Event
+        Set from another thread to end the search early. Optional.
+
+    Returns
+    -------
+    dict
+        Root move -> (visits, wins).
+    """
+    rng = random.Random(seed)
+    root_board = bitboard.Board()
+    for cell, code in enumerate(cells):
+        if code != bitboard.EMPTY:
+            root_board.place(cell, code)
+    root = Node()
+    root.untried = candidate_moves(root_board, remaining, hand)
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+
+    done = 0
+    while True:
+        board = root_board.copy()
+        node_remaining, node_hand = remaining, hand
+        node = root
+        path = [root]
+
+        # Selection
+        while not node.untried and node.children and node.terminal is None:
+            node = node.select_child(exploration)
+            node_remaining, node_hand, _ = _play(board, node_remaining, node_hand, node.move)
+            path.append(node)
+
+        # Expansion
+        if node.terminal is None:
+            if node.untried is None:
+                node.untried = candidate_moves(board, node_remaining, node_hand)
+            if node.untried:
+                move = node.untried.pop(rng.randrange(len(node.untried)))
+                node_remaining, node_hand, terminal = _play(board, node_remaining, node_hand, move)
+                child = Node(move, terminal)
+                node.children.append(child)
+                node = child
+                path.append(node)
+
+        # Simulation. The reward is for the player who made the last move on the path
+        if node.terminal is not None:
+            reward = node.terminal
+        else:
+            reward = 1.0 - rollout(board, node_remaining, node_hand, rng)
+
+        # Backpropagation
+        for visited in reversed(path):
+            visited.visits += 1
+            visited.wins += reward
+            reward = 1.0 - reward
+
+        done += 1
+        if iterations is not None and done >= iterations:
+            break
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        if iterations is None and deadline is None:
+            break
+        if stop is not None and stop.is_set():
+            break
+    return {child.move: (child.visits, child.wins) for child in root.children}
+
+
+def _search_root_job(args):
+    return search_root(*args)
+
+
+class MCTSPlayer:
+    """
+    UCT player with root parallelization.
+
+    Parameters
+    ----------
+    time_limit : float
+        Seconds per move. None to only use iterations.
+    iterations : int
+        Iterations per worker per move. None to only use the time limit.
+    workers : int
+        Processes growing independent trees. 1 searches in this process.
+    exploration : float
+        UCT exploration constant.
+    """
+
+    def __init__(self, time_limit=1.0, iterations=None, workers=1, exploration=1.4, rng=None):
+        self.time_limit = time_limit
+        self.iterations = iterations
+        self.workers = workers
+        self.exploration = exploration
+        self.rng = rng or random.Random()
+        self.last_visits = 0
+        self.last_stats = None  # search.SearchStats for the last move, nodes are iterations
+        self._pool = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def root_statistics(self, state, stop=None):
+        """Runs the search and returns the merged root move -> (visits, wins) counts. Empty if it was stopped."""
+        jobs = [(state.board.cells[:], state.remaining, state.hand, self.iterations, self.time_limit, self.exploration,
+                 self.rng.getrandbits(64)) for _ in range(self.workers)]
+        if self.workers > 1:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.workers)
+            pending = self._pool.map_async(_search_root_job, jobs)
+            while not pending.ready():
+                pending.wait(0.05)
+                if stop is not None and stop.is_set():
+                    self.close()  # Worker processes can't be interrupted, so throw the pool away
+                    return {}
+            results = pending.get()
+        else:
+            results = [search_root(*jobs[0], stop=stop)]
+        merged = {}
+        for result in results:
+            for move, (visits, wins) in result.items():
+                total_visits, total_wins = merged.get(move, (0, 0.0))
+                merged[move] = (total_visits + visits, total_wins + wins)
+        return merged
+
+    def choose_move(self, state, stop=None):
+        """
+        Chooses where to place the piece in hand and which piece to give next.
+
+        Returns
+        -------
+        tuple
+            (score, cell, give) like engine.AIPlayer. score is the win rate of the move
+            scaled to -WIN_SCORE..WIN_SCORE. None if the search was stopped.
+        """
+        start = time.perf_counter()
+        statistics = self.root_statistics(state, stop)
+        if not statistics:
+            return None
+        move, (visits, wins) = max(statistics.items(), key=lambda item: item[1][0])
+        self.last_visits = sum(visits for visits, _ in statistics.values())
+        score = round((2 * wins / visits - 1) * WIN_SCORE)
+        self.last_stats = SearchStats("mcts", nodes=self.last_visits, seconds=time.perf_counter() - start, score=score)
+        return score, move[0], move[1]
+
+    def choose_give(self, state):
+        """Chooses the first piece of the game, nothing is on the board yet."""
+        return engine.ai_select_token(state, self.rng)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Opening book: precomputed best moves for the first few placements.
+
+The builder lists every symmetry canonical position with up to `plies` pieces on the
+board, searches each one, and stores the best (cell, piece to give) move in the
+canonical frame. Records are fixed size and sorted by key, so the file is binary
+searched straight out of a memory map at runtime.
+
+Usage:
+    python opening_book.py --plies 2 --time 2.0 --output quarto_opening_book.bin
+"""
+import argparse
+import mmap
+import os
+import struct
+import time
+
+import bitboard
+import search
+import symmetry
+from symmetry import KEY_BYTES
+
+MAGIC = b"QOB1"
+HEADER = struct.Struct("<4sB3xQ")  # magic, version, record count
+VERSION = 1
+# Keys are stored big-endian so byte order matches key order
+RECORD = struct.Struct(f">{KEY_BYTES}sBBh")  # key, cell, piece to give, score
+
+
+def canonical_positions(plies):
+    """
+    Lists the canonical positions with up to `plies` pieces on the board.
+
+    Only pieces that don't let the opponent win straight away are handed over, since
+    those are the only positions a search will ever play into.
+
+    Returns
+    -------
+    list
+        Canonical keys, shallowest positions first.
+    """
+    start = symmetry.canonical_key(bitboard.Board(), 0)  # Every first piece is equivalent
+    found = [start]
+    frontier = [start]
+    seen = {start}
+    for _ in range(plies):
+        next_frontier = []
+        for key in frontier:
+            cells, hand = symmetry.decode_key(key)
+            board = bitboard.Board()
+            for cell, code in enumerate(cells):
+                if code != bitboard.EMPTY:
+                    board.place(cell, code)
+            remaining = search.remaining_mask(board, hand)
+            for cell in board.empty_cells():
+                board.place(cell, hand)
+                if not bitboard.find_win_at(board, cell):
+                    safe = bitboard.safe_pieces(board, remaining)
+                    for give in range(bitboard.PIECES):
+                        if safe >> give & 1:
+                            child = symmetry.canonical_key(board, give)
+                            if child not in seen:
+                                seen.add(child)
+                                next_frontier.append(child)
+                board.remove(cell)
+        found.extend(next_frontier)
+        frontier = next_frontier
+    return found
+
+
+def build(plies, time_limit=None, max_nodes=None, table_size=1 << 20, progress=None):
+    """
+    Searches every canonical opening position.
+
+    Returns
+    -------
+    list
+        (key, cell, give, score) records sorted by key, moves in the canonical frame.
+    """
+    searcher = search.Searcher(search.TranspositionTable(table_size), time_limit=time_limit, max_nodes=max_nodes,
+                               symmetry_plies=2)
+    keys = canonical_positions(plies)
+    records = []
+    for done, key in enumerate(keys, 1):
+        cells, hand = symmetry.decode_key(key)
+        board = bitboard.Board()
+        for cell, code in enumerate(cells):
+            if code != bitboard.EMPTY:
+                board.place(cell, code)
+        score, cell, give = searcher.search(board, search.remaining_mask(board, hand), hand)
+        records.append((key, cell, give, score))
+        if progress:
+            progress(done, len(keys))
+    records.sort()
+    return records
+
+
+def write(path, records):
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(records)))
+        for key, cell, give, score in records:
+            file.write(RECORD.pack(key.to_bytes(KEY_BYTES, "big"), cell, give, score))
+
+
+class OpeningBook:
+    """Read-only memory-mapped opening book file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not an opening book file")
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._map.close()
+
+    def _find(self, key):
+        """Binary searches the sorted records. Returns (cell, give, score) in the canonical frame or None."""
+        target = key.to_bytes(KEY_BYTES, "big")
+        data = self._map
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * RECORD.size
+            stored = data[offset:offset + KEY_BYTES]
+            if stored < target:
+                low = middle + 1
+            elif stored > target:
+                high = middle
+            else:
+                return RECORD.unpack_from(data, offset)[1:]
+        return None
+
+    def lookup(self, board, hand):
+        """
+        Looks up the book move for the player holding `hand`.
+
+        Returns
+        -------
+        tuple or None
+            (score, cell, give) mapped back onto this board, the same shape search.Searcher.search returns.
+        """
+        key, transform = symmetry.canonical_form(tuple(board.cells), hand)
+        found = self._find(key)
+        if found is None:
+            return None
+        cell, give, score = found
+        cell, give = symmetry.untransform_move(transform, cell, give)
+        return score, cell, give
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Quarto opening book.")
+    parser.add_argument("--plies", type=int, default=2, help="book covers positions with up to this many pieces placed")
+    parser.add_argument("--time", type=float, default=2.0, help="search time per position in seconds")
+    parser.add_argument("--nodes", type=int, default=None, help="search node budget per position")
+    parser.add_argument("--output", default="quarto_opening_book.bin")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+
+    def progress(done, total):
+        print(f"\r{done}/{total} positions searched", end="", flush=True)
+
+    records = build(args.plies, args.time, args.nodes, progress=progress)
+    print()
+    write(args.output, records)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {len(records)} positions to {args.output} ({os.path.getsize(args.output)} bytes) in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
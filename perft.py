@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Perft: counts every legal move sequence to a fixed depth.
+
+A move is the same combined turn the search plays: place the piece in hand on a
+free cell, then give the opponent any remaining piece. At the start of the game the
+only move is giving the first piece, and a placement that ends the game is a move
+with nothing given. Like chess perft, leaf positions are counted exactly at the
+requested depth, and a game that ends earlier adds nothing deeper down.
+
+The walk runs on engine.GameState with give/place/undo, the same state the Tk
+client and ai_select_token use, so it checks the rules as well as timing them.
+Root moves are split across a process pool. Bigger variants (bitboard.Variant)
+can be counted too, except for --dedup, since symmetry only knows the 4x4 game.
+
+Usage:
+    python perft.py --depth 3 --divide
+    python perft.py --depth 2 --position "SCB0 A1 LCRX" --dedup
+    python perft.py --depth 2 --size 5 --attributes 5
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+import bitboard
+import engine
+import search
+import symmetry
+
+
+def legal_moves(state):
+    """Every legal move: (None, give) before the first placement, otherwise (cell, give) with give no_piece if the game ends."""
+    no_piece = state.variant.no_piece
+    if state.hand == no_piece:
+        return [(None, give) for give in state.legal_gives()]
+    moves = []
+    cells = state.board.empty_cells()
+    # Nothing is given after the placement that fills the board, even on variants with pieces to spare
+    gives = state.legal_gives() if len(cells) > 1 else []
+    for cell in cells:
+        if not gives or bitboard.is_winning_placement(state.board, cell, state.hand):
+            moves.append((cell, no_piece))
+        else:
+            moves.extend((cell, give) for give in gives)
+    return moves
+
+
+def make_move(state, move):
+    cell, give = move
+    if cell is not None:
+        state.place(cell)
+    if give != state.variant.no_piece:
+        state.give(give)
+
+
+def unmake_move(state, move):
+    cell, give = move
+    if give != state.variant.no_piece:
+        state.undo()
+    if cell is not None:
+        state.undo()
+
+
+def perft(state, depth):
+    """Number of leaf positions `depth` moves below the state. The state is restored afterwards."""
+    if depth == 0:
+        return 1
+    if state.is_over:
+        return 0
+    if depth == 1:
+        # Bulk count: the last move doesn't have to be played to be counted
+        return len(legal_moves(state))
+    nodes = 0
+    for move in legal_moves(state):
+        make_move(state, move)
+        nodes += perft(state, depth - 1)
+        unmake_move(state, move)
+    return nodes
+
+
+def collect_leaves(state, depth, exact, canonical):
+    """
+    Walks the tree like perft but plays every leaf, adding its Zobrist key to `exact` and its
+    symmetry canonical key to `canonical`. Returns the leaf count.
+    """
+    if depth == 0:
+        exact.add(search.zobrist_key(state.board, state.hand))
+        canonical.add(symmetry.canonical_key(state.board, state.hand))
+        return 1
+    if state.is_over:
+        return 0
+    nodes = 0
+    for move in legal_moves(state):
+        make_move(state, move)
+        nodes += collect_leaves(state, depth - 1, exact, canonical)
+        unmake_move(state, move)
+    return nodes
+
+
+def parse_position(text, variant=bitboard.STANDARD):
+    """
+    Builds a GameState from alternating piece ids and cell labels, ie. "SCB0 A1 LCRX": give SCB0,
+    place it on A1, give LCRX.
+    """
+    state = engine.GameState(variant=variant)
+    for word in text.split():
+        if state.hand == variant.no_piece:
+            state.give(variant.code_from_id(word.upper()))
+        else:
+            state.place(variant.cell_from_label(word.upper()))
+    return state
+
+
+def move_label(move, variant=bitboard.STANDARD):
+    cell, give = move
+    place = "" if cell is None else variant.cell_label(cell) + " "
+    return place + ("-" if give == variant.no_piece else variant.piece_id(give))
+
+
+def _divide_job(args):
+    history, hand, move, depth, dedup, variant = args
+    state = engine.GameState(variant=variant)
+    for code, cell in history:
+        state.give(code)
+        state.place(cell)
+    if hand != variant.no_piece:
+        state.give(hand)
+    make_move(state, move)
+    if dedup:
+        exact, canonical = set(), set()
+        return move, collect_leaves(state, depth, exact, canonical), exact, canonical
+    return move, perft(state, depth), None, None
+
+
+def divide(state, depth, workers=None, dedup=False, on_result=None):
+    """
+    Runs perft under every root move, spread over a process pool.
+
+    Parameters
+    ----------
+    dedup : bool
+        Also count the distinct leaf positions, exactly and up to symmetry. Every leaf is
+        played and canonicalized, so this is much slower.
+    on_result : callable
+        Called with (move, nodes) as each root move finishes.
+
+    Returns
+    -------
+    dict
+        "moves" maps each root move to its node count, "nodes" is the total, and with dedup
+        "unique" and "canonical" are the distinct leaf counts.
+    """
+    if depth < 1:
+        raise ValueError(f"Depth must be at least 1. You entered: {depth}")
+    if dedup and state.variant is not bitboard.STANDARD:
+        raise ValueError("Symmetry only knows the standard game, so dedup can't count other variants.")
+    moves = legal_moves(state) if not state.is_over else []
+    jobs = [(state.history, state.hand, move, depth - 1, dedup, state.variant) for move in moves]
+    counts = {}
+    exact, canonical = set(), set()
+    with multiprocessing.Pool(workers) as pool:
+        for move, nodes, move_exact, move_canonical in pool.imap_unordered(_divide_job, jobs):
+            counts[move] = nodes
+            if dedup:
+                exact |= move_exact
+                canonical |= move_canonical
+            if on_result:
+                on_result(move, nodes)
+    result = {"moves": counts, "nodes": sum(counts.values())}
+    if dedup:
+        result["unique"] = len(exact)
+        result["canonical"] = len(canonical)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count Quarto move sequences to a fixed depth.")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--position", default="", help='moves so far as piece ids and cell labels, ie. "SCB0 A1 LCRX"')
+    parser.add_argument("--divide", action="store_true", help="print the node count under every root move")
+    parser.add_argument("--dedup", action="store_true", help="also count distinct leaf positions, exactly and up to symmetry")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--size", type=int, default=bitboard.SIZE, help="cells per side of the board")
+    parser.add_argument("--attributes", type=int, default=bitboard.ATTRIBUTES, help="two-valued attributes per piece")
+    parser.add_argument("--no-diagonals", action="store_true", help="the diagonals are not winning lines")
+    parser.add_argument("--squares", action="store_true", help="2x2 squares are winning lines too (4x4 only)")
+    args = parser.parse_args()
+
+    try:
+        variant = bitboard.get_variant(args.size, args.attributes, not args.no_diagonals, args.squares)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.dedup and variant is not bitboard.STANDARD:
+        parser.error("--dedup only works on the standard 4x4 game")
+    try:
+        state = parse_position(args.position, variant)
+    except ValueError as error:
+        parser.error(str(error))
+    start = time.perf_counter()
+    result = divide(state, args.depth, args.workers, args.dedup)
+    elapsed = time.perf_counter() - start
+    if args.divide:
+        for move, nodes in sorted(result["moves"].items(), key=lambda item: move_label(item[0], variant)):
+            print(f"{move_label(move, variant)}: {nodes}")
+    nodes = result["nodes"]
+    print(f"depth {args.depth}: {nodes} nodes in {elapsed:.2f}s ({nodes / max(elapsed, 1e-9):,.0f} nodes/s)")
+    if args.dedup and nodes:
+        print(f"distinct positions: {result['unique']} ({100 * (1 - result['unique'] / nodes):.1f}% transpositions)")
+        print(f"distinct up to symmetry: {result['canonical']} ({100 * (1 - result['canonical'] / nodes):.1f}% duplicates)")
+
+
+if __name__ == "__main__":
+    main()
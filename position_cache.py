@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent cache of searched positions, shared by every AI process on the machine.
+
+Each entry is the best move found for a position, how deep it was searched and
+whether that settles the position (a forced win or loss, or a search to the end of
+the game). Positions are keyed by their symmetry canonical key, stored as the same
+11 bytes as the opening book, so all equivalent positions share one entry and moves
+are kept in the canonical frame.
+
+The store is an SQLite database in WAL mode, so any number of processes can read
+while one writes. Writes and last-use updates are buffered and written in one
+transaction per batch. When a batch takes the table over its size cap, the least
+recently used positions are dropped. The row count is kept in the file and updated by
+every batch, under the same write lock, so no process has to count the table to know
+whether it is over the cap.
+
+Usage:
+    python position_cache.py quarto_positions.db
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import symmetry
+from symmetry import KEY_BYTES
+
+MAX_POSITIONS = 1_000_000  # Size cap of the table
+EVICT_TO = 0.9  # Fraction of the cap left after evicting, so eviction doesn't run on every batch
+BATCH_SIZE = 64  # Buffered writes that trigger a flush
+FLUSH_INTERVAL = 5.0  # Seconds a buffered write may wait before a store flushes it
+BUSY_TIMEOUT = 5.0  # Seconds to wait for another process's write to finish
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    key BLOB PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    cell INTEGER NOT NULL,
+    give INTEGER NOT NULL,
+    proven INTEGER NOT NULL,
+    used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS positions_used ON positions (used);
+CREATE TABLE IF NOT EXISTS counts (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+# A new entry only replaces an old one that it improves on: proven beats unproven, then deeper beats shallower
+UPSERT = """
+INSERT INTO positions (key, depth, score, cell, give, proven, used) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET depth = excluded.depth, score = excluded.score, cell = excluded.cell,
+    give = excluded.give, proven = excluded.proven, used = excluded.used
+WHERE excluded.proven > positions.proven OR (excluded.proven = positions.proven AND excluded.depth > positions.depth)
+"""
+
+
+def encode_key(board, hand):
+    """Compact key of a position: its canonical key as big-endian bytes. Returns (key bytes, transform)."""
+    key, transform = symmetry.canonical_form(tuple(board.cells), hand)
+    return key.to_bytes(KEY_BYTES, "big"), transform
+
+
+def _better(new, old):
+    """True if a (depth, score, cell, give, proven) entry should replace another, the same rule as UPSERT."""
+    return new[4] > old[4] or (new[4] == old[4] and new[0] > old[0])
+
+
+class PositionCache:
+    """
+    Searched positions in an SQLite file. Safe to share between threads and between processes.
+
+    Parameters
+    ----------
+    path : str
+        Database file. Made if it doesn't exist.
+    max_positions : int
+        Size cap. Once a flush takes the table over it, the least recently used positions are
+        dropped until EVICT_TO of the cap are left.
+    batch_size : int
+        Buffered stores that trigger a flush.
+    flush_interval : float
+        Seconds after which the next store flushes, however few are buffered.
+
+    Attributes:
+    hits, misses : int
+        Lookups that found an entry and that didn't.
+    """
+
+    def __init__(self, path, max_positions=MAX_POSITIONS, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.max_positions = max_positions
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        # Used from the AI's worker thread as well as the thread that made it, one at a time thanks to the lock
+        self._connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent, a power cut may only lose the last batches
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pending = {}  # Key bytes -> (depth, score, cell, give, proven) not written yet
+        self._touched = set()  # Keys looked up since the last flush, their last use is updated then
+        self._pending_since = None
+        if self._row_count() is None:  # A new file, or one from before the count was kept
+            self._connection.execute(
+                "INSERT OR IGNORE INTO counts VALUES ('positions', (SELECT COUNT(*) FROM positions))")
+
+    def _row_count(self):
+        row = self._connection.execute("SELECT value FROM counts WHERE name = 'positions'").fetchone()
+        return None if row is None else row[0]
+
+    def __len__(self):
+        self.flush()
+        with self._lock:
+            return self._row_count()
+
+    def lookup(self, board, hand):
+        """
+        Looks up the position with `hand` to place.
+
+        Returns
+        -------
+        tuple or None
+            (depth, (score, cell, give), proven) with the move mapped back onto this board, the
+            same (depth, move) shape Searcher.search takes as `known`.
+        """
+        key, transform = encode_key(board, hand)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._connection.execute(
+                    "SELECT depth, score, cell, give, proven FROM positions WHERE key = ?", (key,)).fetchone()
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched.add(key)
+        depth, score, cell, give, proven = entry
+        cell, give = symmetry.untransform_move(transform, cell, give)
+        return depth, (score, cell, give), bool(proven)
+
+    def store(self, board, hand, depth, move, proven):
+        """
+        Buffers the result of a search of the position with `hand` to place. It is written with the
+        next batch, and only replaces a stored entry that is unproven or shallower.
+        """
+        key, transform = encode_key(board, hand)
+        score, cell, give = move
+        cell, give = symmetry.transform_move(transform, cell, give)
+        entry = (depth, score, cell, give, int(proven))
+        with self._lock:
+            old = self._pending.get(key)
+            if old is None or _better(entry, old):
+                self._pending[key] = entry
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            due = len(self._pending) >= self.batch_size or time.monotonic() - self._pending_since >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered entries and last-use times in one transaction, then evicts if the table is over its cap."""
+        with self._lock:
+            if not self._pending and not self._touched:
+                return
+            now = time.time()
+            connection = self._connection
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    if self._pending:
+                        keys = list(self._pending)
+                        stored = connection.execute(
+                            f"SELECT COUNT(*) FROM positions WHERE key IN ({', '.join('?' * len(keys))})", keys).fetchone()[0]
+                        connection.executemany(UPSERT, [(key,) + entry + (now,) for key, entry in self._pending.items()])
+                        self._evict(connection, self._row_count() + len(keys) - stored)
+                    connection.executemany("UPDATE positions SET used = ? WHERE key = ?",
+                                           [(now, key) for key in self._touched if key not in self._pending])
+                    connection.execute("COMMIT")
+                except BaseException:
+                    connection.execute("ROLLBACK")
+                    raise
+            except sqlite3.OperationalError:
+                return  # Another process held the lock past BUSY_TIMEOUT. Keep the batch for the next flush
+            self._pending.clear()
+            self._touched.clear()
+            self._pending_since = None
+
+    def _evict(self, connection, count):
+        """Drops the least recently used rows if `count` rows are over the cap, then stores the new count."""
+        if count > self.max_positions:
+            evicted = count - int(self.max_positions * EVICT_TO)
+            connection.execute("DELETE FROM positions WHERE key IN (SELECT key FROM positions ORDER BY used LIMIT ?)",
+                               (evicted,))
+            count -= evicted
+        connection.execute("UPDATE counts SET value = ? WHERE name = 'positions'", (count,))
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show what is in a Quarto position cache.")
+    parser.add_argument("path", help="cache database, ie. quarto_positions.db")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} does not exist")
+
+    cache = PositionCache(args.path)
+    connection = cache._connection
+    count, proven, depth = connection.execute("SELECT COUNT(*), SUM(proven), AVG(depth) FROM positions").fetchone()
+    print(f"{count} positions, {proven or 0} proven, average depth {depth or 0:.1f}")
+    for depth, positions, proven in connection.execute(
+            "SELECT depth, COUNT(*), SUM(proven) FROM positions GROUP BY depth ORDER BY depth"):
+        print(f"  depth {depth:2d}: {positions} positions, {proven} proven")
+    size = sum(os.path.getsize(args.path + suffix) for suffix in ("", "-wal") if os.path.exists(args.path + suffix))
+    print(f"{size / 1e6:.1f} MB on disk")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary game records.
+
+A record file is a small header followed by one fixed-size slot per game: the
+number of plies, the result, then a (piece given, cell placed) byte pair for every
+placement, padded out to the 16 plies of a full board. That is 2 bytes per ply
+plus 2 per game. Slots never change size, so game `index` is found with one
+multiplication, files can only be appended to, and a crash mid-write leaves at
+most a partial last slot, which is ignored when reading and cut off when the
+writer reopens the file.
+
+Usage:
+    python records.py quarto_games.qgr --show 0
+"""
+import argparse
+import mmap
+import os
+import struct
+
+import bitboard
+import engine
+
+MAGIC = b"QGR1"
+HEADER = struct.Struct("<4sBB2x")  # magic, version, plies per slot
+VERSION = 1
+MAX_PLIES = bitboard.CELLS
+GAME_HEADER = struct.Struct("<BB")  # plies, result
+MOVE = struct.Struct("<BB")  # piece given, cell placed
+GAME_SIZE = GAME_HEADER.size + MAX_PLIES * MOVE.size
+PADDING = b"\xff" * MOVE.size
+
+# Results. 0 and 1 are the index of the winning player, player 1 places first
+DRAW = 2
+UNFINISHED = 3
+READ_CHUNK = 4096  # Games read per file read when streaming
+
+
+def game_result(state):
+    """Result code for a GameState."""
+    if state.winner is not None:
+        return state.winner
+    return DRAW if state.is_over else UNFINISHED
+
+
+def encode_game(history, result):
+    """Packs a game into its fixed-size slot."""
+    if len(history) > MAX_PLIES:
+        raise ValueError(f"A game has at most {MAX_PLIES} plies. Got {len(history)}")
+    moves = b"".join(MOVE.pack(give, cell) for give, cell in history)
+    return GAME_HEADER.pack(len(history), result) + moves + PADDING * (MAX_PLIES - len(history))
+
+
+def decode_game(data, offset=0):
+    """
+    Unpacks the slot at `offset`.
+
+    Returns
+    -------
+    tuple
+        (history, result). history is a list of (piece given, cell placed) like GameState.history.
+    """
+    plies, result = GAME_HEADER.unpack_from(data, offset)
+    start = offset + GAME_HEADER.size
+    history = [MOVE.unpack_from(data, start + ply * MOVE.size) for ply in range(plies)]
+    return history, result
+
+
+def replay(history, players=("Player 1", "Player 2")):
+    """Plays a recorded game into a GameState. The rules are checked on every ply."""
+    state = engine.GameState(players)
+    for give, cell in history:
+        state.give(give)
+        state.place(cell)
+    return state
+
+
+def _check_header(data, path):
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a game record file")
+    magic, version, plies = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or plies != MAX_PLIES:
+        raise ValueError(f"{path} is not a game record file")
+
+
+class RecordWriter:
+    """
+    Appends games to a record file, creating it if it doesn't exist.
+
+    Games are buffered by the file object. Call flush() to make sure they are on disk,
+    or use the writer as a context manager.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a+b")
+        self._file.seek(0, os.SEEK_END)
+        size = self._file.tell()
+        if size == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, MAX_PLIES))
+        else:
+            self._file.seek(0)
+            try:
+                _check_header(self._file.read(HEADER.size), path)
+            except ValueError:
+                self._file.close()
+                raise
+            # Drop a slot that was only partly written when the last writer died
+            complete = size - (size - HEADER.size) % GAME_SIZE
+            if complete != size:
+                self._file.truncate(complete)
+            self._file.seek(0, os.SEEK_END)
+
+    def append(self, history, result):
+        """Writes one game. result is the winning player index, DRAW or UNFINISHED."""
+        self._file.write(encode_game(history, result))
+
+    def append_game(self, state):
+        """Writes the moves and result of a GameState."""
+        self.append(state.history, game_result(state))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_games(path, start=0):
+    """
+    Streams the games in a record file without loading it all.
+
+    Yields
+    ------
+    tuple
+        (history, result) for every game from index `start` on.
+    """
+    with open(path, "rb") as file:
+        _check_header(file.read(HEADER.size), path)
+        file.seek(HEADER.size + start * GAME_SIZE)
+        while True:
+            chunk = file.read(READ_CHUNK * GAME_SIZE)
+            for offset in range(0, len(chunk) - GAME_SIZE + 1, GAME_SIZE):
+                yield decode_game(chunk, offset)
+            if len(chunk) < READ_CHUNK * GAME_SIZE:
+                return
+
+
+class GameRecords:
+    """Read-only memory-mapped record file with random access by game index."""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            _check_header(file.read(HEADER.size), path)
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = (len(self._map) - HEADER.size) // GAME_SIZE
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._map.close()
+
+    def __getitem__(self, index):
+        """(history, result) of game `index`. Negative indices count from the end."""
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(f"Game {index} is out of range. The file has {self.count} games")
+        return decode_game(self._map, HEADER.size + index * GAME_SIZE)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def replay(self, index):
+        """Game `index` as a GameState."""
+        return replay(self[index][0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a Quarto game record file.")
+    parser.add_argument("path")
+    parser.add_argument("--show", type=int, action="append", default=[], help="print the moves of this game index")
+    args = parser.parse_args()
+
+    counts = [0] * (UNFINISHED + 1)
+    plies = 0
+    for history, result in iter_games(args.path):
+        counts[result] += 1
+        plies += len(history)
+    games = sum(counts)
+    print(f"{games} games, {plies} plies, {os.path.getsize(args.path)} bytes")
+    if games:
+        print(f"player 1 won {counts[0]}, player 2 won {counts[1]}, draws {counts[DRAW]}, unfinished {counts[UNFINISHED]}")
+
+    if args.show:
+        records = GameRecords(args.path)
+        for index in args.show:
+            history, result = records[index]
+            moves = ", ".join(f"{bitboard.id_from_code(give)} {bitboard.label_from_cell(cell)}" for give, cell in history)
+            outcome = {DRAW: "draw", UNFINISHED: "unfinished"}.get(result, f"player {result + 1} won")
+            print(f"game {index}: {moves} ({outcome})")
+        records.close()
+
+
+if __name__ == "__main__":
+    main()
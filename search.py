@@ -0,0 +1,498 @@
+# -*- coding: utf-8 -*-
+"""
+Alpha-beta search used by the AI to place a piece and pick the next one.
+
+A move is the combined turn of a player: place the piece in hand on a free cell,
+then choose the piece the opponent has to place. Scores are negamax style, from the
+point of view of the player holding the piece. A win is WIN_SCORE minus the number
+of plies it takes so faster wins are preferred, a draw or an unresolved position is 0.
+
+The search plays any bitboard.Variant the board was made with. The symmetry table,
+tablebase and evaluator only know the standard 4x4 game.
+"""
+import random
+import time
+
+import bitboard
+import symmetry
+from bitboard import CELLS, EMPTY, PIECES
+
+WIN_SCORE = 1000
+MATE_BOUND = WIN_SCORE - bitboard.MAX_SIZE ** 2 - 1  # Any score above this is a forced win, on any board size
+
+# Transposition table bound flags
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+NO_PIECE = PIECES  # Used when there is no piece in hand or nothing left to give. Variant.no_piece on other boards
+
+
+def _make_zobrist(variant):
+    # Fixed seed so keys are the same in every process
+    rng = random.Random(0x51A7)
+    placed = tuple(tuple(rng.getrandbits(64) for _ in range(variant.pieces)) for _ in range(variant.cells))
+    hand = tuple(rng.getrandbits(64) for _ in range(variant.pieces + 1))
+    return placed, hand
+
+
+_zobrist_tables = {bitboard.STANDARD: _make_zobrist(bitboard.STANDARD)}
+ZOBRIST_PLACED, ZOBRIST_HAND = _zobrist_tables[bitboard.STANDARD]
+
+
+def zobrist_tables(variant):
+    """(placed, hand) Zobrist keys of a variant, indexed placed[cell][code] and hand[code or no_piece]."""
+    tables = _zobrist_tables.get(variant)
+    if tables is None:
+        tables = _zobrist_tables[variant] = _make_zobrist(variant)
+    return tables
+
+
+def zobrist_key(board, hand):
+    """Hashes the pieces on the board and the piece in hand into a 64-bit key."""
+    placed, hands = zobrist_tables(board.variant)
+    key = hands[hand]
+    for cell, code in enumerate(board.cells):
+        if code != EMPTY:
+            key ^= placed[cell][code]
+    return key
+
+
+def remaining_mask(board, hand):
+    """Returns the mask of pieces that are neither on the board nor in hand."""
+    variant = board.variant
+    remaining = variant.all_pieces
+    for code in board.cells:
+        if code != EMPTY:
+            remaining &= ~(1 << code)
+    if hand != variant.no_piece:
+        remaining &= ~(1 << hand)
+    return remaining
+
+
+def _bits(mask):
+    """Lists the set bit positions of a mask, lowest first."""
+    return [index for index in range(mask.bit_length()) if mask >> index & 1]
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when the node or time budget runs out or the search is stopped."""
+
+
+class TranspositionTable:
+    """
+    Fixed size hash table of already searched positions.
+
+    Parameters
+    ----------
+    size : int
+        Number of slots. Rounded up to a power of two.
+    replacement : str
+        "depth" keeps the deeper of two colliding entries, "always" overwrites the old one.
+    """
+    REPLACEMENT_POLICIES = ("depth", "always")
+
+    def __init__(self, size=1 << 18, replacement="depth"):
+        if replacement not in self.REPLACEMENT_POLICIES:
+            raise ValueError(f"Replacement policy must be one of {self.REPLACEMENT_POLICIES}. You entered: {replacement}")
+        slots = 1
+        while slots < size:
+            slots <<= 1
+        self.mask = slots - 1
+        self.replacement = replacement
+        self.slots = [None] * slots
+
+    def __len__(self):
+        return len(self.slots)
+
+    def probe(self, key):
+        """Returns the (key, depth, flag, score, move) entry for the key or None."""
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        index = key & self.mask
+        old = self.slots[index]
+        if self.replacement == "depth" and old is not None and old[0] != key and old[1] > depth:
+            return
+        self.slots[index] = (key, depth, flag, score, move)
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+
+
+class SearchStats:
+    """
+    What the AI did to choose one move. Used to tune the engine and check that the caches pay off.
+
+    Attributes:
+    source : str
+        "search", "book", "ponder", "cache" or "mcts".
+    nodes : int
+        Nodes visited, or MCTS iterations.
+    cutoffs : int
+        Beta cutoffs in the move loop.
+    table_probes, table_hits : int
+        Transposition table lookups and how many of them found an entry.
+    tablebase_probes, tablebase_hits : int
+        Endgame tablebase lookups and how many of them found the position.
+    depth : int
+        Deepest completed iteration.
+    seconds : float
+        Time spent on the move.
+    score : int
+        Score of the chosen move, None if there was none.
+    """
+
+    def __init__(self, source="search", nodes=0, cutoffs=0, table_probes=0, table_hits=0, tablebase_probes=0,
+                 tablebase_hits=0, depth=0, seconds=0.0, score=None):
+        self.source = source
+        self.nodes = nodes
+        self.cutoffs = cutoffs
+        self.table_probes = table_probes
+        self.table_hits = table_hits
+        self.tablebase_probes = tablebase_probes
+        self.tablebase_hits = tablebase_hits
+        self.depth = depth
+        self.seconds = seconds
+        self.score = score
+
+    @property
+    def table_hit_rate(self):
+        return self.table_hits / self.table_probes if self.table_probes else 0.0
+
+    @property
+    def tablebase_hit_rate(self):
+        return self.tablebase_hits / self.tablebase_probes if self.tablebase_probes else 0.0
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self):
+        """Plain dict for JSON, including the derived rates."""
+        stats = dict(vars(self))
+        stats["table_hit_rate"] = self.table_hit_rate
+        stats["tablebase_hit_rate"] = self.tablebase_hit_rate
+        stats["nodes_per_second"] = self.nodes_per_second
+        return stats
+
+    def __repr__(self):
+        return (f"SearchStats({self.source}, {self.nodes} nodes, depth {self.depth}, {self.cutoffs} cutoffs, "
+                f"table hits {self.table_hit_rate:.0%}, {self.seconds:.3f}s)")
+
+
+class Searcher:
+    """
+    Iterative deepening negamax search with alpha-beta pruning and a transposition table.
+
+    Parameters
+    ----------
+    table : TranspositionTable
+        Table shared between searches. A new one is made if not given.
+    max_nodes : int
+        Stop after visiting this many nodes. None for no limit.
+    time_limit : float
+        Stop after this many seconds. None for no limit.
+    max_depth : int
+        Deepest iteration in moves. None searches to the end of the game.
+    symmetry_plies : int
+        Nodes closer to the root than this are stored in the table under their symmetry
+        canonical key, so equivalent positions share one entry. Canonicalizing costs far
+        more than a Zobrist update, so it only pays off near the root. 0 turns it off.
+    tablebase : tablebase.Tablebase
+        Exact endgame results. Probed below the root at nodes closer to it than
+        tablebase_plies that have few enough empty cells. None turns it off.
+    evaluator : evaluator.Evaluator
+        Scores positions at the search horizon. All the leaves below a node are scored
+        with one evaluate_batch call. None scores them all 0.
+
+    The first iteration always finishes so there is a move to play even on a tiny budget.
+    After every search, `stats` holds a SearchStats for it.
+    """
+
+    def __init__(self, table=None, max_nodes=None, time_limit=None, max_depth=None, symmetry_plies=0,
+                 tablebase=None, tablebase_plies=2, evaluator=None):
+        self.table = table if table is not None else TranspositionTable()
+        self.max_nodes = max_nodes
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.symmetry_plies = symmetry_plies
+        self.tablebase = tablebase
+        self.tablebase_plies = tablebase_plies
+        self.evaluator = evaluator
+        self.nodes = 0
+        self.depth_reached = 0
+        self.cutoffs = 0
+        self.table_probes = 0
+        self.table_hits = 0
+        self.tablebase_probes = 0
+        self.tablebase_hits = 0
+        self.stats = None
+        self._deadline = None
+        self._enforce_budget = False
+        self._stop = None
+        self._root_move = None
+        self._zobrist = (ZOBRIST_PLACED, ZOBRIST_HAND)
+        self._no_piece = NO_PIECE
+        self._root_cells = None
+
+    def search(self, board, remaining, hand, stop=None, known=None, cells=None):
+        """
+        Finds the best move for the player holding a piece.
+
+        Parameters
+        ----------
+        board : bitboard.Board
+            Current board. It is copied, never modified.
+        remaining : int
+            Mask of the pieces that are not on the board and not in hand.
+        hand : int
+            Code of the piece that has to be placed.
+        stop : threading.Event
+            Set from another thread to end the search early. Optional.
+        known : tuple
+            (depth, (score, cell, give)) already found for this position, e.g. while pondering.
+            Deepening carries on from the next depth, and the known move is returned if no
+            deeper iteration finishes. Optional.
+        cells : list
+            Only place on these cells, e.g. to score one placement on its own. The result is
+            the best move among them, and it isn't stored in the table as the position's value.
+            Has to be a non-empty subset of the empty cells, ValueError otherwise. Optional.
+
+        Returns
+        -------
+        tuple
+            (score, cell, give). give is NO_PIECE (the variant's no_piece) when the move ends the
+            game. None if the search was stopped before the first iteration finished.
+        """
+        variant = board.variant
+        if variant is not bitboard.STANDARD and (self.symmetry_plies or self.tablebase is not None
+                                                 or self.evaluator is not None):
+            raise ValueError(f"Symmetry, tablebase and evaluator only know the standard game, not {variant}.")
+        if cells is not None and (not cells or not set(cells) <= set(board.empty_cells())):
+            raise ValueError(f"cells must be empty cells of the board, at least one. You entered: {cells}")
+        board = board.copy()
+        start = time.perf_counter()
+        self.nodes = 0
+        self.depth_reached = 0
+        self.cutoffs = 0
+        self.table_probes = 0
+        self.table_hits = 0
+        self.tablebase_probes = 0
+        self.tablebase_hits = 0
+        self._deadline = None if self.time_limit is None else start + self.time_limit
+        self._enforce_budget = False
+        self._stop = stop
+        self._zobrist = zobrist_tables(variant)
+        self._no_piece = variant.no_piece
+        self._root_cells = cells
+
+        empties = variant.cells - bin(board.occupied).count("1")
+        max_depth = empties if self.max_depth is None else min(self.max_depth, empties)
+        key = zobrist_key(board, hand)
+        best = None
+        if known is not None:
+            self.depth_reached, best = known
+            self._enforce_budget = True
+        for depth in range(self.depth_reached + 1, max_depth + 1):
+            try:
+                score = self._negamax(board, remaining, hand, key, depth, -WIN_SCORE - 1, WIN_SCORE + 1, 0)
+            except SearchAborted:
+                break
+            best = (score,) + self._root_move
+            self.depth_reached = depth
+            self._enforce_budget = True
+            if abs(score) > MATE_BOUND:  # Result is already proven, deeper search can't change it
+                break
+        self.stats = SearchStats("search", self.nodes, self.cutoffs, self.table_probes, self.table_hits,
+                                 self.tablebase_probes, self.tablebase_hits, self.depth_reached, time.perf_counter() - start,
+                                 None if best is None else best[0])
+        return best
+
+    def evaluate(self, board, remaining, hand):
+        """Score for a position at the search horizon. Without an evaluator nothing is known about it, so 0."""
+        if self.evaluator is None:
+            return 0
+        return self.evaluator.evaluate(board, remaining, hand)
+
+    def _score_leaves(self, board, remaining, hand, cells):
+        """
+        Scores every child of a depth 1 node with one evaluator call. Only safe pieces are given,
+        so no child can be won on the spot and each one would go straight to evaluate().
+
+        Returns
+        -------
+        dict
+            (cell, give) -> score for the player given the piece.
+        """
+        moves, lines, winning, masks, hands = [], [], [], [], []
+        for cell in cells:
+            board.place(cell, hand)
+            placed_lines = board.lines[:]
+            placed_winning = bitboard.winning_pieces(board)
+            for give in _bits(remaining & ~placed_winning):
+                moves.append((cell, give))
+                lines.append(placed_lines)
+                winning.append(placed_winning)
+                masks.append(remaining & ~(1 << give))
+                hands.append(give)
+            board.remove(cell)
+        if not moves:
+            return {}
+        self.nodes += len(moves)
+        self._check_budget()
+        return dict(zip(moves, self.evaluator.evaluate_batch(lines, winning, masks, hands)))
+
+    def _check_budget(self):
+        if self._stop is not None and self._stop.is_set():
+            raise SearchAborted()
+        if not self._enforce_budget:
+            return
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchAborted()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchAborted()
+
+    def _negamax(self, board, remaining, hand, key, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self._check_budget()
+
+        # Winning placements are always tried first and end the search of this node
+        if bitboard.winning_pieces(board) >> hand & 1:
+            if ply > 0:
+                return WIN_SCORE - ply
+            for cell in board.empty_cells() if self._root_cells is None else self._root_cells:
+                if bitboard.is_winning_placement(board, cell, hand):
+                    self._root_move = (cell, self._no_piece)
+                    return WIN_SCORE
+            # None of the cells the root may use wins, so they are searched like any others
+
+        if self.tablebase is not None and 0 < ply < self.tablebase_plies:
+            empties = CELLS - bin(board.occupied).count("1")
+            if empties <= self.tablebase.max_empty:
+                self.tablebase_probes += 1
+                result = self.tablebase.probe(board, hand)
+                if result is not None:
+                    self.tablebase_hits += 1
+                    # The table has no win distance, so assume the game runs to the last cell
+                    return result * (WIN_SCORE - ply - empties)
+
+        if depth == 0:
+            return self.evaluate(board, remaining, hand)
+
+        alpha_original = alpha
+        table_key = key
+        transform = None
+        if ply < self.symmetry_plies:
+            table_key, transform = symmetry.canonical_form(tuple(board.cells), hand)
+
+        tt_move = None
+        entry = self.table.probe(table_key)
+        self.table_probes += 1
+        if entry is not None:
+            self.table_hits += 1
+            _, entry_depth, flag, score, tt_move = entry
+            if transform is not None and tt_move is not None:
+                tt_move = symmetry.untransform_move(transform, *tt_move)
+            if entry_depth >= depth and ply > 0:
+                score = _score_from_table(score, ply)
+                if flag == EXACT:
+                    return score
+                if flag == LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+
+        # Move ordering: the move stored in the table goes first
+        cells = board.empty_cells()
+        if ply == 0 and self._root_cells is not None:
+            cells = [cell for cell in cells if cell in self._root_cells]
+        if tt_move is not None and tt_move[0] in cells:
+            cells.remove(tt_move[0])
+            cells.insert(0, tt_move[0])
+
+        leaf_scores = None
+        if depth == 1 and self.evaluator is not None and (self.tablebase is None or ply + 1 >= self.tablebase_plies):
+            leaf_scores = self._score_leaves(board, remaining, hand, cells)
+
+        best_score = -WIN_SCORE - 1
+        best_move = None
+        placed_keys, hand_keys = self._zobrist
+        no_piece = self._no_piece
+        full_mask = board.variant.full_mask
+        for cell in cells:
+            board.place(cell, hand)
+            if not remaining or board.occupied == full_mask:
+                # The board is full without a win, nothing to give. Variants with more pieces than cells get here with some left
+                gives = [no_piece]
+            else:
+                # Never hand over a piece the opponent can win with straight away
+                gives = _bits(bitboard.safe_pieces(board, remaining))
+                if tt_move is not None and tt_move[0] == cell and tt_move[1] in gives:
+                    gives.remove(tt_move[1])
+                    gives.insert(0, tt_move[1])
+
+            if not gives:
+                # Every piece we could give lets the opponent win next ply
+                score = -(WIN_SCORE - ply - 1)
+                if score > best_score:
+                    best_score = score
+                    best_move = (cell, _bits(remaining)[0])
+                alpha = max(alpha, score)
+            else:
+                child_key = key ^ placed_keys[cell][hand] ^ hand_keys[hand]
+                for give in gives:
+                    if give == no_piece:
+                        score = 0
+                    elif leaf_scores is not None:
+                        score = -leaf_scores[cell, give]
+                    else:
+                        score = -self._negamax(board, remaining & ~(1 << give), give, child_key ^ hand_keys[give],
+                                               depth - 1, -beta, -alpha, ply + 1)
+                    if score > best_score:
+                        best_score = score
+                        best_move = (cell, give)
+                    if score > alpha:
+                        alpha = score
+                        if alpha >= beta:
+                            self.cutoffs += 1
+                            break
+            board.remove(cell)
+            if alpha >= beta:
+                break
+
+        if best_score <= alpha_original:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        if ply > 0 or self._root_cells is None:  # A root limited to some cells doesn't have the position's value
+            stored_move = best_move if transform is None else symmetry.transform_move(transform, *best_move)
+            self.table.store(table_key, depth, flag, _score_to_table(best_score, ply), stored_move)
+        if ply == 0:
+            self._root_move = best_move
+        return best_score
+
+
+def _score_to_table(score, ply):
+    """Stores wins as distance from the node instead of from the root."""
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _score_from_table(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio game server hosting many independent Quarto games.
+
+Clients talk line-delimited JSON over TCP or a Unix socket. Every request is one
+object with an "op" and gets exactly one response line back, echoing "id" if the
+request had one:
+
+    {"op": "new", "ai": "search"}           -> {"ok": true, "game": 1, "state": {...}}
+    {"op": "give", "game": 1, "piece": "SCB0"}
+    {"op": "place", "game": 1, "cell": "A1"}
+    {"op": "state", "game": 1}
+    {"op": "close", "game": 1}
+    {"op": "stats"}
+
+Games without "ai" are human vs human and either side may send the moves. In AI
+games the AI answers inside the same request: giving a piece to the AI returns the
+state after the AI has placed it and given one back. AI moves run on a process pool,
+so the event loop keeps serving other games while they think. Errors come back as
+{"ok": false, "error": "..."}.
+
+Usage:
+    python server.py --port 8765 --workers 4
+    python server.py --unix /tmp/quarto.sock
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import time
+
+import bitboard
+import engine
+import records
+import tournament
+from search import NO_PIECE
+
+DEFAULT_PORT = 8765
+AI_KINDS = tournament.PLAYER_TYPES
+MAX_LINE = 1 << 16  # Longest request accepted, in bytes
+
+
+class Session:
+    """
+    One hosted game.
+
+    Attributes:
+    state : engine.GameState
+        The game.
+    ai : str
+        Player kind from tournament.PLAYER_TYPES playing seat ai_seat, None for human vs human.
+    ai_seat : int
+        Index of the AI player. Player 2 (1) gives the first piece, like in the Tk client.
+    busy : bool
+        True while the AI is thinking. Moves for the game are refused until it is done.
+    last_ai : tuple
+        (cell, give) of the AI's last move, give NO_PIECE if it ended the game.
+    """
+    __slots__ = ("state", "ai", "ai_seat", "busy", "last_ai")
+
+    def __init__(self, state, ai=None, ai_seat=1):
+        self.state = state
+        self.ai = ai
+        self.ai_seat = ai_seat
+        self.busy = False
+        self.last_ai = None
+
+
+def state_to_json(session):
+    """Compact JSON view of a game. Pieces are token ids and cells are indexed A1 = 0 like bitboard."""
+    state = session.state
+    if state.is_over:
+        action = "over"
+    elif state.hand == NO_PIECE:
+        action = "give"
+    else:
+        action = "place"
+    view = {
+        "board": [None if code == bitboard.EMPTY else bitboard.id_from_code(code) for code in state.board.cells],
+        "hand": None if state.hand == NO_PIECE else bitboard.id_from_code(state.hand),
+        "turn": state.turn,
+        "action": action,
+        "winner": state.winner,
+        "plies": len(state.history),
+    }
+    if session.last_ai is not None:
+        cell, give = session.last_ai
+        view["ai_move"] = {"cell": bitboard.label_from_cell(cell),
+                           "give": None if give == NO_PIECE else bitboard.id_from_code(give)}
+    return view
+
+
+# AI players live for the whole worker process, one per kind, so book and tablebase files are opened once
+_worker_players = {}
+_worker_options = {}
+
+
+def _init_worker(time_limit, max_nodes, iterations):
+    _worker_options.update(time_limit=time_limit, max_nodes=max_nodes, iterations=iterations)
+
+
+def _ai_move(kind, history, hand):
+    """Runs in a worker process. Returns the (cell, give) the AI plays, give NO_PIECE if the placement ends the game."""
+    player = _worker_players.get(kind)
+    if player is None:
+        player = _worker_players[kind] = tournament.make_player(kind, **_worker_options)
+    state = records.replay(history)
+    state.give(hand)
+    _, cell, give = player.choose_move(state)
+    state.place(cell)
+    if not state.is_over and give == NO_PIECE:
+        give = player.choose_give(state)
+    return cell, NO_PIECE if state.is_over else give
+
+
+class GameServer:
+    """
+    Holds the games and answers requests. Transport independent, see serve().
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+        Where AI moves are computed. Calls _ai_move.
+    max_games : int
+        New games are refused once this many are open.
+    """
+
+    def __init__(self, executor, max_games=100000):
+        self.executor = executor
+        self.max_games = max_games
+        self.games = {}
+        self.next_game = 1
+        self.requests = 0
+        self.ai_moves = 0
+        self.ai_seconds = 0.0
+        self.started = time.perf_counter()
+
+    async def handle(self, request):
+        """Answers one request dict with a response dict."""
+        self.requests += 1
+        op = request.get("op")
+        handler = getattr(self, f"op_{op}", None) if isinstance(op, str) else None
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown op: {op}")
+            response = await handler(request)
+        except ValueError as error:
+            response = {"ok": False, "error": str(error)}
+        except Exception as error:  # A bug or a broken AI worker must not cost the client its connection
+            response = {"ok": False, "error": f"Internal error: {error!r}"}
+        if "id" in request:
+            response["id"] = request["id"]
+        return response
+
+    @staticmethod
+    def _field(request, name):
+        if name not in request:
+            raise ValueError(f"Missing field: {name}")
+        return str(request[name]).upper()
+
+    @staticmethod
+    def _game(request):
+        """The game id of a request. Ids are ints, anything else is refused before it is used as a dict key."""
+        game = request.get("game")
+        if type(game) is not int:
+            raise ValueError(f"game must be an integer. You entered: {game!r}")
+        return game
+
+    def _session(self, request, busy_ok=False):
+        game = self._game(request)
+        session = self.games.get(game)
+        if session is None:
+            raise ValueError(f"No such game: {game}")
+        if session.busy and not busy_ok:
+            raise ValueError("The AI is still thinking about this game.")
+        return session
+
+    @staticmethod
+    def _piece(token_id):
+        if len(token_id) != bitboard.ATTRIBUTES:
+            raise ValueError(f"Invalid token id: {token_id}")
+        return bitboard.code_from_id(token_id)
+
+    @staticmethod
+    def _cell(label):
+        return bitboard.STANDARD.cell_from_label(label)
+
+    def _reply(self, game, session):
+        return {"ok": True, "game": game, "state": state_to_json(session)}
+
+    async def op_new(self, request):
+        if len(self.games) >= self.max_games:
+            raise ValueError("Too many open games.")
+        ai = request.get("ai")
+        if ai is not None and ai not in AI_KINDS:
+            raise ValueError(f"ai must be one of {AI_KINDS}. You entered: {ai}")
+        ai_seat = request.get("ai_seat", 1)
+        if not (type(ai_seat) is int and ai_seat in (0, 1)):  # True == 1, so bools would get through
+            raise ValueError("ai_seat must be 0 or 1.")
+        players = ("Player 1", "Player 2") if ai is None else tuple("AI" if seat == ai_seat else "Player" for seat in (0, 1))
+        session = Session(engine.GameState(players), ai, ai_seat)
+        game = self.next_game
+        self.next_game += 1
+        self.games[game] = session
+        await self._play_ai(session)
+        return self._reply(game, session)
+
+    async def op_give(self, request):
+        session = self._session(request)
+        self._check_human(session, "give")
+        session.state.give(self._piece(self._field(request, "piece")))
+        await self._play_ai(session)
+        return self._reply(request["game"], session)
+
+    async def op_place(self, request):
+        session = self._session(request)
+        self._check_human(session, "place")
+        session.state.place(self._cell(self._field(request, "cell")))
+        return self._reply(request["game"], session)
+
+    async def op_state(self, request):
+        return self._reply(request["game"], self._session(request, busy_ok=True))
+
+    async def op_close(self, request):
+        game = self._game(request)
+        if self.games.pop(game, None) is None:
+            raise ValueError(f"No such game: {game}")
+        return {"ok": True}
+
+    async def op_stats(self, request):
+        return {"ok": True, "games": len(self.games), "requests": self.requests, "ai_moves": self.ai_moves,
+                "ai_seconds": self.ai_seconds, "uptime": time.perf_counter() - self.started}
+
+    def _check_human(self, session, action):
+        """Refuses moves that belong to the AI in AI games."""
+        if session.ai is None:
+            return
+        state = session.state
+        acting = state.turn if action == "place" else 1 - state.turn
+        if acting == session.ai_seat:
+            raise ValueError(f"It is the AI's turn to {action}.")
+
+    async def _play_ai(self, session):
+        """Lets the AI act for as long as it is its turn."""
+        state = session.state
+        if session.ai is None:
+            return
+        while not state.is_over:
+            if state.hand == NO_PIECE and 1 - state.turn == session.ai_seat:
+                state.give(engine.ai_select_token(state))  # Only happens for the first piece of the game
+            elif state.hand != NO_PIECE and state.turn == session.ai_seat:
+                session.busy = True
+                start = time.perf_counter()
+                try:
+                    loop = asyncio.get_running_loop()
+                    cell, give = await loop.run_in_executor(self.executor, _ai_move, session.ai, state.history, state.hand)
+                except BaseException:
+                    # Hand the piece back so the game isn't stuck on the AI's turn and the client can give again
+                    state.remaining |= 1 << state.hand
+                    state.hand = NO_PIECE
+                    raise
+                finally:
+                    session.busy = False
+                self.ai_moves += 1
+                self.ai_seconds += time.perf_counter() - start
+                state.place(cell)
+                if give != NO_PIECE:
+                    state.give(give)
+                session.last_ai = (cell, give)
+            else:
+                return
+
+    async def serve_connection(self, reader, writer):
+        """Answers requests from one client until it disconnects. Requests on a connection are answered in order."""
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    writer.write(b'{"ok": false, "error": "Request too long."}\n')
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("A request must be a JSON object.")
+                except ValueError as error:
+                    response = {"ok": False, "error": f"Bad request: {error}"}
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response, separators=(",", ":")).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, unix=None, workers=None, time_limit=None, max_nodes=None,
+                iterations=None, ready=None):
+    """
+    Runs the server until cancelled.
+
+    Parameters
+    ----------
+    unix : str
+        Listen on this Unix socket path instead of TCP.
+    ready : callable
+        Called with the asyncio server once it is listening.
+    """
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                initargs=(time_limit, max_nodes, iterations)) as executor:
+        game_server = GameServer(executor)
+        if unix:
+            server = await asyncio.start_unix_server(game_server.serve_connection, unix, limit=MAX_LINE)
+        else:
+            server = await asyncio.start_server(game_server.serve_connection, host, port, limit=MAX_LINE)
+        if ready:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host Quarto games over line-delimited JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", default=None, help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes for AI moves")
+    parser.add_argument("--time", type=float, default=engine.AI_TIME_LIMIT, help="AI search time per move in seconds")
+    parser.add_argument("--nodes", type=int, default=None, help="AI search node budget per move")
+    parser.add_argument("--iterations", type=int, default=None, help="MCTS iterations per move")
+    args = parser.parse_args()
+
+    def ready(server):
+        where = args.unix or ", ".join(f"{host}:{port}" for host, port, *_ in (sock.getsockname() for sock in server.sockets))
+        print(f"Serving Quarto on {where}")
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.time, args.nodes, args.iterations, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Symmetry canonicalization of Quarto positions.
+
+Two positions are equivalent when one can be turned into the other by
+- one of the 32 moves of the 4x4 grid that keep all 10 lines as lines
+  (rotations, reflections and the inside-out/middle swaps),
+- one of the 24 ways of renaming the four attributes,
+- flipping any of the attributes (16 complements).
+
+canonical_form() picks the smallest key over that whole group, so every member of
+an equivalence class gets the same key and caches can share their entries.
+A position is the board plus the piece in hand. The remaining pieces are whatever is
+neither on the board nor in hand, so they don't need to be part of the key.
+"""
+from functools import lru_cache
+from itertools import permutations, product
+
+from bitboard import ATTRIBUTES, CELLS, EMPTY, LINES, PIECES, SIZE, cell_index
+
+NO_PIECE = PIECES
+
+# Key layout from most to least significant: occupancy (16 bits), the piece in every
+# cell starting with cell 0 (4 bits each, 0 when empty) and the piece in hand (5 bits).
+HAND_BITS = 5
+KEY_CELL_SHIFT = tuple(HAND_BITS + ATTRIBUTES * (CELLS - 1 - cell) for cell in range(CELLS))
+KEY_OCCUPANCY_SHIFT = HAND_BITS + ATTRIBUTES * CELLS
+
+
+def _board_symmetries():
+    """Finds every row/column permutation (optionally transposed) that maps the set of lines onto itself."""
+    lines = set(LINES)
+    found = []
+    for transpose, rows, cols in product((False, True), permutations(range(SIZE)), permutations(range(SIZE))):
+        mapping = []
+        for cell in range(CELLS):
+            row, col = divmod(cell, SIZE)
+            if transpose:
+                row, col = col, row
+            mapping.append(cell_index(rows[row], cols[col]))
+        moved = set()
+        for line in LINES:
+            mask = 0
+            for cell in range(CELLS):
+                if line >> cell & 1:
+                    mask |= 1 << mapping[cell]
+            moved.add(mask)
+        if moved == lines and tuple(mapping) not in found:
+            found.append(tuple(mapping))
+    return tuple(found)
+
+
+# BOARD_SYMMETRIES[s][cell] is where the piece on `cell` ends up. The identity comes first.
+BOARD_SYMMETRIES = _board_symmetries()
+INVERSE_BOARD_SYMMETRIES = tuple(
+    tuple(symmetry.index(cell) for cell in range(CELLS)) for symmetry in BOARD_SYMMETRIES
+)
+
+
+def _permute_code(code, order):
+    result = 0
+    for new_attribute, old_attribute in enumerate(order):
+        if code >> old_attribute & 1:
+            result |= 1 << new_attribute
+    return result
+
+
+# ATTRIBUTE_PERMUTATIONS[p][code] is the piece code with its attribute bits reordered
+ATTRIBUTE_PERMUTATIONS = tuple(
+    tuple(_permute_code(code, order) for code in range(PIECES)) for order in permutations(range(ATTRIBUTES))
+)
+INVERSE_ATTRIBUTE_PERMUTATIONS = tuple(
+    tuple(permutation.index(code) for code in range(PIECES)) for permutation in ATTRIBUTE_PERMUTATIONS
+)
+
+
+@lru_cache(maxsize=1 << 16)
+def canonical_form(cells, hand):
+    """
+    Canonicalizes a position.
+
+    Parameters
+    ----------
+    cells : tuple
+        Piece code in each of the 16 cells, EMPTY for free cells (tuple(board.cells)).
+    hand : int
+        Code of the piece in hand, NO_PIECE if there is none.
+
+    Returns
+    -------
+    tuple
+        (key, transform). transform is (board symmetry, attribute permutation, complement mask)
+        and maps this position onto the canonical one, see transform_move.
+    """
+    # Occupancy is the most significant part of the key, so only the board
+    # symmetries that give the smallest occupancy mask can win.
+    best_occupancy = None
+    candidates = []
+    for index, symmetry in enumerate(BOARD_SYMMETRIES):
+        occupancy = 0
+        for cell, code in enumerate(cells):
+            if code != EMPTY:
+                occupancy |= 1 << symmetry[cell]
+        if best_occupancy is None or occupancy < best_occupancy:
+            best_occupancy = occupancy
+            candidates = [index]
+        elif occupancy == best_occupancy:
+            candidates.append(index)
+
+    best_key = None
+    best_transform = None
+    for index in candidates:
+        inverse = INVERSE_BOARD_SYMMETRIES[index]
+        # Pieces in the order of the transformed cells
+        placed = [(cell, cells[inverse[cell]]) for cell in range(CELLS) if cells[inverse[cell]] != EMPTY]
+        for permutation_index, permutation in enumerate(ATTRIBUTE_PERMUTATIONS):
+            # The first placed piece is the most significant one, so the best
+            # complement always turns it into piece 0.
+            if placed:
+                complement = permutation[placed[0][1]]
+            elif hand != NO_PIECE:
+                complement = permutation[hand]
+            else:
+                complement = 0
+            key = best_occupancy << KEY_OCCUPANCY_SHIFT
+            for cell, code in placed:
+                key |= (permutation[code] ^ complement) << KEY_CELL_SHIFT[cell]
+            key |= hand if hand == NO_PIECE else permutation[hand] ^ complement
+            if best_key is None or key < best_key:
+                best_key = key
+                best_transform = (index, permutation_index, complement)
+    return best_key, best_transform
+
+
+KEY_BYTES = (KEY_OCCUPANCY_SHIFT + CELLS + 7) // 8  # 85 bits, the size the stores write keys in
+
+
+def canonical_key(board, hand):
+    """Returns the canonical key of a board with a piece in hand."""
+    return canonical_form(tuple(board.cells), hand)[0]
+
+
+def decode_key(key):
+    """
+    Turns a canonical key back into a position.
+
+    Returns
+    -------
+    tuple
+        (cells, hand) with cells a list of 16 piece codes or EMPTY.
+    """
+    occupancy = key >> KEY_OCCUPANCY_SHIFT
+    cells = [EMPTY] * CELLS
+    for cell in range(CELLS):
+        if occupancy >> cell & 1:
+            cells[cell] = key >> KEY_CELL_SHIFT[cell] & (PIECES - 1)
+    return cells, key & ((1 << HAND_BITS) - 1)
+
+
+def transform_piece(transform, code):
+    """Maps a piece code into the canonical frame."""
+    if code == NO_PIECE:
+        return code
+    _, permutation_index, complement = transform
+    return ATTRIBUTE_PERMUTATIONS[permutation_index][code] ^ complement
+
+
+def untransform_piece(transform, code):
+    """Maps a piece code from the canonical frame back to the original position."""
+    if code == NO_PIECE:
+        return code
+    _, permutation_index, complement = transform
+    return INVERSE_ATTRIBUTE_PERMUTATIONS[permutation_index][code ^ complement]
+
+
+def transform_move(transform, cell, give):
+    """Maps a (cell, piece to give) move into the canonical frame."""
+    return BOARD_SYMMETRIES[transform[0]][cell], transform_piece(transform, give)
+
+
+def untransform_move(transform, cell, give):
+    """Maps a (cell, piece to give) move from the canonical frame back to the original position."""
+    return INVERSE_BOARD_SYMMETRIES[transform[0]][cell], untransform_piece(transform, give)
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Endgame tablebase: exact win/draw/loss results for positions with few empty cells.
+
+The generator solves positions offline and writes them to a binary file. The file
+is an open addressing hash table, so the AI can memory-map it and look up any
+position in O(1) without loading it.
+
+Every position with N empty cells can't be listed (there are around 10^10 of them
+even after symmetry), and random ones are almost never reached in play. So the
+generator plays seeded games of the search against itself, or reads recorded games,
+down to N + 1 empty cells. Every placement and safe give from there is a root with
+N empty cells: exactly the positions the search probes when it thinks about that
+position. Only safe gives count, so no root has a piece in hand that wins at once:
+the search finds those wins without a probe. The whole subtree below each root is
+solved, and every position the solver visits is stored under its symmetry canonical key.
+
+After writing, the generator plays self-play games with other seeds using the new
+table and reports how many of the search's probes it answered. That rate is low:
+with --empty 6, a 10-game table answered 10 of 1072 probes (1%) and a 100-game table
+(309k positions, 12 MB) 10 of 2083 (0.5%). Replaying the games a table was made from
+hits 99%. Positions with 6 empty cells are too many for samples of them to cover new
+games, so AIPlayer.from_files only loads the table when engine.AI_USE_TABLEBASE is set.
+
+Usage:
+    python tablebase.py --empty 6 --games 50 --output quarto_tablebase.bin
+    python tablebase.py --empty 6 --games 500 --records quarto_games.qgr
+"""
+import argparse
+import itertools
+import mmap
+import os
+import random
+import struct
+import time
+
+import bitboard
+import search
+import symmetry
+from symmetry import KEY_BYTES
+
+LOSS = -1
+DRAW = 0
+WIN = 1
+
+MAGIC = b"QTB1"
+HEADER = struct.Struct("<4sBB2xQQ")  # magic, version, max empty cells, slot count, position count
+VERSION = 1
+SLOT_BYTES = KEY_BYTES + 1  # Key plus one result byte, 0 marks an empty slot
+OPENING_PLIES = 4  # Random safe placements that start every generator game, so they don't all repeat one line
+GAME_NODES = 20000  # Search node budget per move in generator games
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+def _slot_index(key, mask):
+    mixed = ((key ^ (key >> 64) ^ (key >> 29)) * _HASH_MULTIPLIER) & _MASK64
+    return (mixed >> 24) & mask
+
+
+def solve(board, remaining, hand, results):
+    """
+    Solves a position exactly and records it and everything below it.
+
+    Parameters
+    ----------
+    board : bitboard.Board
+        Board before placing the piece in hand. Restored before returning.
+    remaining : int
+        16-bit mask of pieces not on the board and not in hand.
+    hand : int
+        Code of the piece that has to be placed.
+    results : dict
+        Canonical key -> WIN, DRAW or LOSS for the player holding the piece. Filled in as positions are solved.
+
+    Returns
+    -------
+    int
+        WIN, DRAW or LOSS.
+    """
+    key = symmetry.canonical_key(board, hand)
+    value = results.get(key)
+    if value is not None:
+        return value
+
+    if bitboard.winning_pieces(board) >> hand & 1:
+        value = WIN
+    else:
+        value = LOSS
+        for cell in board.empty_cells():
+            board.place(cell, hand)
+            if not remaining:
+                outcome = DRAW  # Board is full
+            else:
+                outcome = LOSS  # Stays a loss if every piece we could give wins for the opponent
+                safe = bitboard.safe_pieces(board, remaining)
+                for give in range(bitboard.PIECES):
+                    if safe >> give & 1:
+                        outcome = max(outcome, -solve(board, remaining & ~(1 << give), give, results))
+                        if outcome == WIN:
+                            break
+            board.remove(cell)
+            value = max(value, outcome)
+            if value == WIN:
+                break
+    results[key] = value
+    return value
+
+
+def _safe_moves(board, hand, remaining):
+    """(cell, give) moves after which the opponent can't win at once. Ends the game on a winning cell with give NO_PIECE."""
+    moves = []
+    for cell in board.empty_cells():
+        if bitboard.is_winning_placement(board, cell, hand):
+            return [(cell, search.NO_PIECE)]
+        board.place(cell, hand)
+        safe = bitboard.safe_pieces(board, remaining)
+        board.remove(cell)
+        moves.extend((cell, give) for give in range(bitboard.PIECES) if safe >> give & 1)
+    return moves
+
+
+def _game_position(rng, empty, players=None, stats=None):
+    """
+    Plays a game down to `empty` empty cells and returns its GameState, None if it ended first.
+    The first OPENING_PLIES placements are random safe moves so games differ, then the search
+    players (engine.AIPlayer) move if given, otherwise the random safe moves go on. The
+    SearchStats of their moves are appended to `stats` if given.
+    """
+    import engine  # Imports this module
+
+    state = engine.GameState(("player 1", "player 2"))
+    state.give(rng.randrange(bitboard.PIECES))
+    while len(state.board.empty_cells()) > empty:
+        if players is not None and len(state.history) >= OPENING_PLIES:
+            player = players[state.turn]
+            _, cell, give = player.choose_move(state)
+            if stats is not None:
+                stats.append(player.last_stats)
+        else:
+            moves = _safe_moves(state.board, state.hand, state.remaining)
+            cell, give = rng.choice(moves) if moves else (rng.choice(state.board.empty_cells()), search.NO_PIECE)
+        state.place(cell)
+        if state.is_over or not state.remaining:
+            return None
+        state.give(give if give != search.NO_PIECE else rng.choice(state.legal_gives()))
+    return state
+
+
+def _children(board, hand, remaining):
+    """
+    Yields every (board, hand) one placement and one safe give on: the positions a search of
+    this position probes first. Losing gives are left out, the search never plays them.
+    """
+    for cell, give in _safe_moves(board, hand, remaining):
+        if give == search.NO_PIECE:
+            return
+        child = board.copy()
+        child.place(cell, hand)
+        yield child, give
+
+
+def _selfplay_game(seed, index, empty, max_nodes, endgame=None, stats=None):
+    """Plays self-play game `index` of a seed down to `empty` empty cells, see _game_position."""
+    import engine
+
+    rng = random.Random(seed << 32 | index)
+    players = [engine.AIPlayer(time_limit=None, max_nodes=max_nodes, endgame=endgame, rng=rng) for _ in range(2)]
+    return _game_position(rng, empty, players, stats)
+
+
+def _selfplay_positions(seed, empty, max_nodes):
+    """Yields the GameState of seeded games of the search against itself once `empty` cells are left."""
+    for index in itertools.count():
+        state = _selfplay_game(seed, index, empty, max_nodes)
+        if state is not None:
+            yield state
+
+
+def _recorded_positions(path, empty):
+    """Yields the GameState of the games in a record file once `empty` cells are left."""
+    import records  # Imports engine, which imports this module
+
+    for history, _ in records.iter_games(path):
+        placed = bitboard.CELLS - empty
+        if len(history) <= placed:
+            continue  # The game ended earlier
+        state = records.replay(history[:placed])
+        state.give(history[placed][0])
+        yield state
+
+
+def generate(max_empty, games, seed=0, records_path=None, max_nodes=GAME_NODES):
+    """
+    Solves the subtrees below the roots with `max_empty` empty cells of `games` games.
+
+    The roots of a game are what a search probes when it looks at the game's position with one
+    more empty cell: every placement and safe give from it. The games are the ones in
+    records_path if given, otherwise seeded self-play games of the search with a max_nodes budget.
+
+    Returns
+    -------
+    tuple
+        (results, roots): canonical key -> WIN, DRAW or LOSS, and the number of roots solved.
+    """
+    if records_path:
+        positions = _recorded_positions(records_path, max_empty + 1)
+    else:
+        positions = _selfplay_positions(seed, max_empty + 1, max_nodes)
+    results = {}
+    roots = 0
+    for _, state in zip(range(games), positions):
+        for board, hand in _children(state.board, state.hand, state.remaining):
+            solve(board, search.remaining_mask(board, hand), hand, results)
+            roots += 1
+    return results, roots
+
+
+def probe_rate(path, games=10, max_nodes=GAME_NODES, seed=1):
+    """
+    Plays seeded self-play games of the search using the tablebase at `path`, with openings
+    like the generator's. With the seed the table was made with, these are the games it was
+    made from, so use another one to see how it does on new games.
+
+    Returns
+    -------
+    tuple
+        (probes, hits) summed over every search.
+    """
+    table = Tablebase(path)
+    stats = []
+    try:
+        for index in range(games):
+            _selfplay_game(seed, index, 0, max_nodes, table, stats)
+    finally:
+        table.close()
+    return sum(move.tablebase_probes for move in stats), sum(move.tablebase_hits for move in stats)
+
+
+def write(path, results, max_empty):
+    """Writes solved positions as a hash table with at most 50% load."""
+    slots = 1
+    while slots < 2 * max(len(results), 1):
+        slots <<= 1
+    mask = slots - 1
+    table = bytearray(slots * SLOT_BYTES)
+    for key, value in results.items():
+        index = _slot_index(key, mask)
+        while table[index * SLOT_BYTES + KEY_BYTES]:
+            index = (index + 1) & mask
+        offset = index * SLOT_BYTES
+        table[offset:offset + KEY_BYTES] = key.to_bytes(KEY_BYTES, "little")
+        table[offset + KEY_BYTES] = value + 2  # LOSS, DRAW, WIN -> 1, 2, 3
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, max_empty, slots, len(results)))
+        file.write(table)
+
+
+class Tablebase:
+    """
+    Read-only memory-mapped tablebase file.
+
+    Attributes:
+    max_empty : int
+        Positions with more empty cells than this are never in the table.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_empty, slots, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a tablebase file")
+        self._mask = slots - 1
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._map.close()
+
+    def probe_key(self, key):
+        """Returns WIN, DRAW or LOSS for a canonical key, or None if the position isn't stored."""
+        data = self._map
+        key_bytes = key.to_bytes(KEY_BYTES, "little")
+        index = _slot_index(key, self._mask)
+        while True:
+            offset = HEADER.size + index * SLOT_BYTES
+            value = data[offset + KEY_BYTES]
+            if not value:
+                return None
+            if data[offset:offset + KEY_BYTES] == key_bytes:
+                return value - 2
+            index = (index + 1) & self._mask
+
+    def probe(self, board, hand):
+        """Returns WIN, DRAW or LOSS for the player holding `hand`, or None if the position isn't stored."""
+        return self.probe_key(symmetry.canonical_key(board, hand))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the Quarto endgame tablebase.")
+    parser.add_argument("--empty", type=int, default=6, help="empty cells in the generated root positions")
+    parser.add_argument("--games", type=int, default=50, help="number of games to take root positions from")
+    parser.add_argument("--records", default=None, help="take the games from this record file instead of self-play")
+    parser.add_argument("--nodes", type=int, default=GAME_NODES, help="search node budget per move in self-play games")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="quarto_tablebase.bin")
+    parser.add_argument("--check-games", type=int, default=10, help="self-play games to measure the probe hit rate with")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results, roots = generate(args.empty, args.games, args.seed, args.records, args.nodes)
+    elapsed = time.perf_counter() - start
+    write(args.output, results, args.empty)
+    size = os.path.getsize(args.output)
+    print(f"Solved {len(results)} canonical positions below {roots} roots in {elapsed:.1f}s "
+          f"({len(results) / max(elapsed, 1e-9):.0f} positions/s)")
+    print(f"Wrote {args.output}: {size} bytes ({size / max(len(results), 1):.1f} bytes/position)")
+    if args.check_games:
+        probes, hits = probe_rate(args.output, args.check_games, args.nodes, args.seed + 1)
+        print(f"{args.check_games} self-play games: {hits}/{probes} tablebase probes hit ({hits / max(probes, 1):.1%})")
+
+
+if __name__ == "__main__":
+    main()
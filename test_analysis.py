@@ -0,0 +1,44 @@
+import threading
+
+import analysis
+import perft
+
+
+def test_values_can_be_read_while_analyzing():
+    # The Tk hint panel iterates the values on its own thread while analyze adds to them
+    state = perft.parse_position("SCB0")
+    analyzer = analysis.Analyzer(table_size=1 << 12)
+    reading = threading.Event()
+    second_stored = threading.Event()
+    calls = 0
+    search = analyzer.searcher.search
+
+    def paused_search(*args):
+        # Holds the analysis after the first value is stored until the reader is inside its loop
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            reading.wait(5)
+        elif calls == 3:
+            second_stored.set()
+        return search(*args)
+
+    analyzer.searcher.search = paused_search
+    stop = threading.Event()
+    entry = analyzer.lookup(state)
+    worker = threading.Thread(target=analyzer.analyze, args=(state, stop))
+    worker.start()
+    try:
+        while not entry.values:
+            worker.join(0.001)
+        seen = []
+        for choice, value in entry.values.items():
+            seen.append(choice)
+            reading.set()
+            assert second_stored.wait(5)
+        assert len(seen) == 1
+        assert entry.best() is not None
+    finally:
+        reading.set()
+        stop.set()
+        worker.join()
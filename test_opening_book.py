@@ -0,0 +1,42 @@
+import bitboard
+import opening_book
+import symmetry
+import test_symmetry
+
+
+def test_book_moves_look_up_on_any_equivalent_board(tmp_path):
+    records = opening_book.build(1, max_nodes=100)
+    path = tmp_path / "book.bin"
+    opening_book.write(path, records)
+    book = opening_book.OpeningBook(path)
+    try:
+        assert len(book) == len(records)
+        board = bitboard.Board()
+        board.place(5, 0)
+        hand = 9
+        score, cell, give = book.lookup(board, hand)
+        assert board.cells[cell] == bitboard.EMPTY and give not in (0, hand)
+        after = test_symmetry.key_after(board, hand, cell, give)
+        for transform in [(1, 0, 0), (7, 3, 0b0110), (31, 23, 0b1111)]:
+            moved, moved_hand = test_symmetry.transformed(board, hand, transform)
+            moved_score, moved_cell, moved_give = book.lookup(moved, moved_hand)
+            assert moved_score == score
+            assert test_symmetry.key_after(moved, moved_hand, moved_cell, moved_give) == after
+        board.place(10, hand)
+        assert book.lookup(board, 1) is None  # Two pieces placed, past the book
+    finally:
+        book.close()
+
+
+def test_lookup_misses_between_records(tmp_path):
+    keys = sorted(symmetry.canonical_key(*test_symmetry.random_position(3, seed)) for seed in range(3))
+    path = tmp_path / "book.bin"
+    opening_book.write(path, [(key, 0, 1, score) for score, key in enumerate(keys)])
+    book = opening_book.OpeningBook(path)
+    try:
+        for score, key in enumerate(keys):
+            assert book._find(key) == (0, 1, score)
+        assert book._find(keys[0] + 1) is None
+        assert book._find(keys[-1] + 1) is None
+    finally:
+        book.close()
@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+import bitboard
+import engine
+import perft
+
+
+def nearly_full(variant, seed=0):
+    """A game on `variant` with one empty cell left, nobody having won and a piece in hand that doesn't win."""
+    rng = random.Random(seed)
+    while True:
+        state = engine.GameState(variant=variant)
+        state.give(rng.choice(state.legal_gives()))
+        while len(state.board.empty_cells()) > 1:
+            cells = [cell for cell in state.board.empty_cells()
+                     if not bitboard.is_winning_placement(state.board, cell, state.hand)]
+            if not cells:
+                break
+            state.place(rng.choice(cells))
+            gives = [give for give in state.legal_gives() if not bitboard.winning_pieces(state.board) >> give & 1]
+            if not gives:
+                break
+            state.give(rng.choice(gives))
+        else:
+            return state
+
+
+@pytest.mark.parametrize("size, attributes", [(4, 4), (5, 5), (6, 6)])
+def test_last_placement_gives_nothing(size, attributes):
+    variant = bitboard.get_variant(size, attributes)
+    state = nearly_full(variant)
+    (cell,) = state.board.empty_cells()
+    assert perft.legal_moves(state) == [(cell, variant.no_piece)]
+    assert perft.perft(state, 1) == 1
+    assert perft.perft(state, 2) == 0
+
+
+def test_standard_counts():
+    state = engine.GameState()
+    assert perft.perft(state, 3) == 806400
@@ -0,0 +1,54 @@
+import bitboard
+import position_cache
+import symmetry
+import test_symmetry
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "positions.db")
+    board, hand = test_symmetry.random_position(4)
+    cell = board.empty_cells()[0]
+    give = next(code for code in range(bitboard.PIECES) if code != hand and code not in board.cells)
+    cache = position_cache.PositionCache(path, batch_size=1000)
+    cache.store(board, hand, 6, (12, cell, give), False)
+    assert cache.lookup(board, hand) == (6, (12, cell, give), False)  # Read from the buffer
+    cache.store(board, hand, 4, (-3, cell, give), False)  # Shallower, kept out
+    cache.close()
+
+    cache = position_cache.PositionCache(path)
+    try:
+        assert len(cache) == 1
+        assert cache.lookup(board, hand) == (6, (12, cell, give), False)
+        moved, moved_hand = test_symmetry.transformed(board, hand, (9, 14, 0b0011))
+        depth, (score, moved_cell, moved_give), proven = cache.lookup(moved, moved_hand)
+        assert (depth, score, proven) == (6, 12, False)
+        assert (test_symmetry.key_after(moved, moved_hand, moved_cell, moved_give)
+                == test_symmetry.key_after(board, hand, cell, give))
+        cache.store(board, hand, 2, (1000, cell, give), True)  # Proven beats deeper
+        assert cache.hits == 2 and cache.misses == 0
+    finally:
+        cache.close()
+    cache = position_cache.PositionCache(path)
+    try:
+        assert cache.lookup(board, hand) == (2, (1000, cell, give), True)
+    finally:
+        cache.close()
+
+
+def test_oldest_entries_are_evicted(tmp_path):
+    path = str(tmp_path / "positions.db")
+    cache = position_cache.PositionCache(path, max_positions=20, batch_size=4)
+    positions = [test_symmetry.random_position(6, seed) for seed in range(40)]
+    assert len({symmetry.canonical_key(*position) for position in positions}) == len(positions)
+    for board, hand in positions:
+        cache.store(board, hand, 1, (0, board.empty_cells()[0], symmetry.NO_PIECE), False)
+    cache.close()
+
+    cache = position_cache.PositionCache(path, max_positions=20)
+    try:
+        assert len(cache) <= 20
+        assert len(cache) == cache._connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+        assert cache.lookup(*positions[-1]) is not None
+        assert cache.lookup(*positions[0]) is None
+    finally:
+        cache.close()
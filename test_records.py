@@ -0,0 +1,53 @@
+import random
+
+import engine
+import records
+
+
+def random_game(seed):
+    """Plays random legal moves until the game ends or `seed` placements are made."""
+    rng = random.Random(seed)
+    state = engine.GameState()
+    for _ in range(seed):
+        state.give(rng.choice(state.legal_gives()))
+        state.place(rng.choice(state.board.empty_cells()))
+        if state.is_over:
+            break
+    return state
+
+
+def test_games_read_back_as_written(tmp_path):
+    path = tmp_path / "games.bin"
+    games = [random_game(seed) for seed in (3, 16, 0)]
+    with records.RecordWriter(path) as writer:
+        for state in games:
+            writer.append_game(state)
+    # A second writer appends after the games already there
+    with records.RecordWriter(path) as writer:
+        writer.append(games[0].history, records.UNFINISHED)
+
+    expected = [(state.history, records.game_result(state)) for state in games]
+    expected.append((games[0].history, records.UNFINISHED))
+    assert list(records.iter_games(path)) == expected
+    assert list(records.iter_games(path, start=2)) == expected[2:]
+    stored = records.GameRecords(path)
+    try:
+        assert len(stored) == len(expected)
+        assert list(stored) == expected
+        assert stored[-1] == expected[-1]
+        replayed = stored.replay(1)
+        assert replayed.history == games[1].history
+        assert replayed.winner == games[1].winner
+    finally:
+        stored.close()
+
+
+def test_partly_written_game_is_dropped(tmp_path):
+    path = tmp_path / "games.bin"
+    with records.RecordWriter(path) as writer:
+        writer.append_game(random_game(5))
+    with open(path, "ab") as file:
+        file.write(b"\x01\x02\x03")  # A writer that died mid-game
+    with records.RecordWriter(path) as writer:
+        writer.append_game(random_game(6))
+    assert [history for history, result in records.iter_games(path)] == [random_game(5).history, random_game(6).history]
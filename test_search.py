@@ -0,0 +1,31 @@
+import pytest
+
+import bitboard
+import perft
+import search
+import test_perft
+
+
+@pytest.mark.parametrize("cells", [[], [0], [0, 5], [16]])
+def test_search_refuses_root_cells_that_are_not_empty(cells):
+    state = perft.parse_position("SCB0 A1 LCRX")  # Cell 0 is taken
+    searcher = search.Searcher(max_depth=1)
+    with pytest.raises(ValueError):
+        searcher.search(state.board, state.remaining, state.hand, cells=cells)
+
+
+def test_search_places_only_on_root_cells():
+    state = perft.parse_position("SCB0 A1 LCRX")
+    searcher = search.Searcher(max_depth=2)
+    _, cell, _ = searcher.search(state.board, state.remaining, state.hand, cells=[5, 9])
+    assert cell in (5, 9)
+
+
+@pytest.mark.parametrize("size, attributes", [(4, 4), (5, 5), (6, 6)])
+def test_filling_the_board_gives_nothing(size, attributes):
+    variant = bitboard.get_variant(size, attributes)
+    state = test_perft.nearly_full(variant)
+    (cell,) = state.board.empty_cells()
+    score, placed, give = search.Searcher().search(state.board, state.remaining, state.hand)
+    assert (placed, give) == (cell, variant.no_piece)
+    assert score == 0 or bitboard.is_winning_placement(state.board, cell, state.hand)
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+import bitboard
+import symmetry
+
+
+def random_position(pieces, seed=0):
+    """A standard board with `pieces` placed at random and a piece in hand, ignoring wins."""
+    rng = random.Random(seed)
+    codes = rng.sample(range(bitboard.PIECES), pieces + 1)
+    board = bitboard.Board()
+    for cell, code in zip(rng.sample(range(bitboard.CELLS), pieces), codes):
+        board.place(cell, code)
+    return board, codes[-1]
+
+
+def transformed(board, hand, transform):
+    """The position `transform` = (board symmetry, attribute permutation, complement) turns this one into."""
+    moved = bitboard.Board()
+    for cell, code in enumerate(board.cells):
+        if code != bitboard.EMPTY:
+            moved.place(symmetry.BOARD_SYMMETRIES[transform[0]][cell], symmetry.transform_piece(transform, code))
+    return moved, symmetry.transform_piece(transform, hand)
+
+
+def key_after(board, hand, cell, give):
+    """Canonical key of the position after placing `hand` on `cell` and giving `give`."""
+    board.place(cell, hand)
+    try:
+        return symmetry.canonical_key(board, give)
+    finally:
+        board.remove(cell)
+
+
+@pytest.mark.parametrize("pieces", [0, 1, 5, 12])
+def test_equivalent_positions_share_a_key(pieces):
+    board, hand = random_position(pieces, seed=pieces)
+    key = symmetry.canonical_key(board, hand)
+    rng = random.Random(pieces)
+    for _ in range(50):
+        transform = (rng.randrange(len(symmetry.BOARD_SYMMETRIES)),
+                     rng.randrange(len(symmetry.ATTRIBUTE_PERMUTATIONS)), rng.randrange(bitboard.PIECES))
+        assert symmetry.canonical_key(*transformed(board, hand, transform)) == key
+
+
+def test_canonical_transform_gives_the_key():
+    board, hand = random_position(7)
+    key, transform = symmetry.canonical_form(tuple(board.cells), hand)
+    canonical, canonical_hand = transformed(board, hand, transform)
+    assert symmetry.decode_key(key) == (canonical.cells, canonical_hand)
+    for cell in board.empty_cells():
+        assert symmetry.untransform_move(transform, *symmetry.transform_move(transform, cell, hand)) == (cell, hand)
+
+
+def test_different_positions_have_different_keys():
+    board, hand = random_position(3)
+    keys = {symmetry.canonical_key(board, hand)}
+    for cell in board.empty_cells():
+        board.place(cell, hand)
+        keys.add(symmetry.canonical_key(board, symmetry.NO_PIECE))
+        board.remove(cell)
+    assert len(keys) > 2  # Some placements are equivalent, but not all of them
@@ -0,0 +1,30 @@
+import bitboard
+import search
+import tablebase
+import test_perft
+import test_symmetry
+
+
+def test_written_positions_probe_back(tmp_path):
+    state = test_perft.nearly_full(bitboard.STANDARD, seed=3)
+    board = state.board
+    # Take back the last few placements so there is something to solve
+    for give, cell in reversed(state.history[-4:]):
+        board.remove(cell)
+    hand = state.history[-4][0]
+    results = {}
+    value = tablebase.solve(board, search.remaining_mask(board, hand), hand, results)
+
+    path = tmp_path / "tablebase.bin"
+    tablebase.write(path, results, max_empty=len(board.empty_cells()))
+    table = tablebase.Tablebase(path)
+    try:
+        assert len(table) == len(results)
+        assert table.max_empty == len(board.empty_cells())
+        for key, stored in results.items():
+            assert table.probe_key(key) == stored
+        assert table.probe(board, hand) == value
+        assert table.probe(*test_symmetry.transformed(board, hand, (5, 7, 0b1010))) == value
+        assert table.probe(bitboard.Board(), 0) is None
+    finally:
+        table.close()
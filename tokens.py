@@ -1,15 +1,54 @@
 # -*- coding: utf-8 -*-
-import tkinter as tk
-import math
-from tkinter import ttk
-from tkinter import messagebox
-import random
+"""
+Tk front end for Quarto. The rules, game state and AI live in engine.py.
+"""
+import json
+import os
+import threading
+import time
+import analysis
+import bitboard
+import engine
+import mcts
+import records
+from search import NO_PIECE
+
+AI_ENGINES = ("Alpha-beta search", "Monte Carlo tree search", "Safe random")  # Choices on the name screen
+AI_POLL_MS = 100  # How often the window checks whether the AI has finished thinking
+AI_CANCEL_WAIT = 1.0  # Seconds to wait for a cancelled AI search to wind down
+AI_PONDER = True  # Let the AI search the human's possible moves while they think, see PonderJob
+
+# Board layout on the canvas. Squares are found from mouse coordinates with arithmetic, see isOnGrid
+BOARD_X = 100
+BOARD_Y = 100
+CELL_SIZE = 100
+GRID_SIZE = bitboard.SIZE
+TRAY_BUCKET = 100  # Side of the square buckets TokenIndex sorts the tray tokens into
+GAME_RECORD_PATH = "quarto_games.qgr"  # Finished games are appended here, see records.py
+AI_STATS_LOG_PATH = None  # Set to a file name to append the AI's search stats for every move as JSON lines
+SHOW_AI_STATS = False  # Start with the search stats overlay shown. F3 toggles it
+SHOW_ANALYSIS = False  # Start with the hint panel shown: a value for every square or token to choose. F2 toggles it
+ANALYSIS_POLL_MS = 200  # How often the hint panel picks up new values while the analysis runs
+ANALYSIS_COLORS = {"win": "green3", "draw": "orange", "loss": "red3", None: "gray55"}  # By analysis.outcome
+
+# tkinter is only imported when the window is launched (see main), so importing
+# this module doesn't need a display
+tk = None
+ttk = None
+messagebox = None
+
+canvas = None  # Game screen canvas, made by initialize_game
 
 class Token:
     """
    Represents a game token that can be placed on a board.
 
+   The token is only the on-screen sprite. What piece it is comes from the shared, immutable
+   bitboard.Piece it holds, and color, has_hole, size, shape and code are read from there.
+
    Attributes:
+   piece : bitboard.Piece
+       The interned piece this token shows.
    _x : int
        The x-coordinate of the top-left corner of the token.
    _y : int
@@ -26,6 +65,12 @@ class Token:
        The shape of the token, either "circle" or "square".
    centerCords : tuple
        The (x, y) coordinates of the center of the token.
+   items : tuple
+       Canvas item ids of the token's body, hole and outlines. Empty until drawToken draws it.
+   highlight_item : int
+       Canvas id of the yellow hover outline, hidden unless the mouse is over the token.
+   select_item : int
+       Canvas id of the green outline shown while the token is the piece to place.
 
    Methods:
    getX()
@@ -66,21 +111,20 @@ class Token:
         """
         self._x = x
         self._y = y
-        self.color = color
-        self.has_hole = has_hole
-        self.shape = shape
         
         if size == "small":
-            self.size = size
             self.diameter = 70
         elif size == "large":
-            self.size = size
             self.diameter = 45
         else:
             raise ValueError("Size must be 'small' or 'large'.")
+        self.piece = bitboard.piece_from_attributes(size, shape, color, has_hole)
 
         
         self._updateCenterCords()
+        self.items = ()
+        self.highlight_item = None
+        self.select_item = None
 
     # Players
     current_player = None 
@@ -93,6 +137,27 @@ class Token:
     
     is_ai_opponent = False # Flag to signal whether AI is turned off or on
     
+    @property
+    def color(self):
+        return self.piece.color
+
+    @property
+    def has_hole(self):
+        return self.piece.has_hole
+
+    @property
+    def size(self):
+        return self.piece.size
+
+    @property
+    def shape(self):
+        return self.piece.shape
+
+    @property
+    def code(self):
+        """4-bit attribute code used by the bitboard"""
+        return self.piece.code
+
     def getX(self):
         return self._x
     
@@ -123,16 +188,17 @@ class Token:
         self.centerCords = (self._x + self.diameter // 2, self._y + self.diameter // 2)
 
     def get_id(self):
-        """ Get unique id for each token for when we keep track of score"""
-        size_code = 'S' if self.size == 'large' else 'L' # I don't know why i have to put s for large but that's what works for the code
-        color_code = self.color[0].upper()  # First letter of the color 
-        shape_code = self.shape[0].upper()  # First letter of the shape
-        hole_code = '0' if self.has_hole else 'X'  # 0 for hole, X for no hole
-        return f"{size_code}{shape_code}{color_code}{hole_code}"   
+        """ Get unique id for each token for when we keep track of score. Precomputed on the piece"""
+        return self.piece.id
+
+    def get_code(self):
+        """ Get the 4-bit attribute code of the token. Bit order matches the id letters: size, shape, color, hole"""
+        return self.code
 
 def drawToken(canvas, token, gridCoords=None, square=None):
     """
     Draws a token on the canvas. If a grid square is specified, it will place the token in that square. Allows for both initial placement of tokens, and for drawing them on board.
+    The items are only created the first time. After that the token's existing items are moved, so the canvas doesn't fill up with dead items.
     
     Parameters
     ----------
@@ -150,6 +216,8 @@ def drawToken(canvas, token, gridCoords=None, square=None):
     None
     """
     
+    oldX, oldY = token.getCords()
+
     # Use grid square if placing piece on board
     if gridCoords and square:
         if square in gridCoords:
@@ -161,25 +229,33 @@ def drawToken(canvas, token, gridCoords=None, square=None):
             print(f"Invalid square: {square}")
             return
 
+    # Already on the canvas, slide its items over to the new spot
+    if token.items:
+        for item in token.items:
+            canvas.move(item, token.getX() - oldX, token.getY() - oldY)
+        return
+
     # Draw the token's shape
     if token.shape == "circle":
-        canvas.create_oval(token.getX(), token.getY(), token.getX() + token.diameter, token.getY() + token.diameter, fill=token.color)
-        if token.has_hole: #Decided to hollow out shape using white fill.
-            hole_diameter = token.diameter // 2
-            holeX = token.getX() + (token.diameter - hole_diameter) // 2
-            holeY = token.getY() + (token.diameter - hole_diameter) // 2
-            canvas.create_oval(holeX, holeY, holeX + hole_diameter, holeY + hole_diameter, fill="white")
-            
+        create_shape = canvas.create_oval
     elif token.shape == "square":
-        canvas.create_rectangle(
-            token.getX(), token.getY(), token.getX() + token.diameter, token.getY() + token.diameter, fill=token.color)
-        if token.has_hole:
-            hole_diameter = token.diameter // 2
-            holeX = token.getX() + (token.diameter - hole_diameter) // 2
-            holeY = token.getY() + (token.diameter - hole_diameter) // 2
-            canvas.create_rectangle(holeX, holeY, holeX + hole_diameter, holeY + hole_diameter, fill="white")
+        create_shape = canvas.create_rectangle
     else:
         print(f"Invalid shape: {token.shape}")
+        return
+
+    x0, y0, x1, y1 = token.getX(), token.getY(), token.getX() + token.diameter, token.getY() + token.diameter
+    items = [create_shape(x0, y0, x1, y1, fill=token.color)]
+    if token.has_hole: #Decided to hollow out shape using white fill.
+        hole_diameter = token.diameter // 2
+        holeX = token.getX() + (token.diameter - hole_diameter) // 2
+        holeY = token.getY() + (token.diameter - hole_diameter) // 2
+        items.append(create_shape(holeX, holeY, holeX + hole_diameter, holeY + hole_diameter, fill="white"))
+
+    # Outlines are made once, hidden, and shown with itemconfigure when needed
+    token.highlight_item = create_shape(x0, y0, x1, y1, outline="yellow", width=3, state="hidden", tags="token-highlight")
+    token.select_item = create_shape(x0, y0, x1, y1, outline="green", width=5, state="hidden", tags="select")
+    token.items = tuple(items) + (token.highlight_item, token.select_item)
 
 def drawBoard(canvas):
     """
@@ -193,16 +269,16 @@ def drawBoard(canvas):
     None.
     """
     #sizing the board
-    board_x = 100
-    board_y = 100
-    cell = 100
-    grid = 4
+    board_x = BOARD_X
+    board_y = BOARD_Y
+    cell = CELL_SIZE
+    grid = GRID_SIZE
 
     # Create dictionary for each square
     center_coords = {}
 
     # Each square has a column and row
-    columns = ['A', 'B', 'C', 'D']
+    columns = bitboard.COLUMN_LABELS
     for row in range(grid):
         for col in range(grid):
             # Calculate the center coords of the current square
@@ -230,175 +306,209 @@ def isOnToken(mouseX, mouseY, unplacedTokenList):
         
     #Checks to see if mouse is inside any token
     for token in unplacedTokenList:
-        centerX, centerY = token.centerCords
-        tokenRadius = token.diameter // 2
-        #Calculate the distance from token center to mouse
-        distance = math.sqrt((mouseX - centerX) ** 2 + (mouseY - centerY) ** 2)
-        #If the calculated distance is smaller than the radius of the token, the mouse must be inside the token.
-        if distance <= tokenRadius:
+        if isInsideToken(mouseX, mouseY, token):
             return token
     
     return None
-    
-def isOnGrid(mouseX, mouseY, gridCoords):
-    """Helper Function. Will be used for place token to make sure mouse is over a grid slot"""
-    for label, (topLeftX, topLeftY) in gridCoords.items():
-        slot_size = 100  # Assuming each grid slot is 100x100
-        #checks mouse position accoriding to the grid
-        if (topLeftX <= mouseX <= topLeftX + slot_size and
-            topLeftY <= mouseY <= topLeftY + slot_size):
-            return label
-    return None
 
-def highlightBoth(event):
-    highlightToken(event)
-    highlightGrid(event)
+def isInsideToken(mouseX, mouseY, token):
+    """True if the mouse is within the token's radius of its center. Compares squared distances, no square root needed."""
+    centerX, centerY = token.centerCords
+    tokenRadius = token.diameter // 2
+    return (mouseX - centerX) ** 2 + (mouseY - centerY) ** 2 <= tokenRadius * tokenRadius
 
-def highlightGrid(event):
+class TokenIndex:
     """
-    Highlights a grid square when hovered over.
+    Spatial hash of the tokens in the tray, so hit testing doesn't scan every token.
+
+    Each token is listed in every TRAY_BUCKET sized bucket its bounding box touches. A lookup
+    only tests the one or two tokens in the bucket under the mouse.
+
+    Attributes:
+    buckets : dict
+        (column, row) bucket -> list of tokens overlapping it, in tray order.
     """
+
+    def __init__(self, tokens, bucket_size=TRAY_BUCKET):
+        self.bucket_size = bucket_size
+        self.buckets = {}
+        for token in tokens:
+            self.add(token)
+
+    def _keys(self, token):
+        size = self.bucket_size
+        x, y = token.getCords()
+        return [(column, row)
+                for column in range(x // size, (x + token.diameter) // size + 1)
+                for row in range(y // size, (y + token.diameter) // size + 1)]
+
+    def add(self, token):
+        for key in self._keys(token):
+            self.buckets.setdefault(key, []).append(token)
+
+    def remove(self, token):
+        """Takes a token out of the index. Call before the token is moved off the tray."""
+        for key in self._keys(token):
+            self.buckets[key].remove(token)
+
+    def find(self, mouseX, mouseY):
+        """Returns the token under the mouse or None. Same answer as isOnToken."""
+        for token in self.buckets.get((mouseX // self.bucket_size, mouseY // self.bucket_size), ()):
+            if isInsideToken(mouseX, mouseY, token):
+                return token
+        return None
     
-    
-    #Get the mouse coordinates
-    mouseX = event.x
-    mouseY = event.y
-    
-    token = isOnToken(mouseX, mouseY, unplacedTokenList)
-    if token:
-        return  # Skip grid highlighting if hovering over a token
+def isOnGrid(mouseX, mouseY, gridCoords):
+    """Helper Function. Will be used for place token to make sure mouse is over a grid slot. Works the square out from the board layout instead of searching."""
+    column = (mouseX - BOARD_X) // CELL_SIZE
+    row = (mouseY - BOARD_Y) // CELL_SIZE
+    if not (0 <= column < GRID_SIZE and 0 <= row < GRID_SIZE):
+        return None
+    label = bitboard.label_from_cell(bitboard.cell_index(row, column))
+    return label if label in gridCoords else None
 
-    #Check if the mouse is over a grid square
-    grid_label = isOnGrid(mouseX, mouseY, dict_coords)
+hover_target = None  # Token or grid label under the mouse the last time highlightBoth ran
 
-    #Remove the previous highlight
-    canvas.delete("grid-highlight")
+def highlightBoth(event):
+    """Motion handler. Works out what is under the mouse once, and only touches the canvas when that changes."""
+    global hover_target
+    token = token_index.find(event.x, event.y)
+    target = token or isOnGrid(event.x, event.y, dict_coords)
+    if target == hover_target: # Most motion events stay over the same thing
+        return
+    hover_target = target
+    highlightToken(token)
+    highlightGrid(None if token else target)
+
+def resetHover():
+    """Forgets the hover target so the next motion event redraws the highlights"""
+    global hover_target
+    hover_target = None
 
+def highlightGrid(grid_label):
+    """
+    Highlights a grid square when hovered over. Hides the highlight if grid_label is None.
+    """
     if grid_label:
         #Get the top-left corner of the grid square
         topLeftX, topLeftY = dict_coords[grid_label]
 
-        #Highlight the square
-        slot_size = 100  #Assuming each grid slot is 100x100
-        canvas.create_rectangle(topLeftX, topLeftY, topLeftX + slot_size, topLeftY + slot_size,outline="yellow", width=3, tags="grid-highlight")
+        #Move the highlight over the square
+        canvas.coords("grid-highlight", topLeftX, topLeftY, topLeftX + CELL_SIZE, topLeftY + CELL_SIZE)
+        canvas.itemconfigure("grid-highlight", state="normal")
+    else:
+        canvas.itemconfigure("grid-highlight", state="hidden")
 
     
-def highlightToken(event):
-    """Highlights a token when it is hovered over"""
-    mouseX = event.x
-    mouseY =  event.y
-    token = isOnToken(mouseX, mouseY, unplacedTokenList)
-    canvas.delete("token-highlight") #Deletes the highlight if mouse no longer inside token.
+def highlightToken(token):
+    """Highlights a token when it is hovered over. Hides the highlight if token is None."""
+    canvas.itemconfigure("token-highlight", state="hidden") #Hides the highlight if mouse no longer inside token.
     if token: #If token detected, highlight it.
         canvas.config(cursor="hand2")
-        if token.shape == "circle":
-            canvas.create_oval(token.getX(), token.getY(), token.getX() + token.diameter, token.getY() + token.diameter, outline="yellow", width=3, tags="token-highlight")
-        else:
-            canvas.create_rectangle(token.getX(), token.getY(), token.getX() + token.diameter, token.getY() + token.diameter, outline="yellow", width=3, tags="token-highlight")
+        canvas.itemconfigure(token.highlight_item, state="normal")
     else:
         canvas.config(cursor="arrow")
         
 def selectToken(event):
     """selects a token when clicked"""
-    global selected_token, selected_piece, current_player, p1, p2, piece_selected_for_placement #a global variable that stores the selected token
+    global selected_token, selected_piece #a global variable that stores the selected token
     mouseX = event.x
     mouseY =  event.y
-    token = isOnToken(mouseX, mouseY, unplacedTokenList)
+    token = token_index.find(mouseX, mouseY)
 
     # If piece has already been chosen, skip
-    if piece_selected_for_placement:
+    if game.hand != NO_PIECE or game.is_over:
         return
 
-    # Only allow token selection if it's the current player's turn to select
-    if token and token not in placed_board_pieces:
+    if token: #if the token is detected then it will be selecteed
+        game.give(token.code)
+        if ponder_job is not None:
+            ponder_job.give = token.code  # Only this reply is left to ponder
         selected_piece = token  # Set the selected piece
-        piece_selected_for_placement = True
-        canvas.delete("select") # Remove old select
-
-        if token: #if the token is detected then it will be selecteed
-            selected_token = token
-            canvas.delete("select") #removes the prev. selection
-            if token.shape == "circle":
-                canvas.create_oval(token.getX(), token.getY(), token.getX() + token.diameter, token.getY() + token.diameter, outline="green", width=5, tags="select")
-            else:
-                canvas.create_rectangle(token.getX(), token.getY(), token.getX() + token.diameter, token.getY() + token.diameter, outline="green", width=5, tags="select")
+        selected_token = token
+        showSelection(token)
 
         # Update the status bar
-        update_status_bar_message(f"{current_player}, place the selected piece on the board.")
+        update_status_bar_message(f"{game.current_player}, place the selected piece on the board.")
+        refresh_analysis()
+
+        # The AI places the piece it was given, then picks one for the human
+        if is_ai_opponent and game.current_player == "AI":
+            root.after(1000, handle_ai_turn)  # Delay for 1 second to make it feel natural
+
+def showSelection(token):
+    """Shows the green outline of the piece to place and hides any previous one"""
+    canvas.itemconfigure("select", state="hidden")
+    canvas.itemconfigure(token.select_item, state="normal")
 
 def placeToken(event):
     """places the token in an unsused slot on the grid"""
-    global selected_token, current_player, p1, p2, selected_piece, piece_selected_for_placement
-    if not selected_piece: #if a token is not selected then leave
-        return
-
     # if no piece to place just skip
-    if not selected_piece or not piece_selected_for_placement:
+    if game.hand == NO_PIECE:
+        return
+    
+    # The AI places its own pieces
+    if is_ai_opponent and game.current_player == "AI":
         return
     
     mouseX = event.x
     mouseY =  event.y
     grid = isOnGrid(mouseX, mouseY, dict_coords)
-    if grid and grid not in placed_board_pieces: #if a grid is found and it is not occupied then place the valid token
+    if grid and game.board.is_empty(bitboard.cell_from_label(grid)): #if a grid is found and it is not occupied then place the valid token
         print(f"Clicked at: ({mouseX}, {mouseY}), Grid: {grid}") #debugging
-        print(f"{selected_piece.get_id()} placed at {grid}") # debugging
-        row, col = int(grid[1]) - 1, ord(grid[0]) - ord('A')
-        board[row][col] = selected_piece.get_id()  # Update the board with tokens id. ID looks is a string with each of the following representing size(L,S), shape(C,S), color(B,R), hole(0,X)
-        deleteToken(canvas, selected_piece)
-        drawToken(canvas, selected_piece, dict_coords, grid)
-        placed_board_pieces.append(grid)
-        unplacedTokenList.remove(selected_piece)
-        selected_piece = None #resets selected token
-        piece_selected_for_placement = False
-        canvas.delete("select")#removes the tokens highlight
-
-        # Switch turns
-        current_player = p2 if current_player == p1 else p1
-        # Update the status bar
-        update_status_bar_message(f"{p2 if current_player == p1 else p1}, select a token for {current_player} to place.")
-        
-        #If there is an AI opponent and it is player 1s turn, have ai select token for player 1
-        if is_ai_opponent and current_player != "AI":
-            root.after(1000, handle_ai_turn)  # Delay for 1 second to make it feel natural
+        place_selected_piece(grid)
+
+def place_selected_piece(grid):
+    """Places the selected piece on a free grid square, checks for a win and switches turns. Returns True if the game ended."""
+    global selected_piece
+    print(f"{selected_piece.get_id()} placed at {grid}") # debugging
+    player = game.current_player
+    cell = bitboard.cell_from_label(grid)
+    win = game.place(cell)  # The engine updates the board and passes the turn
+    if ponder_job is not None:
+        ponder_job.cell = cell  # Stop pondering the squares the human didn't take
+    token_index.remove(selected_piece)
+    drawToken(canvas, selected_piece, dict_coords, grid)  # Moves the token's items onto the square
+    unplacedTokenList.remove(selected_piece)
+    selected_piece = None #resets selected token
+    canvas.itemconfigure("select", state="hidden")#hides the tokens highlight
+    canvas.itemconfigure("token-highlight", state="hidden")
+    resetHover()
+    refresh_analysis()
+
+    if game.is_over:
+        stop_pondering()
+        record_game()
+
+    if win:
+        line, attribute = win
+        update_status_bar_message(f"Quarto! {player} completed {bitboard.LINE_NAMES[line]} with the same {bitboard.CHARACTERISTICS[attribute]}.")
+        congratulations(player)
+        return True
+    if game.is_over:
+        update_status_bar_message("The board is full. It's a draw!")
+        game_drawn()
+        return True
+
+    # Update the status bar
+    update_status_bar_message(f"{game.selecting_player}, select a token for {game.current_player} to place.")
+    return False
+
+game_log = None  # records.RecordWriter opened by main
+
+def record_game():
+    """Appends the finished game to the record file"""
+    if game_log is not None:
+        game_log.append_game(game)
+        game_log.flush()  # Human games are few and far between, don't lose one to a crash
 
 def deleteToken(canvas, token):
-    """Deletes a token from canvas by drawing over it """
-    if token.shape == "circle":
-        canvas.create_oval(
-            token.getX(), token.getY(), token.getX() + token.diameter, token.getY() + token.diameter, fill="white", outline="white"
-        )
-    elif token.shape == "square":
-        canvas.create_rectangle(
-            token.getX(), token.getY(), token.getX() + token.diameter, token.getY() + token.diameter, fill="white", outline="white"
-        )
-    else:
-        print(f"Invalid shape: {token.shape}")
-        
-def check_row(board, row, characteristic):
-    #Id string letter options. size(L,S), shape(C,S), color(B,R), hole(0,X) ie. LCB0 -> Large, Circle, Blue, Hole
-    for token_id in board[row]: #Make sure entire row contains tokens.
-        if token_id == None:
-            return False
-    
-    if characteristic == "size":
-        letter_index = 0
-    elif characteristic == "shape":
-        letter_index = 1 
-    elif characteristic == "color":
-        letter_index = 2
-    elif characteristic == "hole":
-        letter_index = 3
-    else:
-        raise ValueError(f"Must insert valid characteristic for check_row. Options are: size, shape, color, hole. You entered: {characteristic} ")
-    
-    letter_to_check = board[row][0][letter_index]
-    
-    # Check each token in the row
-    for token_id in board[row]:
-        if token_id[letter_index] != letter_to_check:
-            return False
-    
-    return True #Returns True if every specific letter from token id matches. Can target different id letters by changing the index.
+    """Deletes a token's items from the canvas. drawToken will create them again if it is drawn later"""
+    for item in token.items:
+        canvas.delete(item)
+    token.items = ()
+    token.highlight_item = None
+    token.select_item = None
         
 def check_board_button_function():
     # Get dropdown win
@@ -438,197 +548,401 @@ def check_board_button_function():
         return
 
     # Check for a win
+    board = game.board
+    current_player = game.current_player
     if row_col_info[1] == "row":
-        if check_row(board, row_col_info[0], characteristic):
+        if engine.check_row(board, row_col_info[0], characteristic):
             print(f"Win detected in {row_col_selection} with {win_condition}!")
             congratulations(current_player)
     elif row_col_info[1] == "column":
-        if check_column(board, row_col_info[0], characteristic):
+        if engine.check_column(board, row_col_info[0], characteristic):
             print(f"Win detected in {row_col_selection} with {win_condition}!")
             congratulations(current_player)
     elif row_col_info[1] == "diagonal":
-        if check_diagonal(board, row_col_info[0], characteristic):
+        if engine.check_diagonal(board, row_col_info[0], characteristic):
             print(f"Win detected in {row_col_selection} with {win_condition}!")
             congratulations(current_player)
             
 def congratulations(player):
     """message box will appear and will congratulate user and ask to play again"""
-    response = messagebox.askyesno("Quarto!", "Congratulations! You won!\n\nPlay again?")
+    response = messagebox.askyesno("Quarto!", f"Congratulations {player}! You won!\n\nPlay again?")
     if response:  # yes
         show_name_screen()  #reset the game
     else:  #no
         root.destroy() #exit game
-    
-def check_column(board, column, characteristic):
-    #Id string letter options. size(L,S), shape(C,S), color(B,R), hole(0,X) ie. LCB0 -> Large, Circle, Blue, Hole
-    for row in range(4): #Make sure entire column contains tokens
-        if (board[row][column]) == None:
-            return False
-    if characteristic == "size":
-        letter_index = 0
-    elif characteristic == "shape":
-        letter_index = 1 
-    elif characteristic == "color":
-        letter_index = 2
-    elif characteristic == "hole":
-        letter_index = 3
-    else:
-        raise ValueError(f"Must insert valid characteristic for check_row. Options are: size, shape, color, hole. You entered: {characteristic} ")
-    
-    letter_to_check = board[0][column][letter_index]
-    for row in range(4): 
-        if board[row][column][letter_index] != letter_to_check:
-            return False
-    return True
-    
-def check_column_button_function():
-    print(check_column(board, 0, "color"))
-    
-def check_diagonal(board, diagonal, characteristic):
-    """
-    it will check a diagonal win from top left to bottom right
-    or top right to bottom left
-    """
 
-    if characteristic == "size":
-        letter_index = 0
-    elif characteristic == "shape":
-        letter_index = 1 
-    elif characteristic == "color":
-        letter_index = 2
-    elif characteristic == "hole":
-        letter_index = 3
-    else:
-        raise ValueError(f"Must insert valid characteristic for check_row. Options are: size, shape, color, hole. You entered: {characteristic} ")
-    
-    if diagonal == "first_diagonal": #top left to bottom right
-        position = [(i,i) for i in range(4)]
-    if diagonal == "second_diagonal":
-        position = [(i,3-i) for i in range(4)] #top right to bottom left
-
-    for row, column in position: #Make sure entire column contains tokens
-        if board[row][column] == None:
-            return False
-        
-    letter_to_check = board[position[0][0]][position[0][1]][letter_index]
-    for row, column in position:  # Iterate over the diagonal and check for consistency
-        if board[row][column][letter_index] != letter_to_check:
-            return False
-    return True
-
-def check_win(board, characteristic):
-    """ Check a win for a specific characteristic in one way """
-    # Check all rows for a win
-    for row in range(4):
-        if check_row(board, row, characteristic):
-            print(f"Win found row {row}, {characteristic}")
-            return True
-    
-    # Check all columns for a win
-    for col in range(4):
-        if check_column(board, col, characteristic):
-            print(f"Win found column {col}, {characteristic}")
-            return True
-    
-    # Check the first diagonal
-    if check_diagonal(board, "first_diagonal", characteristic):
-        print(f"Win found first diagonal,{characteristic}")
-        return True
-    
-    # Check the second diagonal
-    if check_diagonal(board, "second_diagonal", characteristic):
-        print(f"Win found second diagonal,{characteristic}")
-        return True
+def game_drawn():
+    """message box will appear when the board fills up without a winner and ask to play again"""
+    response = messagebox.askyesno("Quarto!", "The board is full. It's a draw!\n\nPlay again?")
+    if response:  # yes
+        show_name_screen()  #reset the game
+    else:  #no
+        root.destroy() #exit game
     
-    # If no win found, return False
-    return False
-
-def check_win_in_any_position(board):
-    """ Checks if a player has won based on any of the four characteristics: size, shape, color, or hole. """
-    characteristics = ["size", "shape", "color", "hole"]
+def check_column_button_function():
+    print(engine.check_column(game.board, 0, "color"))
     
-    # Loop through each characteristic
-    for characteristic in characteristics:
-        if check_win(board, characteristic):
-            return True
-
-    # Return False if no win is found for any characteristic
-    return False
-
 def check_board_state():
-    for row in board:
-        print(row)
+    engine.check_board_state(game.board)
         
 def ai_select_token():
     """AI selects a token for the human player to place. Returns a token that is to be placed"""
-    global unplacedTokenList, board
-    
-    #Try's to avoid selecting a piece that lets the human win immediately
-    safe_tokens = []
-    for token in unplacedTokenList:
-        #Try placing a token in each slot and see what happens
-        winning_piece = False
-        for row in range(4):
-            for col in range(4):
-                if board[row][col] is None:
-                    #Temporarily place the token
-                    board[row][col] = token.get_id()
-                    if check_win_in_any_position(board):
-                        winning_piece = True
-                    board[row][col] = None  #Undo the placed token
-                    if winning_piece:
-                        break
-            if winning_piece:
-                break
-        if not winning_piece:
-            safe_tokens.append(token)
-    
-    #If there are safe tokens, pick one. Otherwise, pick a random token
-    if safe_tokens:
-        print("picking a safe token from following list...")
-        for token in safe_tokens:
-            print(f"{token.get_id()}")
-        return random.choice(safe_tokens)
-    print("No safe tokens left. Randomly picking from available token list...")
-    return random.choice(unplacedTokenList)
+    token = tokens_by_code[engine.ai_select_token(game)]
+    print(f"AI picked {token.get_id()}")
+    return token
         
-def ai_place_token(token):
+def ai_place_token(token, move=None):
     '''Places the selected token provided by player 1 on the board in the best possible position
     Parameters: 
         token: token to be placed on board
+        move: (score, cell, give) already worked out by an AIMoveJob. Searched here if None
+    Returns:
+        The token the search wants to hand to the human next, or None if the game ended.
     '''
-    pass
+    score, cell, give = move or ai_player.choose_move(game)
+    stats = getattr(ai_player, "last_stats", None)
+    if stats is None:
+        print(f"AI places {token.get_id()} at {bitboard.label_from_cell(cell)} (score {score})")
+    elif stats.source == "book":
+        print(f"AI places {token.get_id()} at {bitboard.label_from_cell(cell)} (opening book, score {score})")
+    elif stats.source == "cache":
+        print(f"AI places {token.get_id()} at {bitboard.label_from_cell(cell)} (position cache, score {score}, depth {stats.depth})")
+    else:
+        print(f"AI places {token.get_id()} at {bitboard.label_from_cell(cell)} (score {score}, depth {stats.depth}, {stats.nodes} nodes)")
+    record_ai_stats(stats, token, cell, give)
+
+    if place_selected_piece(bitboard.label_from_cell(cell)):
+        return None
+    if give == NO_PIECE: # Some engines only pick the piece after placing
+        give = ai_player.choose_give(game)
+    return tokens_by_code[give]
+
+ai_stats = None  # search.SearchStats of the AI's last move, None for engines that don't keep any
+
+def record_ai_stats(stats, token, cell, give):
+    """Keeps the stats of the move the AI just made, logs them if AI_STATS_LOG_PATH is set and updates the overlay"""
+    global ai_stats
+    ai_stats = stats
+    if stats is not None and AI_STATS_LOG_PATH:
+        entry = {"time": time.time(), "engine": type(ai_player).__name__, "ply": len(game.history) + 1,
+                 "piece": token.get_id(), "cell": bitboard.label_from_cell(cell),
+                 "give": None if give == NO_PIECE else bitboard.id_from_code(give)}
+        entry.update(stats.as_dict())
+        with open(AI_STATS_LOG_PATH, "a") as file:
+            file.write(json.dumps(entry) + "\n")
+    update_stats_overlay()
+
+def stats_overlay_text():
+    if ai_stats is None:
+        return "AI stats: no move yet"
+    stats = ai_stats
+    return (f"AI stats ({stats.source}): score {stats.score}, depth {stats.depth}, {stats.nodes} nodes in {stats.seconds:.2f}s "
+            f"({stats.nodes_per_second:,.0f}/s)\n"
+            f"cutoffs {stats.cutoffs}, table hits {stats.table_hits}/{stats.table_probes} ({stats.table_hit_rate:.0%}), "
+            f"tablebase hits {stats.tablebase_hits}/{stats.tablebase_probes} ({stats.tablebase_hit_rate:.0%})")
+
+def update_stats_overlay():
+    """Refreshes the debug overlay text. The item is made once by initialize_game"""
+    canvas.itemconfigure("ai-stats", text=stats_overlay_text())
+
+def toggle_stats_overlay(event=None):
+    """Shows or hides the search stats overlay (F3)"""
+    global SHOW_AI_STATS
+    SHOW_AI_STATS = not SHOW_AI_STATS
+    if canvas is not None and canvas.winfo_exists():
+        canvas.itemconfigure("ai-stats", state="normal" if SHOW_AI_STATS else "hidden")
+
+def make_ai_player(engine_name):
+    """Returns the AI for an engine from AI_ENGINES. Each one is made once and kept for the session."""
+    if engine_name not in ai_players:
+        if engine_name == "Monte Carlo tree search":
+            ai_players[engine_name] = mcts.MCTSPlayer(time_limit=engine.AI_TIME_LIMIT, workers=os.cpu_count())
+        elif engine_name == "Safe random":
+            ai_players[engine_name] = engine.SafePlayer()
+        else:
+            ai_players[engine_name] = engine.AIPlayer.from_files()
+    return ai_players[engine_name]
+
+class AIMoveJob:
+    """
+    Runs ai_player.choose_move on a worker thread so the window keeps responding while the AI thinks.
+
+    The worker searches a copy of the game, so the Tk thread never shares state with it. The search
+    deepens iteratively until its time budget runs out, and stops early when the job is cancelled.
+
+    Attributes:
+    state : engine.GameState
+        Copy of the game being searched.
+    stop : threading.Event
+        Set to cancel the search.
+    result : tuple
+        (score, cell, give) once the search is done. None if it was cancelled or failed.
+    started : float
+        time.perf_counter() when the search started.
+    """
+
+    def __init__(self, player, state):
+        self.player = player
+        self.state = state
+        self.stop = threading.Event()
+        self.result = None
+        self.error = None
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="quarto-ai", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.result = self.player.choose_move(self.state, self.stop)
+        except Exception as error: # Reported on the Tk thread by poll_ai_move
+            self.error = error
+
+    def done(self):
+        return not self._thread.is_alive()
+
+    def cancel(self, timeout=AI_CANCEL_WAIT):
+        """Asks the search to stop and waits up to `timeout` seconds for the worker to exit."""
+        self.stop.set()
+        self._thread.join(timeout)
+
+class PonderJob(AIMoveJob):
+    """
+    Runs ai_player.ponder on a worker thread while the human places the piece the AI gave them and
+    picks one for the AI. The AI's reply then starts from what it found, see AIPlayer.choose_move.
+
+    Attributes:
+    cell : int
+        Cell the human placed on, None until they have.
+    give : int
+        Code of the piece the human gave the AI, None until they have.
+    """
+
+    def __init__(self, player, state):
+        self.cell = None
+        self.give = None
+        super().__init__(player, state)
+
+    def _run(self):
+        try:
+            self.player.ponder(self.state, self.stop, self.expects)
+        except Exception as error: # Pondering is optional, the AI just searches from scratch
+            self.error = error
+
+    def expects(self, cell, give):
+        """Whether the human can still leave the AI this placement and piece. Called from the worker."""
+        return (self.cell is None or cell == self.cell) and (self.give is None or give == self.give)
+
+class AnalysisJob(AIMoveJob):
+    """
+    Runs analyzer.analyze on a worker thread for the hint panel. Values land in the analyzer's
+    per-position cache as they are found, and poll_analysis draws them from there.
+
+    Attributes:
+    entry : analysis.PositionAnalysis
+        Cached analysis of the position the job works on.
+    """
+
+    def __init__(self, player, state):
+        self.entry = player.lookup(state)
+        super().__init__(player, state)
+
+    def _run(self):
+        try:
+            self.player.analyze(self.state, self.stop)
+        except Exception as error: # Reported by stop_analysis
+            self.error = error
+
+ai_job = None  # AIMoveJob for the move the AI is thinking about, None when it isn't
+ponder_job = None  # PonderJob while the AI thinks on the human's time, None when it isn't
+
+def cancel_ai_move():
+    """Stops the AI from thinking about a move, e.g. when the game is reset or the window closes."""
+    global ai_job
+    stop_pondering()
+    stop_analysis()
+    if ai_job is not None:
+        ai_job.cancel()
+        ai_job = None
+
+def start_pondering():
+    """Lets the AI search the human's replies until its next turn. Only the search engine ponders."""
+    global ponder_job
+    stop_pondering()
+    if AI_PONDER and is_ai_opponent and not game.is_over and hasattr(ai_player, "ponder"):
+        ponder_job = PonderJob(ai_player, game.copy())
+
+def stop_pondering():
+    """Stops pondering. The AI's own search must not start before this, they share a transposition table."""
+    global ponder_job
+    if ponder_job is not None:
+        ponder_job.cancel()
+        if ponder_job.error is not None:
+            print(f"AI pondering failed: {ponder_job.error!r}")
+        ponder_job = None
+
+analyzer = None  # analysis.Analyzer behind the hint panel, made the first time the panel is shown
+analysis_job = None  # AnalysisJob for the position on the board while the panel is shown
+analysis_items = {}  # ("cell", cell) or ("piece", code) -> (outline, label) items of the hint panel, plus "summary"
+analysis_shown = None  # (entry, version) the panel last drew, so polling only touches the canvas for new values
+
+def wants_analysis():
+    """True if the hint panel is on and the choice in front of the board is a human's to make"""
+    if not SHOW_ANALYSIS or game.is_over:
+        return False
+    chooser = game.current_player if game.hand != NO_PIECE else game.selecting_player
+    return not (is_ai_opponent and chooser == "AI")
+
+def refresh_analysis():
+    """
+    Called whenever the game changes. Cancels the analysis of the old position and starts on the new
+    one, showing whatever is already cached for it straight away. Hides the panel when it has nothing to show.
+    """
+    global analyzer, analysis_job
+    stop_analysis()
+    if not wants_analysis():
+        hide_analysis()
+        return
+    if analyzer is None:
+        analyzer = analysis.Analyzer()
+    analysis_job = AnalysisJob(analyzer, game.copy())
+    draw_analysis(analysis_job.entry)
+    root.after(ANALYSIS_POLL_MS, poll_analysis, analysis_job)
+
+def stop_analysis():
+    """Stops analyzing. What was found stays in the analyzer's cache"""
+    global analysis_job
+    if analysis_job is not None:
+        analysis_job.cancel()
+        if analysis_job.error is not None:
+            print(f"Analysis failed: {analysis_job.error!r}")
+        analysis_job = None
+
+def poll_analysis(job):
+    """Redraws the hint panel from the Tk event loop while its job runs"""
+    if job is not analysis_job: # The board has changed since
+        return
+    draw_analysis(job.entry)
+    if not job.done():
+        root.after(ANALYSIS_POLL_MS, poll_analysis, job)
+
+def drawAnalysisItems(canvas):
+    """Creates the hidden hint panel items: an outline and a label for every square and every tray token, and a summary line"""
+    items = {}
+    for label, (x, y) in dict_coords.items():
+        outline = canvas.create_rectangle(x + 6, y + 6, x + CELL_SIZE - 6, y + CELL_SIZE - 6, width=4, state="hidden", tags="analysis")
+        text = canvas.create_text(x + 10, y + 8, anchor="nw", font=("Arial", 12, "bold"), state="hidden", tags="analysis")
+        items["cell", bitboard.cell_from_label(label)] = (outline, text)
+    for token in unplacedTokenList:
+        x, y = token.getCords()
+        create_shape = canvas.create_oval if token.shape == "circle" else canvas.create_rectangle
+        outline = create_shape(x - 6, y - 6, x + token.diameter + 6, y + token.diameter + 6, width=3, state="hidden", tags="analysis")
+        text = canvas.create_text(token.centerCords[0], y + token.diameter + 8, anchor="n", font=("Arial", 11, "bold"), state="hidden", tags="analysis")
+        items["piece", token.code] = (outline, text)
+    items["summary"] = canvas.create_text(BOARD_X, BOARD_Y + GRID_SIZE * CELL_SIZE + 10, anchor="nw", font=("Courier", 11),
+                                          state="hidden", tags="analysis")
+    return items
+
+def analysis_summary(entry):
+    best = entry.best()
+    if best is None:
+        return "Analysis: searching..."
+    choice, value = best
+    name = f"give {bitboard.id_from_code(choice)}" if entry.giving else f"place on {bitboard.label_from_cell(choice)}"
+    progress = "done" if entry.complete else f"depth {entry.depth}"
+    return (f"Analysis ({progress}, {entry.nodes:,} nodes): best is {name} ({analysis.describe(value)})\n"
+            f"Wn/Ln: win/loss n placements from now, D: draw, dn: unresolved n moves deep")
+
+def draw_analysis(entry):
+    """Colors every square or token to choose from by its value. Only touches the canvas when there are new values"""
+    global analysis_shown
+    if analysis_shown == (entry, entry.version):
+        return
+    analysis_shown = (entry, entry.version)
+    canvas.itemconfigure("analysis", state="hidden")
+    kind = "piece" if entry.giving else "cell"
+    for choice, value in entry.values.items():
+        outline, text = analysis_items[kind, choice]
+        color = ANALYSIS_COLORS[analysis.outcome(value)]
+        canvas.itemconfigure(outline, outline=color, state="normal")
+        canvas.itemconfigure(text, text=analysis.describe(value), fill=color, state="normal")
+    canvas.itemconfigure(analysis_items["summary"], text=analysis_summary(entry), state="normal")
+
+def hide_analysis():
+    global analysis_shown
+    analysis_shown = None
+    canvas.itemconfigure("analysis", state="hidden")
+
+def toggle_analysis(event=None):
+    """Shows or hides the hint panel (F2)"""
+    global SHOW_ANALYSIS
+    SHOW_ANALYSIS = not SHOW_ANALYSIS
+    if canvas is not None and canvas.winfo_exists():
+        refresh_analysis()
+
+def thinking_message(job):
+    """Status bar text while the AI thinks, with animated dots and search progress when there is any."""
+    elapsed = time.perf_counter() - job.started
+    dots = "." * (int(elapsed * 1000 / AI_POLL_MS / 3) % 3 + 1)
+    message = f"AI is thinking{dots:<3} {elapsed:.1f}s"
+    searcher = getattr(job.player, "searcher", None)
+    if searcher is not None and searcher.nodes:
+        message += f" (depth {searcher.depth_reached}, {searcher.nodes} nodes)"
+    return message
+
+def poll_ai_move(job):
+    """Checks on the AI search from the Tk event loop. Applies the move once it is ready."""
+    global ai_job
+    if job is not ai_job: # Cancelled, or a new game has started since
+        return
+    if not job.done():
+        update_status_bar_message(thinking_message(job))
+        root.after(AI_POLL_MS, poll_ai_move, job)
+        return
+    ai_job = None
+    if job.error is not None:
+        print(f"AI search failed: {job.error!r}")
+        update_status_bar_message("The AI could not find a move.")
+        return
+    if job.result is None:
+        return
+    next_piece = ai_place_token(selected_piece, job.result)
+    if next_piece is not None: # None when the game is over
+        ai_give_token(next_piece)
 
 def handle_ai_turn():
-    '''Handles the ais turn. Selects a token for the human and places a token provided by the human. '''
-    global selected_piece, piece_selected_for_placement, current_player, p1, p2
+    '''Handles the ais turn. Places the token provided by the human, then selects a token for the human. '''
+    global ai_job
+
+    if game.current_player == "AI" and game.hand != NO_PIECE:
+        # Search in the background. poll_ai_move places the piece and gives one back when it's done
+        cancel_ai_move()  # Also stops pondering
+        ai_job = AIMoveJob(ai_player, game.copy())
+        update_status_bar_message(thinking_message(ai_job))
+        root.after(AI_POLL_MS, poll_ai_move, ai_job)
+        return
+    ai_give_token()
 
-    # Have AI select token for human
-    selected_piece = ai_select_token()
-    piece_selected_for_placement = True
+def ai_give_token(next_piece=None):
+    '''Gives the human a piece to place and highlights it. Uses the searches choice if there is one'''
+    global selected_piece
+
+    selected_piece = next_piece or ai_select_token()
+    game.give(selected_piece.code)
 
     # Update status bar
-    update_status_bar_message(f"{current_player}, place the selected piece on the board.")
+    update_status_bar_message(f"{game.current_player}, place the selected piece on the board.")
 
     # Highlight the selected token on the canvas
-    canvas.delete("select")  # Remove old selection
-    if selected_piece.shape == "circle":
-        canvas.create_oval(selected_piece.getX(), selected_piece.getY(), 
-                           selected_piece.getX() + selected_piece.diameter, 
-                           selected_piece.getY() + selected_piece.diameter, 
-                           outline="green", width=5, tags="select")
-    else:
-        canvas.create_rectangle(selected_piece.getX(), selected_piece.getY(), 
-                                selected_piece.getX() + selected_piece.diameter, 
-                                selected_piece.getY() + selected_piece.diameter, 
-                                outline="green", width=5, tags="select")
+    showSelection(selected_piece)
+    refresh_analysis()
 
-    # Switch turns
-    current_player = p2 if current_player == p1 else p1
+    start_pondering()  # Think about the human's replies while they do
     
         
 def show_name_screen():
     """ Displays a screen for players to enter their names on the root window. """
+    cancel_ai_move()  # Don't let a search from the last game place a piece in the next one
+
     #Clear the root window
     for widget in root.winfo_children():
         widget.destroy()
@@ -642,18 +956,24 @@ def show_name_screen():
     tk.Label(root, text="Player 2 Name:", font=("Arial", 18)).pack(pady=5)
     player2_entry = tk.Entry(root, font=("Arial", 18))
     player2_entry.pack(pady=5)
+
+    tk.Label(root, text="AI Engine (Player 2 named AI):", font=("Arial", 18)).pack(pady=5)
+    engine_combobox = ttk.Combobox(root, values=AI_ENGINES, state="readonly", font=("Arial", 18))
+    engine_combobox.set(AI_ENGINES[0])
+    engine_combobox.pack(pady=5)
     
 
     #Function runs when start_game button is clicked. Keep indented one more than parent function.
     def start_game():
         """ Start the game with entered player names. Toggles AI if player 2s name is ai """
-        global is_ai_opponent
+        global is_ai_opponent, ai_player
         player1 = player1_entry.get().strip() or "Player 1"
         player2 = player2_entry.get().strip() or "Player 2"
         
-        if player2.upper() == "AI":
+        is_ai_opponent = player2.upper() == "AI"
+        if is_ai_opponent:
             player2 = "AI"
-            is_ai_opponent = True
+            ai_player = make_ai_player(engine_combobox.get())
             
 
         # Clear the root window and initialize the game
@@ -671,13 +991,12 @@ def update_status_bar_message(message):
     
 def initialize_game(player1, player2):
     """ Initializes the game board with the given player names."""
-    global canvas, placed_board_pieces, board, unplacedTokenList, dict_coords, status_bar, current_player, p1, p2, piece_selected_for_placement, win_combobox, row_combobox
+    global canvas, game, unplacedTokenList, tokens_by_code, token_index, selected_piece, dict_coords, status_bar, win_combobox, row_combobox, ai_stats, analysis_items, analysis_shown
 
     # initialize a bunch of stuff
-    p1 = player1
-    p2 = player2
-    current_player = player1
-    piece_selected_for_placement = False
+    game = engine.GameState((player1, player2))  # Board, pieces and turns. Player 1 places first
+    selected_piece = None
+    ai_stats = None
 
     print(f"Starting game with {player1} and {player2}.")
     tk.Label(root, text=f"Quarto: {player1} vs {player2}", font=("Arial", 20)).pack(pady=10)
@@ -685,15 +1004,6 @@ def initialize_game(player1, player2):
     canvas = tk.Canvas(root, width=1000, height=600, bg="white")
     canvas.pack()
 
-    placed_board_pieces = []  # List of objects that have been placed on the board
-
-    board = []  # Represents the board. Starts out as None for all items.
-    for _ in range(4):
-        row = []
-        for _ in range(4):
-            row.append(None)
-        board.append(row)
-
     # Get squares
     dict_coords = drawBoard(canvas)
 
@@ -716,10 +1026,25 @@ def initialize_game(player1, player2):
         Token(850, 400, "red", True, "large", "square"),
     ]
 
+    tokens_by_code = {token.code: token for token in unplacedTokenList}
+    token_index = TokenIndex(unplacedTokenList)
+    resetHover()
+
     #Initially draw tokens on screen
     for token in unplacedTokenList:
         drawToken(canvas, token)
 
+    #Hint panel outlines and labels, under the hover highlight. See refresh_analysis
+    analysis_items = drawAnalysisItems(canvas)
+    analysis_shown = None
+
+    #Grid hover highlight. Created once on top of everything and moved around by highlightGrid
+    canvas.create_rectangle(0, 0, 0, 0, outline="yellow", width=3, state="hidden", tags="grid-highlight")
+
+    #Search stats overlay under the tray, see toggle_stats_overlay
+    canvas.create_text(550, 510, anchor="nw", font=("Courier", 11), text=stats_overlay_text(),
+                       state="normal" if SHOW_AI_STATS else "hidden", tags="ai-stats")
+
     #Create a Frame for aligning the button and win conditions in the same row
     controls_frame = tk.Frame(root)
     controls_frame.pack(pady=10)
@@ -753,7 +1078,7 @@ def initialize_game(player1, player2):
     row_combobox.grid(row=1, column=2, padx=10)
 
     #Status bar
-    status_bar = tk.Label(root, text=f"{p2}, select a token for {p1} to place.", bd=1, relief=tk.SUNKEN, anchor=tk.W, font=("Arial", 18))
+    status_bar = tk.Label(root, text=f"{game.selecting_player}, select a token for {game.current_player} to place.", bd=1, relief=tk.SUNKEN, anchor=tk.W, font=("Arial", 18))
     status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
     canvas.bind("<Motion>", highlightBoth)  # Highlight on mouse movement
@@ -762,14 +1087,34 @@ def initialize_game(player1, player2):
     
     handle_ai_turn() #See ai token selection when game first starts. Should be a better way to do this
 def exit_fullscreen(event=None):
+    cancel_ai_move()
     root.destroy()  # Close the application
 
 
-if __name__ == "__main__":
+ai_players = {}  # AI per engine name, see make_ai_player
+
+def main():
+    """Launches the game window."""
+    global tk, ttk, messagebox, root, ai_player, game_log
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+
+    game_log = records.RecordWriter(GAME_RECORD_PATH)
+    ai_player = make_ai_player(AI_ENGINES[0])  # Also picks the first piece in games without an AI
     root = tk.Tk()
     root.title("Quarto Game")
     root.attributes("-fullscreen", True)  # Enable full-screen mode
     show_name_screen()  # Display the name entry screen
     root.bind("<Escape>", exit_fullscreen)
+    root.bind("<F2>", toggle_analysis)
+    root.bind("<F3>", toggle_stats_overlay)
     root.mainloop()
-    
+    cancel_ai_move()
+    game_log.close()
+    for player in ai_players.values():
+        if hasattr(player, "close"):
+            player.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+AI vs AI self-play tournaments across all cores.
+
+Every game gets its own seeded random generator, so a run can be repeated
+exactly when the search uses a node budget instead of a time limit. The two
+entrants swap sides every game so neither always places first.
+
+With --cache the search players share a position cache file (see position_cache.py),
+so each worker reuses what the others and earlier runs searched. Results then depend
+on what is in the file, so runs are only repeatable without it.
+
+Usage:
+    python tournament.py --games 1000 --player1 search --player2 safe --nodes 20000
+    python tournament.py --games 1000 --player1 search --player2 mcts --cache quarto_positions.db
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import time
+
+import bitboard
+import engine
+import mcts
+import records
+
+PLAYER_TYPES = ("search", "search-eval", "mcts", "safe", "random")
+
+
+def make_player(kind, time_limit=None, max_nodes=None, iterations=None, cache_path=None):
+    if kind == "search":
+        return engine.AIPlayer.from_files(cache_path=cache_path, time_limit=time_limit, max_nodes=max_nodes)
+    if kind == "search-eval":  # Search with the learned evaluator at its horizon, see evaluator.py
+        return engine.AIPlayer.from_files(evaluator_path=engine.AI_EVALUATOR_PATH, cache_path=cache_path,
+                                          time_limit=time_limit, max_nodes=max_nodes)
+    if kind == "mcts":
+        # Tournament games already use every core, so each MCTS player grows a single tree
+        return mcts.MCTSPlayer(time_limit=time_limit, iterations=iterations)
+    if kind == "safe":
+        return engine.SafePlayer()
+    if kind == "random":
+        return engine.RandomPlayer()
+    raise ValueError(f"Player must be one of {PLAYER_TYPES}. You entered: {kind}")
+
+
+def play_game(players, rng, variant=bitboard.STANDARD):
+    """
+    Plays one game between two player objects, on a bitboard.Variant if given. Search players
+    need symmetry_plies=0 and no book or tablebase to play anything but the standard game.
+
+    Returns
+    -------
+    engine.GameState
+        The finished game.
+    """
+    for player in players:
+        player.rng = rng
+        if hasattr(player, "searcher"):
+            player.searcher.table.clear()  # Results must not depend on which games a worker played before
+    state = engine.GameState(("player 1", "player 2"), variant)
+    state.give(players[1].choose_give(state))  # Player 2 gives the first piece
+    while True:
+        player = players[state.turn]
+        _, cell, give = player.choose_move(state)
+        state.place(cell)
+        if state.is_over:
+            return state
+        if give == variant.no_piece:
+            give = player.choose_give(state)
+        state.give(give)
+
+
+_worker_players = None
+
+
+def _init_worker(kinds, time_limit, max_nodes, iterations, cache_path):
+    # Players live for the whole worker process so book and tablebase files are opened once
+    global _worker_players
+    _worker_players = [make_player(kind, time_limit, max_nodes, iterations, cache_path) for kind in kinds]
+
+
+def _run_game(job):
+    """Plays game `index`. Entrants swap sides on odd games. Returns (index, winning entrant or None, plies, seconds, history)."""
+    index, seed = job
+    order = (0, 1) if index % 2 == 0 else (1, 0)
+    start = time.perf_counter()
+    state = play_game([_worker_players[entrant] for entrant in order], random.Random(seed << 32 | index))
+    for player in _worker_players:
+        if getattr(player, "cache", None) is not None:
+            player.cache.flush()  # The pool terminates its workers without closing anything
+    winner = None if state.winner is None else order[state.winner]
+    return index, winner, len(state.history), time.perf_counter() - start, state.history
+
+
+def run_tournament(kinds, games, seed=0, workers=None, time_limit=None, max_nodes=None, iterations=None, on_result=None,
+                   cache_path=None):
+    """
+    Plays `games` games between two player kinds on a process pool.
+
+    Parameters
+    ----------
+    cache_path : str
+        Position cache file the search players share. None to play without one.
+    on_result : callable
+        Called with (index, winner, plies, seconds, history) as each game finishes.
+
+    Returns
+    -------
+    dict
+        Win counts per entrant, draws, total games and games per second.
+    """
+    wins = [0, 0]
+    draws = 0
+    start = time.perf_counter()
+    jobs = [(index, seed) for index in range(games)]
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(kinds, time_limit, max_nodes, iterations, cache_path)) as pool:
+        for result in pool.imap_unordered(_run_game, jobs):
+            winner = result[1]
+            if winner is None:
+                draws += 1
+            else:
+                wins[winner] += 1
+            if on_result:
+                on_result(result)
+    elapsed = time.perf_counter() - start
+    return {"wins": wins, "draws": draws, "games": games, "seconds": elapsed, "games_per_second": games / max(elapsed, 1e-9)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Quarto AI tournaments.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--player1", choices=PLAYER_TYPES, default="search")
+    parser.add_argument("--player2", choices=PLAYER_TYPES, default="safe")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--time", type=float, default=None, help="search time per move in seconds")
+    parser.add_argument("--nodes", type=int, default=20000, help="search node budget per move")
+    parser.add_argument("--iterations", type=int, default=2000, help="MCTS iterations per move")
+    parser.add_argument("--verbose", action="store_true", help="print every game as it finishes")
+    parser.add_argument("--record", default=None, help="append the games to this record file")
+    parser.add_argument("--cache", default=None, help="position cache file the search players share, ie. quarto_positions.db")
+    args = parser.parse_args()
+
+    kinds = (args.player1, args.player2)
+    names = list(kinds) if kinds[0] != kinds[1] else [f"{kinds[0]} (1)", f"{kinds[1]} (2)"]
+    finished = 0
+    writer = records.RecordWriter(args.record) if args.record else None
+
+    def on_result(result):
+        nonlocal finished
+        finished += 1
+        index, winner, plies, seconds, history = result
+        if writer:
+            writer.append_game(records.replay(history))  # Games arrive in completion order, not index order
+        if args.verbose:
+            outcome = "draw" if winner is None else f"{names[winner]} won"
+            print(f"game {index}: {outcome} after {plies} plies ({seconds:.2f}s)")
+        else:
+            print(f"\r{finished}/{args.games} games", end="", flush=True)
+
+    summary = run_tournament(kinds, args.games, args.seed, args.workers, args.time, args.nodes, args.iterations, on_result,
+                             args.cache)
+    if writer:
+        writer.close()
+    if not args.verbose:
+        print()
+    games = summary["games"]
+    for name, wins in zip(names, summary["wins"]):
+        print(f"{name}: {wins} wins ({100 * wins / games:.1f}%)")
+    print(f"draws: {summary['draws']} ({100 * summary['draws'] / games:.1f}%)")
+    print(f"{games} games in {summary['seconds']:.1f}s ({summary['games_per_second']:.2f} games/s)")
+
+
+if __name__ == "__main__":
+    main()